@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.core.mail import send_mail
+from django.db import transaction
 from django.utils.crypto import get_random_string
 from django.contrib.auth import get_user_model, password_validation
 from google.oauth2 import id_token
@@ -10,6 +10,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from utils.mail import queue_mail
 from .models import UserOTP
 from .serializers import (
     RegisterSerializer,
@@ -75,29 +76,22 @@ class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-
-            otp_code = get_random_string(length=6, allowed_chars='0123456789')
-            UserOTP.objects.create(user=user, otp=otp_code, otp_type='email_verification')
-
-            subject = "Your OTP Code"
-            message = (
-                f"Hello {user.username},\n\n"
-                f"Your OTP code is: {otp_code}\n\n"
-                "Please enter this code to verify your email and activate your account.\n\n"
-                "Thank you!"
-            )
-            from_email = settings.DEFAULT_FROM_EMAIL
-            recipient_list = [user.email]
-
-            try:
-                send_mail(subject, message, from_email, recipient_list, fail_silently=False)
-            except Exception as e:
-                user.delete()  # Cleanup user
-                return Response(
-                    {"error": f"Failed to send OTP email: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            # The OTP email is queued with the user, so it is sent (and retried)
+            # once the account exists and SMTP problems cannot lose the signup
+            with transaction.atomic():
+                user = serializer.save()
+
+                otp_code = get_random_string(length=6, allowed_chars='0123456789')
+                UserOTP.objects.create(user=user, otp=otp_code, otp_type='email_verification')
+
+                subject = "Your OTP Code"
+                message = (
+                    f"Hello {user.username},\n\n"
+                    f"Your OTP code is: {otp_code}\n\n"
+                    "Please enter this code to verify your email and activate your account.\n\n"
+                    "Thank you!"
                 )
+                queue_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
 
             return Response(
                 {"message": "Registration successful. OTP sent to your email."},
@@ -218,10 +212,7 @@ class PasswordResetRequestView(APIView):
                 f"Your password reset OTP is: {otp}\nIt expires in 10 minutes.\n\n"
                 f"If you didn't request this, please ignore this email."
             )
-            try:
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=False)
-            except Exception as e:
-                return Response({"error": f"Failed to send email: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            queue_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
 
             return Response({"message": "If that email is registered, an OTP has been sent."})
 
@@ -120,6 +120,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Production settings, not just for tests: take the write lock when
+        # a transaction starts (instead of on its first write) so concurrent
+        # checkouts queue up for up to `timeout` seconds rather than failing
+        # with "database is locked". Read-only requests outside atomic()
+        # blocks run in autocommit mode and are not affected.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than the in-memory default, so that tests can open
+        # several connections at once (payments.tests checkout races);
+        # git-ignored
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# ---------------------------
+# 🗄 Cache
+# ---------------------------
+# Local memory by default; point CACHE_BACKEND at
+# django.core.cache.backends.filebased.FileBasedCache (LOCATION = a directory)
+# or django.core.cache.backends.redis.RedisCache (LOCATION = redis://...)
+# to share cached responses between workers. Version bumps that invalidate
+# the destination trees (destinations.caching) only reach other workers
+# through a shared cache; with locmem those trees expire after a minute.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
     }
 }
 
@@ -143,6 +174,12 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
+# Mail is queued in the utils.OutboundEmail outbox. With autoflush on, a
+# background thread sends it after each request and re-arms itself for
+# retries; turn it off when running `manage.py send_queued_mail --loop` as a
+# separate worker. Either way, schedule `send_queued_mail` (e.g. every
+# minute) so mail left behind by a stopped process is still sent.
+EMAIL_OUTBOX_AUTOFLUSH = config('EMAIL_OUTBOX_AUTOFLUSH', default=True, cast=bool)
 
 # ---------------------------
 # 💰 Payment API Keys
@@ -151,15 +188,44 @@ STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 PAYPAL_CLIENT_ID = config('PAYPAL_CLIENT_ID')
 PAYPAL_SECRET = config('PAYPAL_SECRET')
 
+# ---------------------------
+# 🎟 Booking Seat Holds
+# ---------------------------
+# Pending bookings hold their seats this long; unpaid holds are released by
+# `manage.py release_expired_holds`.
+BOOKING_HOLD_MINUTES = config('BOOKING_HOLD_MINUTES', default=30, cast=int)
+
+# ---------------------------
+# 📍 Location Tracking
+# ---------------------------
+# `manage.py compact_booking_locations` rolls GPS points older than
+# COMPACT_AFTER_DAYS into compressed daily segments and deletes tracks older
+# than RETENTION_DAYS.
+BOOKING_LOCATION_COMPACT_AFTER_DAYS = config('BOOKING_LOCATION_COMPACT_AFTER_DAYS', default=7, cast=int)
+BOOKING_LOCATION_RETENTION_DAYS = config('BOOKING_LOCATION_RETENTION_DAYS', default=365, cast=int)
+# Fan-out for the live location stream; the in-process broker only reaches
+# watchers on the same server process.
+LIVE_LOCATION_BROKER = config('LIVE_LOCATION_BROKER', default='payments.live.InProcessBroker')
+
 # ---------------------------
 # 🌦 Weather, Currency APIs
 # ---------------------------
 OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY')
 EXCHANGE_RATE_API_KEY = config('EXCHANGE_RATE_API_KEY')
+# Base URLs, overridable to point at a local stub server
+VISA_API_URL = config('VISA_API_URL', default='https://rough-sun-2523.fly.dev')
+OPENWEATHER_API_URL = config('OPENWEATHER_API_URL', default='http://api.openweathermap.org')
+EXCHANGE_RATE_API_URL = config('EXCHANGE_RATE_API_URL', default='https://v6.exchangerate-api.com')
+# Currency the local rate table (utils.CurrencyRate) is fetched in
+EXCHANGE_RATE_BASE_CURRENCY = config('EXCHANGE_RATE_BASE_CURRENCY', default='EUR')
 
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OLLAMA_HOST = "http://127.0.0.1:11435"
+OLLAMA_HOST = config('OLLAMA_HOST', default="http://127.0.0.1:11435")
+# Generations allowed at once; further chatbot requests get a 429
+CHATBOT_MAX_CONCURRENT = config('CHATBOT_MAX_CONCURRENT', default=4, cast=int)
+# Seconds an answer is reused for the same (normalized) question
+CHATBOT_CACHE_TTL = config('CHATBOT_CACHE_TTL', default=60 * 60 * 24, cast=int)
 
 # ---------------------------
 # 🆔 Default Primary Key
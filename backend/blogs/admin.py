@@ -24,10 +24,6 @@ class BlogAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     ordering = ('-created_at',)
 
-    def likes_count(self, obj):
-        return obj.likes.count()
-    likes_count.short_description = 'Likes'
-
 # -------------------------------------
 # Comment Admin
 # -------------------------------------
@@ -49,10 +45,6 @@ class CommentAdmin(admin.ModelAdmin):
     is_reply.boolean = True
     is_reply.short_description = 'Is Reply?'
 
-    def likes_count(self, obj):
-        return obj.likes.count()
-    likes_count.short_description = 'Likes'
-
 # -------------------------------------
 # Story Admin
 # -------------------------------------
@@ -0,0 +1,132 @@
+"""
+Write-behind blog view counter.
+
+Reads never write to the database. A view is added to an in-process buffer
+of (blog, reader) pairs, which a background thread flushes FLUSH_INTERVAL
+seconds after its first entry. Whatever is still buffered is flushed when the
+process exits; a hard crash loses at most one interval of views.
+
+A reader is counted once per DEDUP_SECONDS per blog, identified by user id,
+or by a hash of IP address and user agent for anonymous readers, so no
+session has to be created for them. Deduplication happens at flush time in
+the database, so it holds across worker processes: the flush drops expired
+BlogViewer markers, inserts one per buffered pair (ignoring readers that
+still have one), and adds the markers it actually inserted to the blogs with
+one `UPDATE ... SET views = views + n` per blog, so concurrent increments
+cannot be lost and a popular article costs one write per interval.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Blog, BlogViewer
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10
+DEDUP_SECONDS = 6 * 60 * 60
+
+_buffer = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blog-views')
+_pending = threading.Event()
+
+
+def viewer_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"u{user.pk}"
+    fingerprint = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return 'a' + hashlib.sha256(fingerprint.encode()).hexdigest()[:24]
+
+
+def record_view(request, blog_id):
+    """Count a view of `blog_id` unless this reader was counted recently."""
+    with _lock:
+        first = not _buffer
+        _buffer.add((blog_id, viewer_key(request)))
+    if first:
+        # The first buffered view starts the clock for the next flush
+        _start_timer()
+
+
+def pending(blog_id):
+    """
+    Readers of `blog_id` buffered in this process and not yet written. Some
+    may turn out to be repeat readers at flush time.
+    """
+    with _lock:
+        return sum(1 for buffered_blog_id, _ in _buffer if buffered_blog_id == blog_id)
+
+
+def flush():
+    """Write buffered views to the database. Returns the number of blogs updated."""
+    with _lock:
+        views = set(_buffer)
+        _buffer.clear()
+    if not views:
+        return 0
+    now = timezone.now()
+    try:
+        # A blog deleted since its view was buffered has nothing to count
+        existing = set(Blog.objects.filter(pk__in={blog_id for blog_id, _ in views}).values_list('pk', flat=True))
+        with transaction.atomic():
+            BlogViewer.objects.filter(viewed_at__lte=now - timedelta(seconds=DEDUP_SECONDS)).delete()
+            BlogViewer.objects.bulk_create(
+                [BlogViewer(blog_id=blog_id, viewer=viewer, viewed_at=now)
+                 for blog_id, viewer in views if blog_id in existing],
+                ignore_conflicts=True, batch_size=500,
+            )
+            # Readers that already had a marker were ignored above: only the
+            # markers stamped with this flush's time are new readers
+            counts = list(
+                BlogViewer.objects.filter(viewed_at=now, blog_id__in=existing)
+                .values('blog_id').annotate(views=Count('pk')).values_list('blog_id', 'views')
+            )
+            for blog_id, count in counts:
+                Blog.objects.filter(pk=blog_id).update(views=F('views') + count)
+    except Exception:
+        # Put the views back for the next flush
+        with _lock:
+            _buffer.update(views)
+        _start_timer()
+        raise
+    return len(counts)
+
+
+def _start_timer():
+    timer = threading.Timer(FLUSH_INTERVAL, _schedule_flush)
+    timer.daemon = True
+    timer.start()
+
+
+def _schedule_flush():
+    # Coalesce: one flush picks up everything buffered before it starts
+    if not _pending.is_set():
+        _pending.set()
+        _executor.submit(_background_flush)
+
+
+def _background_flush():
+    _pending.clear()
+    try:
+        flush()
+    except Exception:
+        logger.exception("Flushing blog view counts failed")
+    finally:
+        connection.close()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Flushing blog view counts at exit failed")
@@ -0,0 +1,55 @@
+"""
+Likes on blogs and comments.
+
+Blog.likes_count and Comment.likes_count are stored so that listings and
+sorting never count the through table. A toggle deletes or inserts the one
+through row and moves the counter by exactly the number of rows it changed,
+in the same transaction, so concurrent toggles can neither lose nor invent a
+like. Edits that bypass toggle() (admin, m2m add/remove) are recounted by
+blogs.signals; recount() repairs anything else.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def through_table(model):
+    through = model.likes.through
+    # The through table's foreign key to `model`, e.g. blog_id
+    field = next(f.attname for f in through._meta.concrete_fields if f.related_model is model)
+    return through, field
+
+
+def toggle(obj, user):
+    """Like `obj` for `user`, or unlike it if already liked. Returns (liked, likes_count)."""
+    model = type(obj)
+    through, field = through_table(model)
+    row = {field: obj.pk, 'user_id': user.pk}
+    with transaction.atomic():
+        removed, _ = through.objects.filter(**row).delete()
+        if removed:
+            liked, delta = False, -removed
+        else:
+            liked = True
+            try:
+                with transaction.atomic():
+                    through.objects.create(**row)
+                delta = 1
+            except IntegrityError:
+                # A concurrent toggle inserted the same row first
+                delta = 0
+        if delta:
+            model.objects.filter(pk=obj.pk).update(likes_count=F('likes_count') + delta)
+        likes_count = model.objects.filter(pk=obj.pk).values_list('likes_count', flat=True).get()
+    return liked, likes_count
+
+
+def recount(model, pks=None):
+    """Recompute likes_count from the through table, for `pks` or every row."""
+    through, field = through_table(model)
+    counts = (
+        through.objects.filter(**{field: OuterRef('pk')})
+        .values(field).annotate(count=Count('*')).values('count')
+    )
+    queryset = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return queryset.update(likes_count=Coalesce(Subquery(counts[:1]), Value(0), output_field=IntegerField()))
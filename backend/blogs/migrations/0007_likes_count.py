@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:26
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    for model_name, field in (('Blog', 'blog_id'), ('Comment', 'comment_id')):
+        model = apps.get_model('blogs', model_name)
+        through = model.likes.through
+        counts = (
+            through.objects.filter(**{field: OuterRef('pk')})
+            .values(field).annotate(count=Count('*')).values('count')
+        )
+        model.objects.update(likes_count=Coalesce(Subquery(counts[:1]), Value(0), output_field=IntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0006_blog_country'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
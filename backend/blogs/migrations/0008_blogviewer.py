@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0007_likes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogViewer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewer', models.CharField(max_length=32)),
+                ('viewed_at', models.DateTimeField(db_index=True)),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blogs.blog')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('blog', 'viewer'), name='blogviewer_unique_reader')],
+            },
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
-from django.utils.text import slugify
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from django.conf import settings
-import itertools
+
+from utils.slugs import save_with_unique_slug
 
 
 # -------------------------
@@ -15,14 +16,42 @@ class Category(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+
+
+def _without_likes_count(instance, kwargs):
+    """
+    Save kwargs that leave likes_count alone when updating an existing row:
+    blogs.likes owns the column, and a stale instance (an edit form, the
+    admin) would otherwise write its old value back.
+    """
+    if instance._state.adding or kwargs.get('force_insert'):
+        return kwargs
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None:
+        update_fields = [field.name for field in instance._meta.concrete_fields if not field.primary_key]
+    kwargs['update_fields'] = [name for name in update_fields if name != 'likes_count']
+    return kwargs
+
+
+def _is_liked(through, field, user):
+    """is_liked as an EXISTS on the likes through table, no query per row."""
+    if user is None or not user.is_authenticated:
+        return Value(False, output_field=BooleanField())
+    return Exists(through.objects.filter(**{field: OuterRef('pk'), 'user_id': user.pk}))
 
 
 # -------------------------
 # Blog Model
 # -------------------------
+class BlogQuerySet(models.QuerySet):
+    def for_listing(self, user=None):
+        """Everything BlogSerializer renders, annotated for `user`."""
+        return self.select_related('author', 'category').annotate(
+            is_liked=_is_liked(Blog.likes.through, 'blog', user)
+        )
+
+
 class Blog(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -54,6 +83,8 @@ class Blog(models.Model):
         related_name='liked_blogs',
         blank=True
     )
+    # Kept equal to likes.count() by blogs.likes; save() never writes it
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
     country = models.ForeignKey(
         'destinations.Country',
         on_delete=models.SET_NULL,
@@ -62,25 +93,42 @@ class Blog(models.Model):
         related_name='blogs'
     )
 
+    objects = BlogQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         # Auto-generate unique slug from title if not set
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            for i in itertools.count(1):
-                if not Blog.objects.filter(slug=slug).exists():
-                    break
-                slug = f"{base_slug}-{i}"
-            self.slug = slug
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.title, super().save, *args, **_without_likes_count(self, kwargs))
+
+
+class BlogViewer(models.Model):
+    """
+    A reader already counted in Blog.views, kept for counters.DEDUP_SECONDS.
+    Written and expired only by blogs.counters.flush().
+    """
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='+')
+    viewer = models.CharField(max_length=32)  # see counters.viewer_key
+    viewed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['blog', 'viewer'], name='blogviewer_unique_reader'),
+        ]
 
 
 # -------------------------
 # Comment Model
 # -------------------------
+class CommentQuerySet(models.QuerySet):
+    def for_listing(self, user=None):
+        """Everything CommentSerializer renders, annotated for `user`."""
+        return self.select_related('author').annotate(
+            is_liked=_is_liked(Comment.likes.through, 'comment', user)
+        )
+
+
 class Comment(models.Model):
     blog = models.ForeignKey(
         Blog,
@@ -104,11 +152,18 @@ class Comment(models.Model):
         related_name='liked_comments',
         blank=True
     )
+    # Kept equal to likes.count() by blogs.likes; save() never writes it
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     def __str__(self):
         return f"Comment by {self.author.username}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **_without_likes_count(self, kwargs))
+
     def is_reply(self):
         return self.parent is not None
 
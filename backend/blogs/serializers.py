@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.urls import reverse
 from .models import Category, Blog, Comment, Story
+from . import threads
 from destinations.models import Country
 
 # -------------------------
@@ -18,7 +20,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class BlogSerializer(serializers.ModelSerializer):
     author = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
 
     # For writing (input): accept country ID
     country = serializers.PrimaryKeyRelatedField(
@@ -53,28 +55,36 @@ class BlogSerializer(serializers.ModelSerializer):
         }
 
     def get_is_liked(self, obj):
+        # Annotated by Blog.objects.for_listing()
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         user = self.context.get('request').user
         return user.is_authenticated and obj.likes.filter(id=user.id).exists()
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
 
 # -------------------------
 # Comment Serializer
 # -------------------------
 class CommentSerializer(serializers.ModelSerializer):
+    """
+    Replies are rendered from a tree built by blogs.threads, down to
+    context['max_depth'] levels below context['base_depth'] and
+    threads.REPLIES_PAGE_SIZE replies per comment. `next_replies` links to
+    the rest.
+    """
     author = serializers.SerializerMethodField()
     blog = serializers.PrimaryKeyRelatedField(read_only=True)
     replies = serializers.SerializerMethodField()
+    replies_count = serializers.SerializerMethodField()
+    next_replies = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Comment
         fields = [
             'id', 'blog', 'author', 'text', 'created_at', 'parent',
-            'replies', 'is_liked', 'likes_count',
+            'replies', 'replies_count', 'next_replies', 'is_liked', 'likes_count',
         ]
         read_only_fields = [
             'blog', 'author', 'created_at', 'replies', 'is_liked', 'likes_count'
@@ -86,19 +96,42 @@ class CommentSerializer(serializers.ModelSerializer):
             'username': obj.author.username,
         }
 
+    def _expanded(self, obj):
+        depth = obj.tree_depth - self.context.get('base_depth', 0)
+        return depth < self.context.get('max_depth', threads.MAX_DEPTH)
+
     def get_replies(self, obj):
-        queryset = obj.replies.all().order_by('created_at')
-        return CommentSerializer(queryset, many=True, context=self.context).data
+        if not hasattr(obj, 'tree_children') or not self._expanded(obj):
+            return []
+        replies, _ = threads.replies_after(obj)
+        return [self.to_representation(reply) for reply in replies]
+
+    def get_replies_count(self, obj):
+        if hasattr(obj, 'tree_children'):
+            return len(obj.tree_children)
+        return obj.replies.count()
+
+    def get_next_replies(self, obj):
+        if not getattr(obj, 'tree_children', None):
+            return None
+        url = reverse('comment-replies', kwargs={'pk': obj.pk})
+        if self._expanded(obj):
+            replies, more = threads.replies_after(obj)
+            if not more:
+                return None
+            url += f"?after={replies[-1].id}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
     def get_is_liked(self, obj):
+        # Annotated by Comment.objects.for_listing()
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(id=request.user.id).exists()
         return False
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
 # -------------------------
 # Story Serializer
 # -------------------------
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Blog, Comment
+from . import likes
+
+LIKED_MODELS = (Blog, Comment)
+
+
+def _liked_ids(user_pk):
+    ids = {}
+    for model in LIKED_MODELS:
+        through, field = likes.through_table(model)
+        ids[model] = list(through.objects.filter(user_id=user_pk).values_list(field, flat=True))
+    return ids
+
+
+# -------------------------
+# Stored like counters
+# -------------------------
+@receiver(m2m_changed, sender=Blog.likes.through)
+@receiver(m2m_changed, sender=Comment.likes.through)
+def recount_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    # likes.toggle() writes the through table directly; this catches admin
+    # edits and likes.add()/remove()/clear() from either side
+    liked_model = Blog if sender is Blog.likes.through else Comment
+    if action == 'pre_clear' and reverse:
+        # user.liked_blogs.clear(): remember what is about to be unliked
+        instance._cleared_like_ids = _liked_ids(instance.pk)[liked_model]
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            pks = [instance.pk]
+        elif action == 'post_clear':
+            pks = getattr(instance, '_cleared_like_ids', [])
+        else:
+            pks = pk_set
+        likes.recount(liked_model, pks)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remember_user_likes(sender, instance, **kwargs):
+    # The user's through rows are deleted by cascade, without m2m signals
+    instance._liked_ids = _liked_ids(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def recount_user_likes(sender, instance, **kwargs):
+    for model, pks in getattr(instance, '_liked_ids', {}).items():
+        if pks:
+            likes.recount(model, pks)
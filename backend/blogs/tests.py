@@ -1,3 +1,245 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import counters, likes, threads
+from .models import Blog, BlogViewer, Comment
+
+
+class BlogViewCounterTests(TestCase):
+    def setUp(self):
+        counters.flush()
+        patcher = mock.patch.object(counters, "_start_timer")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = get_user_model().objects.create_user(username="author", email="author@example.com", password="x")
+        self.blog = Blog.objects.create(author=self.author, title="Trekking in Nepal", content="...")
+
+    def view(self, ip, user_agent="Firefox"):
+        request = RequestFactory().get("/", REMOTE_ADDR=ip, HTTP_USER_AGENT=user_agent)
+        request.user = mock.Mock(is_authenticated=False)
+        counters.record_view(request, self.blog.pk)
+
+    def test_each_reader_counted_once(self):
+        self.view("10.0.0.1")
+        self.view("10.0.0.1")
+        self.view("10.0.0.1", user_agent="Safari")
+        self.view("10.0.0.2")
+        self.assertEqual(counters.pending(self.blog.pk), 3)
+
+        self.assertEqual(counters.flush(), 1)
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.views, counters.pending(self.blog.pk)), (3, 0))
+
+    def test_flush_adds_to_stored_views(self):
+        Blog.objects.filter(pk=self.blog.pk).update(views=10)
+        self.view("10.0.0.1")
+        counters.flush()
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.views, 11)
+
+    def views(self):
+        return Blog.objects.values_list("views", flat=True).get(pk=self.blog.pk)
+
+    def test_reader_counted_once_across_processes(self):
+        self.view("10.0.0.1")
+        counters.flush()
+        # The same reader served by another worker: its buffer is separate,
+        # the marker written by the first flush is not
+        self.view("10.0.0.1")
+        self.view("10.0.0.2")
+        self.assertEqual(counters.flush(), 1)
+        self.assertEqual(self.views(), 2)
+        self.view("10.0.0.2")
+        self.assertEqual(counters.flush(), 0)
+        self.assertEqual(self.views(), 2)
+
+    def test_reader_counted_again_after_the_window(self):
+        self.view("10.0.0.1")
+        counters.flush()
+        BlogViewer.objects.update(viewed_at=timezone.now() - timedelta(seconds=counters.DEDUP_SECONDS + 1))
+        self.view("10.0.0.1")
+        counters.flush()
+        self.assertEqual(self.views(), 2)
+        self.assertEqual(BlogViewer.objects.count(), 1)
+
+    def test_views_of_deleted_blogs_are_dropped(self):
+        self.view("10.0.0.1")
+        Blog.objects.filter(pk=self.blog.pk).delete()
+        self.assertEqual(counters.flush(), 0)
+        self.assertEqual(counters.pending(self.blog.pk), 0)
+
+    def test_failed_flush_keeps_views_buffered(self):
+        self.view("10.0.0.1")
+        with mock.patch.object(counters.Blog.objects, "filter", side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                counters.flush()
+        self.assertEqual(counters.pending(self.blog.pk), 1)
+        counters.flush()
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.views, 1)
+
+
+class BlogListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.reader = User.objects.create_user(username="reader", email="reader@example.com", password="x")
+        cls.blogs = []
+        for i in range(6):
+            author = User.objects.create_user(username=f"author{i}", email=f"author{i}@example.com", password="x")
+            cls.blogs.append(Blog.objects.create(author=author, title=f"Post {i}", content="...", status="published"))
+        for blog in cls.blogs[:2]:
+            blog.likes.add(cls.reader)
+        cls.blogs[0].likes.add(author)
+
+    def listing(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.get(reverse("blog-list-create"))
+        self.assertEqual(response.status_code, 200)
+        return {blog["title"]: blog for blog in response.data["results"]}
+
+    def test_likes_come_from_the_listing_query(self):
+        # One COUNT for the paginator and one SELECT, however many blogs
+        with self.assertNumQueries(2):
+            blogs = self.listing(self.reader)
+
+        self.assertEqual(len(blogs), 6)
+        self.assertEqual((blogs["Post 0"]["likes_count"], blogs["Post 0"]["is_liked"]), (2, True))
+        self.assertEqual((blogs["Post 1"]["likes_count"], blogs["Post 1"]["is_liked"]), (1, True))
+        self.assertEqual((blogs["Post 2"]["likes_count"], blogs["Post 2"]["is_liked"]), (0, False))
+        self.assertEqual(blogs["Post 3"]["author"]["username"], "author3")
+
+    def test_anonymous_readers_like_nothing(self):
+        blogs = self.listing()
+        self.assertFalse(any(blog["is_liked"] for blog in blogs.values()))
+
+
+class LikeCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user(username="author", email="author@example.com", password="x")
+        cls.reader = User.objects.create_user(username="reader", email="reader@example.com", password="x")
+        cls.blog = Blog.objects.create(author=cls.author, title="Trekking in Nepal", content="...")
+        cls.comment = Comment.objects.create(blog=cls.blog, author=cls.author, text="First!")
+
+    def stored_count(self, obj):
+        return type(obj).objects.values_list("likes_count", flat=True).get(pk=obj.pk)
+
+    def test_toggle_likes_and_unlikes(self):
+        self.assertEqual(likes.toggle(self.blog, self.reader), (True, 1))
+        self.assertEqual(likes.toggle(self.blog, self.author), (True, 2))
+        self.assertEqual(likes.toggle(self.blog, self.reader), (False, 1))
+        self.assertEqual(list(self.blog.likes.all()), [self.author])
+
+    def test_m2m_edits_and_user_deletion_are_recounted(self):
+        self.comment.likes.add(self.reader, self.author)
+        self.assertEqual(self.stored_count(self.comment), 2)
+        self.author.liked_comments.clear()
+        self.assertEqual(self.stored_count(self.comment), 1)
+        self.reader.delete()
+        self.assertEqual(self.stored_count(self.comment), 0)
+
+    def test_recount_repairs_drift(self):
+        likes.toggle(self.blog, self.reader)
+        Blog.objects.filter(pk=self.blog.pk).update(likes_count=7)
+        Comment.objects.filter(pk=self.comment.pk).update(likes_count=3)
+        self.assertEqual(likes.recount(Blog), 1)
+        likes.recount(Comment, [self.comment.pk])
+        self.assertEqual((self.stored_count(self.blog), self.stored_count(self.comment)), (1, 0))
+
+    def test_saving_a_stale_instance_keeps_the_count(self):
+        blog = Blog.objects.get(pk=self.blog.pk)
+        comment = Comment.objects.get(pk=self.comment.pk)
+        likes.toggle(self.blog, self.reader)
+        likes.toggle(self.comment, self.reader)
+
+        blog.title = "Trekking in Nepal, revisited"
+        blog.save()
+        comment.text = "Edited"
+        comment.save(update_fields=["text", "likes_count"])
+
+        self.assertEqual((self.stored_count(blog), self.stored_count(comment)), (1, 1))
+        self.assertEqual(Blog.objects.get(pk=blog.pk).title, "Trekking in Nepal, revisited")
+        self.assertEqual(Comment.objects.get(pk=comment.pk).text, "Edited")
+
+
+def node(id, parent_id=None):
+    return SimpleNamespace(id=id, parent_id=parent_id)
+
+
+class CommentTreeTests(SimpleTestCase):
+    def test_links_threads_and_depths(self):
+        comments = [node(1), node(2, 1), node(3), node(4, 2), node(5, 1), node(6, 99)]
+        roots, by_id = threads.build_tree(comments)
+
+        self.assertEqual([root.id for root in roots], [1, 3, 6])
+        self.assertEqual([child.id for child in by_id[1].tree_children], [2, 5])
+        self.assertEqual({c.id: c.tree_depth for c in comments}, {1: 0, 2: 1, 3: 0, 4: 2, 5: 1, 6: 0})
+
+    def test_replies_cursor(self):
+        parent = node(1)
+        comments = [parent] + [node(id, 1) for id in range(2, 14)]
+        threads.build_tree(comments)
+
+        page, more = threads.replies_after(parent, limit=5)
+        self.assertEqual(([c.id for c in page], more), ([2, 3, 4, 5, 6], True))
+        page, more = threads.replies_after(parent, after=page[-1].id, limit=5)
+        self.assertEqual(([c.id for c in page], more), ([7, 8, 9, 10, 11], True))
+        page, more = threads.replies_after(parent, after=page[-1].id, limit=5)
+        self.assertEqual(([c.id for c in page], more), ([12, 13], False))
+
+    def test_parse_depth(self):
+        self.assertEqual(threads.parse_depth(None), threads.MAX_DEPTH)
+        self.assertEqual(threads.parse_depth("x"), threads.MAX_DEPTH)
+        self.assertEqual(threads.parse_depth("-1"), 0)
+        self.assertEqual(threads.parse_depth("99"), threads.MAX_DEPTH)
+
+
+class CommentThreadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="reader", email="reader@example.com", password="x")
+        cls.blog = Blog.objects.create(author=cls.user, title="Trekking in Nepal", content="...", status="published")
+        cls.root = Comment.objects.create(blog=cls.blog, author=cls.user, text="root")
+        cls.replies = [
+            Comment.objects.create(blog=cls.blog, author=cls.user, text=f"reply {i}", parent=cls.root)
+            for i in range(threads.REPLIES_PAGE_SIZE + 2)
+        ]
+        deep = cls.replies[0]
+        for depth in range(threads.MAX_DEPTH + 1):
+            deep = Comment.objects.create(blog=cls.blog, author=cls.user, text=f"depth {depth + 2}", parent=deep)
+
+    def test_thread_is_rendered_from_one_query(self):
+        with self.assertNumQueries(1):
+            response = APIClient().get(reverse("blog-comments", args=[self.blog.pk]))
+        root = response.data["results"][0]
+        self.assertEqual(root["replies_count"], len(self.replies))
+        self.assertEqual(len(root["replies"]), threads.REPLIES_PAGE_SIZE)
+        self.assertIn(f"after={self.replies[threads.REPLIES_PAGE_SIZE - 1].pk}", root["next_replies"])
+
+        # Replies stop at MAX_DEPTH and link to the rest instead
+        level = root
+        for _ in range(threads.MAX_DEPTH):
+            level = level["replies"][0]
+        self.assertEqual(level["replies"], [])
+        self.assertIsNotNone(level["next_replies"])
+
+    def test_load_more_replies(self):
+        url = reverse("comment-replies", args=[self.root.pk])
+        first = APIClient().get(url).data
+        self.assertEqual([c["id"] for c in first["results"]], [c.pk for c in self.replies[:threads.REPLIES_PAGE_SIZE]])
+
+        rest = APIClient().get(first["next"]).data
+        self.assertEqual([c["id"] for c in rest["results"]], [c.pk for c in self.replies[threads.REPLIES_PAGE_SIZE:]])
+        self.assertIsNone(rest["next"])
@@ -0,0 +1,63 @@
+"""
+Comment threads, assembled in memory.
+
+All comments of a blog are fetched in one query and linked into a tree in
+O(n): every comment gets `tree_children` (oldest first) and `tree_depth`
+(0 for a thread root). CommentSerializer renders replies from those
+attributes, down to a depth limit and REPLIES_PAGE_SIZE replies per comment;
+anything cut off is reachable through the replies endpoint with an `after`
+cursor.
+"""
+from collections import deque
+
+from .models import Comment
+
+MAX_DEPTH = 3
+REPLIES_PAGE_SIZE = 5
+
+
+def load_blog_comments(blog_id, user=None):
+    return list(Comment.objects.for_listing(user).filter(blog_id=blog_id).order_by('id'))
+
+
+def build_tree(comments):
+    """
+    Link `comments` (oldest first) into threads. Returns (roots, by_id);
+    a comment whose parent is not in `comments` is treated as a root.
+    """
+    by_id = {comment.id: comment for comment in comments}
+    roots = []
+    for comment in comments:
+        comment.tree_children = []
+    for comment in comments:
+        parent = by_id.get(comment.parent_id) if comment.parent_id else None
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.tree_children.append(comment)
+
+    queue = deque((root, 0) for root in roots)
+    while queue:
+        comment, depth = queue.popleft()
+        comment.tree_depth = depth
+        queue.extend((child, depth + 1) for child in comment.tree_children)
+    return roots, by_id
+
+
+def replies_after(comment, after=None, limit=REPLIES_PAGE_SIZE):
+    """
+    Up to `limit` direct replies of `comment` posted after the reply with id
+    `after`, and whether there are more.
+    """
+    replies = comment.tree_children
+    if after is not None:
+        replies = [reply for reply in replies if reply.id > after]
+    return replies[:limit], len(replies) > limit
+
+
+def parse_depth(value, default=MAX_DEPTH):
+    try:
+        depth = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0, min(depth, MAX_DEPTH))
@@ -4,6 +4,7 @@ from .views import (
     BlogDetailView,
     CommentListCreateByBlogView,
     CommentRetrieveUpdateDestroyView,
+    CommentRepliesView,
     toggle_like,
     toggle_comment_like,
     CategoryListView,
@@ -20,6 +21,7 @@ urlpatterns = [
     # Comments endpoints (specific)
     path('<int:blog_id>/comments/', CommentListCreateByBlogView.as_view(), name='blog-comments'),
     path('comments/<int:pk>/', CommentRetrieveUpdateDestroyView.as_view(), name='comment-detail'),
+    path('comments/<int:pk>/replies/', CommentRepliesView.as_view(), name='comment-replies'),
 
     # Like toggles (specific)
     path('<int:blog_id>/toggle-like/', toggle_like, name='toggle-blog-like'),
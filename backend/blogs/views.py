@@ -1,8 +1,10 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from .models import Blog, Comment, Category, Story
+from . import counters, likes, threads
 from .serializers import BlogSerializer, CommentSerializer, CategorySerializer, StorySerializer
 
 # -------------------------
@@ -21,7 +23,7 @@ class BlogListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        queryset = Blog.objects.filter(status='published').order_by('-created_at')
+        queryset = Blog.objects.for_listing(self.request.user).filter(status='published').order_by('-created_at')
         country_name = self.request.query_params.get('country')
         if country_name:
             queryset = queryset.filter(country__name=country_name)
@@ -43,22 +45,18 @@ class BlogDetailView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        return Blog.objects.all()
+        return Blog.objects.for_listing(self.request.user)
 
     def get_serializer_context(self):
         return {'request': self.request}
 
     def get_object(self):
-        blog = get_object_or_404(
-            Blog.objects.prefetch_related('likes', 'comments__author'),
-            slug=self.kwargs['slug']
-        )
+        blog = get_object_or_404(self.get_queryset(), slug=self.kwargs['slug'])
 
-        session_key = f"viewed_blog_{blog.id}"
-        if not self.request.session.get(session_key):
-            blog.views += 1
-            blog.save(update_fields=['views'])
-            self.request.session[session_key] = True
+        if self.request.method == 'GET':
+            # Buffered and written in bulk, see blogs.counters
+            counters.record_view(self.request, blog.id)
+            blog.views += counters.pending(blog.id)
 
         return blog
 
@@ -66,11 +64,29 @@ class BlogDetailView(generics.RetrieveUpdateDestroyAPIView):
 # Comment Views
 # -------------------------
 class CommentListCreateByBlogView(generics.ListCreateAPIView):
+    """
+    Threads of a blog, newest first, paginated by thread root. Replies are
+    nested up to ?depth= levels (default and maximum threads.MAX_DEPTH).
+    """
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        return Comment.objects.filter(blog_id=self.kwargs['blog_id']).order_by('-created_at')
+        return Comment.objects.for_listing(self.request.user).filter(blog_id=self.kwargs['blog_id']).order_by('-created_at')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['max_depth'] = threads.parse_depth(self.request.query_params.get('depth'))
+        return context
+
+    def list(self, request, *args, **kwargs):
+        # One query for the whole blog; the tree is built in memory
+        roots, _ = threads.build_tree(threads.load_blog_comments(self.kwargs['blog_id'], request.user))
+        roots.reverse()
+        page = self.paginate_queryset(roots)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(roots, many=True).data)
 
     def perform_create(self, serializer):
         blog = get_object_or_404(Blog, id=self.kwargs['blog_id'])
@@ -81,43 +97,78 @@ class IsCommentAuthor(permissions.BasePermission):
         return obj.author == request.user
 
 class CommentRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
+    def get_queryset(self):
+        return Comment.objects.for_listing(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['max_depth'] = threads.parse_depth(self.request.query_params.get('depth'))
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        comment = self.get_object()
+        _, by_id = threads.build_tree(threads.load_blog_comments(comment.blog_id, request.user))
+        comment = by_id[comment.id]
+        serializer = self.get_serializer(comment, context={
+            **self.get_serializer_context(), 'base_depth': comment.tree_depth,
+        })
+        return Response(serializer.data)
+
     def get_permissions(self):
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
             return [permissions.IsAuthenticated(), IsCommentAuthor()]
         return [permissions.AllowAny()]
 
+class CommentRepliesView(generics.GenericAPIView):
+    """
+    "Load more replies": direct replies of a comment posted after the reply
+    ?after=<id>, threads.REPLIES_PAGE_SIZE at a time, each nested up to
+    ?depth= levels. `next` is the cursor URL for the following page.
+    """
+    serializer_class = CommentSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        blog_id = get_object_or_404(Comment.objects.values_list('blog_id', flat=True), pk=pk)
+        try:
+            after = int(request.query_params['after']) if request.query_params.get('after') else None
+        except ValueError:
+            return Response({'error': 'after must be a comment id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        _, by_id = threads.build_tree(threads.load_blog_comments(blog_id, request.user))
+        comment = by_id[pk]
+        replies, more = threads.replies_after(comment, after)
+        serializer = self.get_serializer(replies, many=True, context={
+            'request': request,
+            'max_depth': threads.parse_depth(request.query_params.get('depth')),
+            'base_depth': comment.tree_depth + 1,
+        })
+        next_url = None
+        if more:
+            next_url = request.build_absolute_uri(
+                reverse('comment-replies', kwargs={'pk': pk}) + f"?after={replies[-1].id}"
+            )
+        return Response({'next': next_url, 'results': serializer.data})
+
 # -------------------------
 # Like Toggle API Views
 # -------------------------
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_like(request, blog_id):
-    blog = get_object_or_404(Blog, id=blog_id)
-    user = request.user
-    if blog.likes.filter(id=user.id).exists():
-        blog.likes.remove(user)
-        liked = False
-    else:
-        blog.likes.add(user)
-        liked = True
-    return Response({'liked': liked, 'likes_count': blog.likes.count()})
+    blog = get_object_or_404(Blog.objects.only('id'), id=blog_id)
+    liked, likes_count = likes.toggle(blog, request.user)
+    return Response({'liked': liked, 'likes_count': likes_count})
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_comment_like(request, comment_id):
-    comment = get_object_or_404(Comment, id=comment_id)
-    user = request.user
-    if comment.likes.filter(id=user.id).exists():
-        comment.likes.remove(user)
-        liked = False
-    else:
-        comment.likes.add(user)
-        liked = True
-    return Response({'liked': liked, 'likes_count': comment.likes.count()})
+    comment = get_object_or_404(Comment.objects.only('id'), id=comment_id)
+    liked, likes_count = likes.toggle(comment, request.user)
+    return Response({'liked': liked, 'likes_count': likes_count})
 
 # -------------------------
 # Story Views
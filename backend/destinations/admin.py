@@ -139,7 +139,7 @@ class TravelDealAdmin(admin.ModelAdmin):
 
     fieldsets = (
         (None, {
-            'fields': ('title', 'slug', 'country', 'category', 'places', 'city', 'days', 'price', 'discount_percent', 'on_sale', 'last_minute')
+            'fields': ('title', 'slug', 'country', 'category', 'places', 'city', 'days', 'price', 'currency', 'discount_percent', 'on_sale', 'last_minute')
         }),
         ('Description & Media', {
             'fields': ('subtitle', 'description', 'image', 'image_preview', 'themes', 'tag', 'style'),
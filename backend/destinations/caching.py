@@ -0,0 +1,77 @@
+"""
+Response cache for the region → countries trees served on the homepage.
+
+Entries are keyed by a content version that is bumped whenever a Region or
+Country is saved or deleted (see destinations.signals), so nothing has to be
+purged. With a cache shared between workers (file or Redis, see
+settings.CACHES) every worker sees the new version at once and a stale tree
+is never served. The default locmem cache is private to each process, so a
+bump only reaches the process that made the edit; there entries live for
+LOCAL_TREE_TIMEOUT seconds, which bounds how long other workers can serve
+the old tree.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'destinations:tree-version'
+TREE_TIMEOUT = 60 * 60 * 24
+LOCAL_TREE_TIMEOUT = 60
+
+
+def _fresh_version():
+    # Time based, so a lost version key can never resurrect older entries
+    return int(time.time() * 1000)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _fresh_version(), timeout=None)
+
+
+def tree_timeout():
+    return LOCAL_TREE_TIMEOUT if isinstance(caches['default'], LocMemCache) else TREE_TIMEOUT
+
+
+def cached_tree(name, build, request=None):
+    """
+    Return (data, etag) for the tree `name`, calling `build()` only on a miss.
+    Pass `request` when the payload contains absolute URLs so that each host
+    gets its own entry.
+    """
+    origin = request.build_absolute_uri('/') if request is not None else ''
+    key = f"destinations:{name}:{get_version()}:{hashlib.md5(origin.encode()).hexdigest()}"
+    entry = cache.get(key)
+    if entry is None:
+        data = json.loads(json.dumps(build(), default=str))
+        digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        entry = (data, f'"{digest}"')
+        cache.set(key, entry, tree_timeout())
+    return entry
+
+
+def conditional_response(request, data, etag):
+    """Answer 304 Not Modified when the client already holds `etag`."""
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in client_etags or '*' in client_etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from destinations import search
+from destinations.models import Region, Country, TravelDeal
+
+KEYWORDS = [
+    'himalaya', 'trek', 'everest', 'annapurna', 'safari', 'beach', 'island', 'temple',
+    'culture', 'wildlife', 'jungle', 'desert', 'mountain', 'lake', 'river', 'canyon',
+    'festival', 'cuisine', 'heritage', 'volcano', 'glacier', 'coast', 'village', 'monastery',
+    'rafting', 'cycling', 'yoga', 'wine', 'sunset', 'highlands', 'fjord', 'aurora',
+]
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+
+
+def _vocabulary(rng, size):
+    # Pseudo place/theme names so that, as in a real catalogue, each term
+    # only matches a small share of the deals.
+    words = set(KEYWORDS)
+    while len(words) < size:
+        words.add(''.join(
+            rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4))
+        ))
+    return sorted(words)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark travel deal full-text search on synthetic data. Deals are created "
+        "inside a transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deals', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--target-ms', type=float, default=10.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            raise CommandError("No full-text search index is available on this database.")
+
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                vocabulary = _vocabulary(rng, 2000)
+                self._populate(rng, vocabulary, options['deals'])
+                timings = self._run_queries(rng, vocabulary, options['queries'], options['limit'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{options['deals']} deals, {len(timings)} queries: "
+            f"p50 {p50:.2f} ms, p95 {p95:.2f} ms, max {timings[-1]:.2f} ms"
+        )
+        if p95 > options['target_ms']:
+            raise CommandError(f"p95 {p95:.2f} ms exceeds the {options['target_ms']} ms target.")
+        self.stdout.write(self.style.SUCCESS(f"p95 is within the {options['target_ms']} ms target."))
+
+    def _populate(self, rng, vocabulary, count):
+        region = Region.objects.create(name='Benchmark region')
+        countries = [
+            Country.objects.create(region=region, name=f'Benchmark country {i}', slug=f'benchmark-country-{i}')
+            for i in range(20)
+        ]
+        deals = [
+            TravelDeal(
+                country=rng.choice(countries),
+                title=' '.join(rng.sample(vocabulary, 3)).title(),
+                slug=f'benchmark-deal-{i}',
+                days=rng.randint(3, 21),
+                price=str(rng.randint(500, 5000)),
+                description=' '.join(rng.choices(vocabulary, k=40)),
+            )
+            for i in range(count)
+        ]
+        TravelDeal.objects.bulk_create(deals, batch_size=2000)
+        start = time.perf_counter()
+        search.rebuild_index()
+        self.stdout.write(f"Indexed {count} deals in {time.perf_counter() - start:.1f} s")
+
+    def _run_queries(self, rng, vocabulary, count, limit):
+        timings = []
+        for _ in range(count):
+            terms = rng.sample(vocabulary, rng.randint(1, 2))
+            # Simulate typing: the last term is a prefix
+            terms[-1] = terms[-1][:rng.randint(search.MIN_TERM_LENGTH, len(terms[-1]))]
+            query = ' '.join(terms)
+            start = time.perf_counter()
+            ranked = search.search_deals(TravelDeal.objects.all(), query).order_by('-search_rank', 'id')
+            list(ranked.values_list('pk', flat=True)[:limit])
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
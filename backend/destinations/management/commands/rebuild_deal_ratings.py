@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from destinations.models import TravelDeal
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating_avg/rating_count columns of every travel deal from its reviews."
+
+    def handle(self, *args, **options):
+        updated = TravelDeal.objects.all().refresh_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} travel deals."))
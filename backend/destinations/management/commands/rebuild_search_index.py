@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from destinations import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of travel deals (e.g. after a bulk import)."
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            self.stderr.write("No full-text search index is available on this database.")
+            return
+        total = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} travel deals."))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:50
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_ratings(apps, schema_editor):
+    TravelDeal = apps.get_model('destinations', 'TravelDeal')
+    Review = apps.get_model('destinations', 'Review')
+    stats = Review.objects.values('travel_deal').annotate(avg=Avg('rating'), count=Count('pk'))
+    for row in stats:
+        TravelDeal.objects.filter(pk=row['travel_deal']).update(
+            rating_avg=row['avg'] or 0,
+            rating_count=row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0023_dealcategory_discount_percent_traveldeal_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveldeal',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='traveldeal',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='traveldeal',
+            index=models.Index(fields=['-rating_avg', '-id'], name='traveldeal_popular_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:52
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+def _parse_price(value):
+    # Same rules as destinations.pricing.parse_price at the time of writing
+    cleaned = re.sub(r'[^\d.,\-]', '', value or '')
+    last = max(cleaned.rfind('.'), cleaned.rfind(','))
+    if last != -1:
+        separator = cleaned[last]
+        other = ',' if separator == '.' else '.'
+        if other in cleaned:
+            cleaned = cleaned.replace(other, '').replace(separator, '.')
+        elif cleaned.count(separator) > 1 or len(cleaned) - last - 1 == 3:
+            cleaned = cleaned.replace(separator, '')
+        else:
+            cleaned = cleaned.replace(separator, '.')
+    if not cleaned:
+        return None
+    try:
+        return Decimal(cleaned).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+
+def _detect_currency(value):
+    for symbol, code in (('€', 'EUR'), ('$', 'USD'), ('£', 'GBP'), ('₹', 'INR')):
+        if value and symbol in value:
+            return code
+    return 'EUR'
+
+
+def parse_existing_prices(apps, schema_editor):
+    TravelDeal = apps.get_model('destinations', 'TravelDeal')
+    TravelDealDate = apps.get_model('destinations', 'TravelDealDate')
+
+    deals = list(TravelDeal.objects.only('id', 'price'))
+    for deal in deals:
+        deal.price_amount = _parse_price(deal.price)
+        deal.currency = _detect_currency(deal.price)
+    TravelDeal.objects.bulk_update(deals, ['price_amount', 'currency'], batch_size=500)
+
+    dates = list(TravelDealDate.objects.only('id', 'original_price', 'discounted_price'))
+    for date in dates:
+        date.original_amount = _parse_price(date.original_price)
+        date.discounted_amount = _parse_price(date.discounted_price)
+    TravelDealDate.objects.bulk_update(dates, ['original_amount', 'discounted_amount'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0024_traveldeal_rating_avg_traveldeal_rating_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveldeal',
+            name='currency',
+            field=models.CharField(default='EUR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='traveldeal',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveldealdate',
+            name='discounted_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveldealdate',
+            name='original_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='traveldeal',
+            index=models.Index(fields=['price_amount'], name='traveldeal_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveldealdate',
+            index=models.Index(fields=['travel_deal', 'discounted_amount'], name='dealdate_price_idx'),
+        ),
+        migrations.RunPython(parse_existing_prices, migrations.RunPython.noop),
+    ]
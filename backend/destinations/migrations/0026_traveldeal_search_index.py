@@ -0,0 +1,71 @@
+from django.db import migrations, OperationalError
+
+# The index as created at the time of writing; destinations.search maintains
+# it from here on. Kept independent of app code on purpose.
+INDEX_TABLE = 'destinations_traveldeal_search'
+
+CREATE = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+        "title, subtitle, country, city, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (deal_id bigint PRIMARY KEY, document tsvector NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_idx ON {INDEX_TABLE} USING GIN (document)",
+    ],
+}
+
+INSERT = {
+    'sqlite': (
+        f"INSERT INTO {INDEX_TABLE} (rowid, title, subtitle, country, city, description) "
+        "VALUES (%s, %s, %s, %s, %s, %s)"
+    ),
+    'postgresql': (
+        f"INSERT INTO {INDEX_TABLE} (deal_id, document) VALUES (%s, "
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s || ' ' || %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'D')) "
+        "ON CONFLICT (deal_id) DO UPDATE SET document = EXCLUDED.document"
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE:
+        return
+    TravelDeal = apps.get_model('destinations', 'TravelDeal')
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for statement in CREATE[vendor]:
+                cursor.execute(statement)
+        except OperationalError:
+            # SQLite compiled without FTS5: search falls back to icontains
+            return
+        documents = [
+            (deal.id, deal.title or '', deal.subtitle or '', deal.country.name if deal.country_id else '',
+             deal.city or '', deal.description or '')
+            for deal in TravelDeal.objects.select_related('country')
+        ]
+        if documents:
+            cursor.executemany(INSERT[vendor], documents)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in CREATE:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0025_traveldeal_price_amount_traveldeal_currency_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:57
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+CENTS = Decimal('0.01')
+
+
+# Same rules as destinations.pricing.resolve_discount at the time of writing
+def _percent(value):
+    if not value:
+        return Decimal(0)
+    try:
+        return Decimal(str(value).replace('%', '').strip())
+    except InvalidOperation:
+        return Decimal(0)
+
+
+def resolve_discount(date, deal_percent, category_percent):
+    base = date.original_amount if date.original_amount is not None else date.discounted_amount
+    if base is None:
+        return None, None
+
+    date_percent = _percent(date.discount_percent)
+    if date_percent > 0:
+        return date_percent, date.discounted_amount
+
+    for percent in (_percent(deal_percent), _percent(category_percent)):
+        if percent > 0:
+            return percent, (base * (100 - percent) / 100).quantize(CENTS)
+
+    return None, base
+
+
+def snapshot_discounts(apps, schema_editor):
+    TravelDeal = apps.get_model('destinations', 'TravelDeal')
+    TravelDealDate = apps.get_model('destinations', 'TravelDealDate')
+
+    dates = list(TravelDealDate.objects.select_related('travel_deal__category'))
+    best = {}
+    for date in dates:
+        deal = date.travel_deal
+        category = deal.category
+        percent, price = resolve_discount(
+            date, deal.discount_percent, category.discount_percent if category else None
+        )
+        date.effective_discount_percent, date.effective_price = percent, price
+        if percent is not None and (deal.pk not in best or (-percent, price) < (-best[deal.pk][0], best[deal.pk][1])):
+            best[deal.pk] = (percent, price)
+    TravelDealDate.objects.bulk_update(dates, ['effective_discount_percent', 'effective_price'], batch_size=500)
+
+    for deal_id, (percent, price) in best.items():
+        TravelDeal.objects.filter(pk=deal_id).update(best_discount_percent=percent, best_discounted_price=price)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0026_traveldeal_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveldeal',
+            name='best_discount_percent',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveldeal',
+            name='best_discounted_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveldealdate',
+            name='effective_discount_percent',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveldealdate',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(snapshot_discounts, migrations.RunPython.noop),
+    ]
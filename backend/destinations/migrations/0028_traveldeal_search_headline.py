@@ -0,0 +1,46 @@
+from django.db import migrations, OperationalError
+
+# SQLite only: PostgreSQL restricts the same tsvector to its A/B weights.
+# Kept independent of app code on purpose, like 0026.
+INDEX_TABLE = 'destinations_traveldeal_search'
+HEADLINE_TABLE = f'{INDEX_TABLE}_headline'
+
+
+def create_headline_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [INDEX_TABLE])
+        if cursor.fetchone() is None:
+            # SQLite compiled without FTS5: search falls back to icontains
+            return
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {HEADLINE_TABLE} USING fts5("
+                "title, subtitle, country, city, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            return
+        cursor.execute(
+            f"INSERT INTO {HEADLINE_TABLE} (rowid, title, subtitle, country, city) "
+            f"SELECT rowid, title, subtitle, country, city FROM {INDEX_TABLE}"
+        )
+
+
+def drop_headline_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {HEADLINE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0027_traveldeal_best_discount_percent_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_headline_index, drop_headline_index),
+    ]
@@ -1,9 +1,15 @@
 from django.conf import settings
 from django.db import models
-from django.utils.text import slugify
+from django.db.models import Avg, Count, FloatField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 import json
 
+from utils.slugs import save_with_unique_slug
+
+from . import pricing
+from .pricing import parse_price, detect_currency
+
 
 # -------------------------
 # Region and Country Models
@@ -15,6 +21,28 @@ class Region(models.Model):
         return self.name
 
 
+class CountryQuerySet(models.QuerySet):
+    def for_detail(self, sections):
+        """
+        One prefetch plan for the country page, limited to the sections the
+        client asked for (see CountryDetailSerializer.SECTIONS).
+        """
+        qs = self.select_related('region')
+        if 'overview' in sections:
+            qs = qs.select_related('overview')
+        if 'deals' in sections:
+            qs = qs.prefetch_related(Prefetch('deals', queryset=TravelDeal.objects.for_listing()))
+        if 'reviews' in sections:
+            qs = qs.prefetch_related('deals__reviews')
+        if {'articles', 'inspirations', 'suggested_articles'} & set(sections):
+            qs = qs.prefetch_related('articles')
+        if 'faqs' in sections:
+            qs = qs.prefetch_related('faqs')
+        if 'learn_more_topics' in sections:
+            qs = qs.prefetch_related('learn_more_topics')
+        return qs
+
+
 class Country(models.Model):
     region = models.ForeignKey(Region, related_name="countries", on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -27,13 +55,13 @@ class Country(models.Model):
     image = models.ImageField(upload_to='countries/', blank=True, null=True)
     video = models.FileField(upload_to='videos/', blank=True, null=True)
 
+    objects = CountryQuerySet.as_manager()
+
     class Meta:
         unique_together = ('region', 'name')
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.region.name})"
@@ -64,6 +92,11 @@ class DealCategory(models.Model):
     name = models.CharField(max_length=100)
     discount_percent = models.CharField(max_length=10, blank=True, null=True, help_text="e.g. '15%' for category discount")
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Cascade the category discount into the stored price snapshots
+        pricing.refresh_deal_pricing(self.deals.values('pk'))
+
     def __str__(self):
         return self.name
 
@@ -90,6 +123,47 @@ class Place(models.Model):
 # -------------------------
 # Travel Deal and Related Models
 # -------------------------
+class TravelDealQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Load everything TravelDealSerializer renders up front: country and region
+        are joined in and gallery/places/dates are prefetched, so a page of deals
+        costs a fixed number of queries.
+        """
+        return self.select_related('country__region').prefetch_related('gallery', 'places', 'dates')
+
+    def refresh_ratings(self):
+        """
+        Recompute the stored rating_avg/rating_count columns for every deal in
+        the queryset with a single UPDATE.
+        """
+        reviews = Review.objects.filter(travel_deal=OuterRef('pk')).values('travel_deal')
+        return self.update(
+            rating_avg=Coalesce(
+                Subquery(reviews.annotate(avg=Avg('rating')).values('avg')[:1]),
+                Value(0.0),
+                output_field=FloatField(),
+            ),
+            rating_count=Coalesce(
+                Subquery(reviews.annotate(count=Count('pk')).values('count')[:1]),
+                Value(0),
+            ),
+        )
+
+    def refresh_best_discount(self):
+        """
+        Store, for every deal in the queryset, the highest effective discount
+        among its dates (cheapest price on ties) with a single UPDATE.
+        """
+        best = TravelDealDate.objects.filter(
+            travel_deal=OuterRef('pk'), effective_discount_percent__isnull=False
+        ).order_by('-effective_discount_percent', 'effective_price')
+        return self.update(
+            best_discount_percent=Subquery(best.values('effective_discount_percent')[:1]),
+            best_discounted_price=Subquery(best.values('effective_price')[:1]),
+        )
+
+
 class TravelDeal(models.Model):
     country = models.ForeignKey(Country, related_name="deals", on_delete=models.CASCADE)
     category = models.ForeignKey(DealCategory, related_name='deals', on_delete=models.SET_NULL, null=True, blank=True)
@@ -101,6 +175,9 @@ class TravelDeal(models.Model):
     slug = models.SlugField(unique=True, blank=True)
     days = models.PositiveIntegerField()
     price = models.CharField(max_length=20)
+    # Numeric copy of `price`, parsed on save and used for filtering/sorting
+    price_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    currency = models.CharField(max_length=3, default='EUR')  # ISO code, e.g. "EUR"
     image = models.ImageField(upload_to="deals/cover/", null=True, blank=True)
     themes = models.JSONField(default=list, blank=True)
     tag = models.CharField(max_length=50, blank=True)
@@ -111,10 +188,26 @@ class TravelDeal(models.Model):
 
     discount_percent = models.CharField(max_length=10, blank=True, null=True, help_text="e.g. '10%' for deal-wide discount")
 
+    # Best effective discount among the deal's dates, see destinations.pricing
+    best_discount_percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, editable=False)
+    best_discounted_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+
+    # Review aggregates, kept in sync by destinations.signals
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
     # Stored as JSON string, accessed via properties below
     included_json = models.TextField(blank=True, default='[]')
     not_included_json = models.TextField(blank=True, default='[]')
 
+    objects = TravelDealQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-rating_avg', '-id'], name='traveldeal_popular_idx'),
+            models.Index(fields=['price_amount'], name='traveldeal_price_idx'),
+        ]
+
     @property
     def included(self):
         try:
@@ -138,9 +231,13 @@ class TravelDeal(models.Model):
         self.not_included_json = json.dumps(value)
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+        self.price_amount = parse_price(self.price)
+        self.currency = detect_currency(self.price) or self.currency
+        adding = self._state.adding
+        save_with_unique_slug(self, self.title, super().save, *args, **kwargs)
+        if not adding:
+            # The deal discount or category may have changed
+            pricing.refresh_deal_pricing([self.pk])
 
     def __str__(self):
         return f"{self.title} - {self.country.name}"
@@ -274,75 +371,49 @@ class TravelDealDate(models.Model):
     discount_percent = models.CharField(max_length=10, blank=True, null=True)
     capacity = models.PositiveIntegerField(default=0, help_text="Maximum number of people allowed for this date")
 
+    # Numeric copies of the price strings, parsed on save
+    original_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    discounted_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+
+    # Effective discount after date → deal → category priority, see destinations.pricing
+    effective_discount_percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, editable=False)
+    effective_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['travel_deal', 'discounted_amount'], name='dealdate_price_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         """
-        Calculate and set discount_percent based on prices if not set manually.
+        Parse the price strings into their numeric columns and set
+        discount_percent from them.
         """
+        self.original_amount = parse_price(self.original_price)
+        self.discounted_amount = parse_price(self.discounted_price)
+
         if self.original_price and self.discounted_price:
-            try:
-                original = float(self.original_price.replace(",", "").replace("€", "").strip())
-                discounted = float(self.discounted_price.replace(",", "").replace("€", "").strip())
-                if original > 0 and discounted < original:
-                    percent = round((original - discounted) / original * 100)
-                    self.discount_percent = f"{percent}%"
-                else:
-                    self.discount_percent = None
-            except ValueError:
+            if self.original_amount is None or self.discounted_amount is None:
                 raise ValidationError("Prices must be numeric.")
+            if self.original_amount > 0 and self.discounted_amount < self.original_amount:
+                percent = round((self.original_amount - self.discounted_amount) / self.original_amount * 100)
+                self.discount_percent = f"{percent}%"
+            else:
+                self.discount_percent = None
         else:
             self.discount_percent = None
 
+        pricing.price_date(self, self.travel_deal)
         super().save(*args, **kwargs)
+        TravelDeal.objects.filter(pk=self.travel_deal_id).refresh_best_discount()
 
     def get_effective_discount(self):
         """
-        Calculate the effective discount and discounted price based on priority:
-          1. Date discount_percent (self.discount_percent)
-          2. Deal discount_percent (self.travel_deal.discount_percent)
-          3. Category discount_percent (self.travel_deal.category.discount_percent)
-          4. No discount
-        Returns tuple: (discount_percent_str or None, discounted_price_float or None)
+        Return the stored effective discount as a tuple:
+        (discount_percent_str or None, discounted_price_float or None).
         """
-        def parse_price(price_str):
-            try:
-                return float(price_str.replace("€", "").replace(",", "").strip())
-            except Exception:
-                return None
-
-        def parse_percent(percent_str):
-            try:
-                return float(percent_str.replace("%", "").strip())
-            except Exception:
-                return 0
-
-        original_price = parse_price(self.original_price)
-        if original_price is None:
-            return None, None
-
-        # Priority 1: Date discount
-        if self.discount_percent:
-            discount_value = parse_percent(self.discount_percent)
-            discounted_price = original_price * (1 - discount_value / 100)
-            return self.discount_percent, round(discounted_price, 2)
-
-        # Priority 2: Deal discount
-        deal_discount_str = getattr(self.travel_deal, 'discount_percent', None)
-        if deal_discount_str:
-            discount_value = parse_percent(deal_discount_str)
-            if discount_value > 0:
-                discounted_price = original_price * (1 - discount_value / 100)
-                return deal_discount_str, round(discounted_price, 2)
-
-        # Priority 3: Category discount
-        category = getattr(self.travel_deal, 'category', None)
-        if category and getattr(category, 'discount_percent', None):
-            discount_value = parse_percent(category.discount_percent)
-            if discount_value > 0:
-                discounted_price = original_price * (1 - discount_value / 100)
-                return category.discount_percent, round(discounted_price, 2)
-
-        # No discount
-        return None, original_price
+        price = float(self.effective_price) if self.effective_price is not None else None
+        return pricing.format_percent(self.effective_discount_percent), price
 
     def __str__(self):
         return f"{self.travel_deal.title} ({self.start_date} → {self.end_date})"
@@ -0,0 +1,151 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+CURRENCY_SYMBOLS = {
+    '€': 'EUR',
+    '$': 'USD',
+    '£': 'GBP',
+    '₹': 'INR',
+}
+
+_NON_NUMERIC = re.compile(r'[^\d.,\-]')
+CENTS = Decimal('0.01')
+
+
+def _normalize_separators(cleaned):
+    """
+    Turn the digits and separators of a price into a plain decimal string.
+    When both "." and "," occur, the last one is the decimal separator
+    ("1.299,00" and "1,299.00"). A lone separator is a thousands separator
+    when it repeats or is followed by exactly three digits ("1,299",
+    "1.299"), otherwise the decimal separator ("12,50").
+    """
+    last = max(cleaned.rfind('.'), cleaned.rfind(','))
+    if last == -1:
+        return cleaned
+    separator = cleaned[last]
+    other = ',' if separator == '.' else '.'
+    if other in cleaned:
+        return cleaned.replace(other, '').replace(separator, '.')
+    if cleaned.count(separator) > 1 or len(cleaned) - last - 1 == 3:
+        return cleaned.replace(separator, '')
+    return cleaned.replace(separator, '.')
+
+
+def parse_price(value):
+    """
+    Parse a display price such as "1,299€", "1.299,00€" or "$ 950" into a
+    Decimal. Returns None for empty or non-numeric values.
+    """
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return value.quantize(CENTS)
+    cleaned = _normalize_separators(_NON_NUMERIC.sub('', str(value)))
+    if not cleaned:
+        return None
+    try:
+        return Decimal(cleaned).quantize(CENTS)
+    except InvalidOperation:
+        return None
+
+
+def parse_percent(value):
+    """
+    Parse a percentage such as "15%" into a Decimal (15). Empty or invalid
+    values count as no discount.
+    """
+    if not value:
+        return Decimal(0)
+    try:
+        return Decimal(str(value).replace('%', '').strip())
+    except InvalidOperation:
+        return Decimal(0)
+
+
+def detect_currency(value):
+    """
+    Return the ISO currency code for the symbol used in a display price, or
+    None when the string carries no known symbol.
+    """
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if value and symbol in str(value):
+            return code
+    return None
+
+
+def format_percent(percent):
+    """Render a stored Decimal percentage the way the API always has: "15%"."""
+    if percent is None:
+        return None
+    return f"{percent.normalize():f}%"
+
+
+def format_price(amount):
+    """Render a stored Decimal price the way the API always has: "900.0€"."""
+    if amount is None:
+        return None
+    return f"{float(amount)}€"
+
+
+def percent_value(percent):
+    """Return a stored Decimal percentage as an int when whole, else a float."""
+    if percent is None:
+        return None
+    return int(percent) if percent == percent.to_integral_value() else float(percent)
+
+
+def apply_discount(amount, percent):
+    return (amount * (100 - percent) / 100).quantize(CENTS)
+
+
+# -------------------------
+# Effective discount snapshot
+# -------------------------
+def resolve_discount(date, deal_percent, category_percent):
+    """
+    Return the effective (percent, price) of a departure date, in priority:
+      1. the date's own reduced price (discount_percent is derived on save)
+      2. the deal-wide discount_percent
+      3. the deal category's discount_percent
+    Without any discount the price is the base price, and (None, None) is
+    returned when the date has no usable price at all.
+    """
+    base = date.original_amount if date.original_amount is not None else date.discounted_amount
+    if base is None:
+        return None, None
+
+    date_percent = parse_percent(date.discount_percent)
+    if date_percent > 0:
+        return date_percent, date.discounted_amount
+
+    for percent in (parse_percent(deal_percent), parse_percent(category_percent)):
+        if percent > 0:
+            return percent, apply_discount(base, percent)
+
+    return None, base
+
+
+def price_date(date, deal):
+    """Set the effective discount columns of `date` (not saved)."""
+    category = deal.category if deal.category_id else None
+    date.effective_discount_percent, date.effective_price = resolve_discount(
+        date, deal.discount_percent, category.discount_percent if category else None
+    )
+
+
+def refresh_deal_pricing(deal_ids):
+    """
+    Recompute the stored effective discount of every date of the given deals
+    (an iterable of ids or a values('pk') queryset), then each deal's best
+    discount. Costs three queries however many dates are involved.
+    """
+    from .models import TravelDeal, TravelDealDate
+
+    dates = list(
+        TravelDealDate.objects.filter(travel_deal_id__in=deal_ids).select_related('travel_deal__category')
+    )
+    for date in dates:
+        price_date(date, date.travel_deal)
+    TravelDealDate.objects.bulk_update(dates, ['effective_discount_percent', 'effective_price'], batch_size=500)
+    TravelDeal.objects.filter(pk__in=deal_ids).refresh_best_discount()
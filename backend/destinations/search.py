@@ -0,0 +1,296 @@
+"""
+Full-text search index for travel deals.
+
+SQLite uses an FTS5 virtual table and PostgreSQL a tsvector side table with a
+GIN index; both are keyed by deal id and kept up to date by
+destinations.signals. search_deals() narrows a TravelDeal queryset to the
+matching deals with an unranked index lookup, so it combines with any other
+filter, and annotates each with `search_rank`. On any other database (or an
+SQLite build without FTS5) it returns None and callers fall back to
+icontains.
+
+Ranking cost grows with the number of matches, and broad prefixes match a
+large share of descriptions. Matches in the title, subtitle, country and city
+are therefore searched first; descriptions are only searched when those
+cannot fill a page. SQLite ranks only the best MAX_RANKED matches, inside one
+index-driven LIMIT subquery, and any further matches follow in id order;
+PostgreSQL ranks each candidate through a primary key lookup.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+INDEX_TABLE = 'destinations_traveldeal_search'
+MAX_RANKED = 500
+MAX_TERMS = 8
+MIN_TERM_LENGTH = 2
+# Fewer headline matches than this (one page) also searches descriptions
+MIN_HEADLINE_MATCHES = 10
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    # Single characters would prefix-match most of the catalogue
+    terms = [term for term in _TERM.findall((query or '').lower()) if len(term) >= MIN_TERM_LENGTH]
+    return terms[:MAX_TERMS]
+
+
+def document_for(deal):
+    return (
+        deal.id,
+        deal.title or '',
+        deal.subtitle or '',
+        deal.country.name if deal.country_id else '',
+        deal.city or '',
+        deal.description or '',
+    )
+
+
+# -------------------------
+# SQLite (FTS5)
+# -------------------------
+class SQLiteSearchBackend:
+    # bm25 column weights: title, subtitle, country, city, description
+    WEIGHTS = '10.0, 4.0, 6.0, 6.0, 1.0'
+    # A column filter makes FTS5 decode every position list, so the headline
+    # columns get a table of their own
+    HEADLINE_TABLE = f'{INDEX_TABLE}_headline'
+    HEADLINE_WEIGHTS = '10.0, 4.0, 6.0, 6.0'
+    OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            f"title, subtitle, country, city, description, {self.OPTIONS})"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.HEADLINE_TABLE} USING fts5("
+            f"title, subtitle, country, city, {self.OPTIONS})"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {self.HEADLINE_TABLE}")
+
+    def is_available(self, cursor):
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name IN (%s, %s)", [INDEX_TABLE, self.HEADLINE_TABLE]
+        )
+        return cursor.fetchone()[0] == 2
+
+    def index(self, cursor, documents):
+        self.remove(cursor, [doc[0] for doc in documents])
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (rowid, title, subtitle, country, city, description) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            documents,
+        )
+        cursor.executemany(
+            f"INSERT INTO {self.HEADLINE_TABLE} (rowid, title, subtitle, country, city) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [doc[:5] for doc in documents],
+        )
+
+    def remove(self, cursor, deal_ids):
+        for table in (INDEX_TABLE, self.HEADLINE_TABLE):
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(pk,) for pk in deal_ids])
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        cursor.execute(f"DELETE FROM {self.HEADLINE_TABLE}")
+
+    def query(self, terms, headline=False):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def matches(self, headline=False):
+        table = self.HEADLINE_TABLE if headline else INDEX_TABLE
+        return f"SELECT rowid FROM {table} WHERE {table} MATCH %s"
+
+    def count(self, cursor, match, limit, headline=False):
+        cursor.execute(f"SELECT count(*) FROM ({self.matches(headline)} LIMIT %s)", [match, limit])
+        return cursor.fetchone()[0]
+
+    def rank(self, deal_id_column, headline=False):
+        # The LIMIT subquery is uncorrelated, so SQLite runs it (and bm25) once
+        # and looks each deal up in it; bm25() is lower for better matches
+        table, weights = (self.HEADLINE_TABLE, self.HEADLINE_WEIGHTS) if headline else (INDEX_TABLE, self.WEIGHTS)
+        return (
+            f"SELECT score FROM (SELECT rowid AS deal_id, -bm25({table}, {weights}) AS score "
+            f"FROM {table} WHERE {table} MATCH %s ORDER BY score DESC LIMIT {MAX_RANKED}) "
+            f"WHERE deal_id = {deal_id_column}"
+        )
+
+
+# -------------------------
+# PostgreSQL (tsvector + GIN)
+# -------------------------
+class PostgresSearchBackend:
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s || ' ' || %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'D')"
+    )
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+            "deal_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_idx "
+            f"ON {INDEX_TABLE} USING GIN (document)"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+    def is_available(self, cursor):
+        cursor.execute("SELECT to_regclass(%s)", [INDEX_TABLE])
+        return cursor.fetchone()[0] is not None
+
+    def index(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (deal_id, document) VALUES (%s, {self.DOCUMENT}) "
+            "ON CONFLICT (deal_id) DO UPDATE SET document = EXCLUDED.document",
+            documents,
+        )
+
+    def remove(self, cursor, deal_ids):
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE deal_id = ANY(%s)", [list(deal_ids)])
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {INDEX_TABLE}")
+
+    def query(self, terms, headline=False):
+        # Title is weighted A, subtitle, country and city B
+        return ' & '.join(f"{term}:*AB" if headline else f"{term}:*" for term in terms)
+
+    def matches(self, headline=False):
+        return f"SELECT deal_id FROM {INDEX_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+
+    def count(self, cursor, match, limit, headline=False):
+        cursor.execute(f"SELECT count(*) FROM ({self.matches()} LIMIT %s) matches", [match, limit])
+        return cursor.fetchone()[0]
+
+    def rank(self, deal_id_column, headline=False):
+        # One primary key lookup per candidate; matches() does the GIN scan
+        return (
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {INDEX_TABLE} "
+            f"WHERE deal_id = {deal_id_column}"
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_availability = {}
+
+
+def get_backend(using=None):
+    """
+    Return the search backend for the current database, or None when the
+    database has no full-text index.
+    """
+    conn = using or connection
+    backend_class = BACKENDS.get(conn.vendor)
+    if backend_class is None:
+        return None
+    backend = backend_class()
+    key = (conn.alias, conn.settings_dict.get('NAME'))
+    if key not in _availability:
+        with conn.cursor() as cursor:
+            _availability[key] = backend.is_available(cursor)
+    return backend if _availability[key] else None
+
+
+# -------------------------
+# Public API
+# -------------------------
+def index_deals(deals):
+    """(Re)index the given deals. Country must be loaded or loadable."""
+    backend = get_backend()
+    documents = [document_for(deal) for deal in deals]
+    if backend is None or not documents:
+        return
+    with connection.cursor() as cursor:
+        backend.index(cursor, documents)
+
+
+def remove_deals(deal_ids):
+    backend = get_backend()
+    deal_ids = list(deal_ids)
+    if backend is None or not deal_ids:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, deal_ids)
+
+
+def rebuild_index(batch_size=2000):
+    """Drop every indexed document and reindex all deals. Returns the count."""
+    from .models import TravelDeal
+
+    backend = get_backend()
+    if backend is None:
+        return 0
+    deals = (
+        TravelDeal.objects.select_related('country')
+        .only('id', 'title', 'subtitle', 'city', 'description', 'country__name')
+        .order_by('id')
+    )
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        for deal in deals.iterator(chunk_size=batch_size):
+            batch.append(document_for(deal))
+            if len(batch) >= batch_size:
+                backend.index(cursor, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            backend.index(cursor, batch)
+            total += len(batch)
+    return total
+
+
+def _fills_page(backend, conn, match, queryset, matched):
+    """Whether `matched` (headline matches within `queryset`) fills a page."""
+    with conn.cursor() as cursor:
+        if backend.count(cursor, match, MIN_HEADLINE_MATCHES, headline=True) < MIN_HEADLINE_MATCHES:
+            return False
+    # The index alone answers for an unfiltered queryset; other filters may
+    # drop the headline matches, and then descriptions are searched too
+    if not queryset.query.has_filters():
+        return True
+    return matched[:MIN_HEADLINE_MATCHES].count() == MIN_HEADLINE_MATCHES
+
+
+def search_deals(queryset, query):
+    """
+    Narrow a TravelDeal `queryset` to deals matching every term of `query` as
+    a prefix, annotated with `search_rank` (higher is better, 0 past the
+    ranked matches). Returns None when there is no full-text index or `query`
+    has no term long enough to search for; callers then fall back to
+    icontains.
+    """
+    conn = connections[queryset.db]
+    backend = get_backend(conn)
+    terms = search_terms(query)
+    if backend is None or not terms:
+        return None
+    deal_id = f"{conn.ops.quote_name(queryset.model._meta.db_table)}.{conn.ops.quote_name('id')}"
+
+    for headline in (True, False):
+        match = backend.query(terms, headline=headline)
+        matched = queryset.filter(id__in=RawSQL(backend.matches(headline), [match]))
+        if not headline or _fills_page(backend, conn, match, queryset, matched):
+            break
+    rank = RawSQL(backend.rank(deal_id, headline), [match], output_field=FloatField())
+    return matched.annotate(search_rank=Coalesce(rank, Value(0.0)))
@@ -1,12 +1,13 @@
 from rest_framework import serializers
 import json
-from django.db.models import Avg
 from .models import (
     Region, Country, TravelDeal, TravelImage, Review, Article, FAQ,
     TravelOption, TravelType, DealCategory, DealOffer,
     CountryOverview, CountryLearnMoreTopic, TravelDealDate,
     WishlistItem, Place, ItineraryDay
 )
+from .pricing import format_percent, format_price, percent_value
+from utils.currency import UnknownCurrency, get_matrix
 
 
 # -------------------------
@@ -90,30 +91,39 @@ class TravelDealDateSerializer(serializers.ModelSerializer):
 
     def get_effective_discount(self, obj):
         """
-        Priority-based discount logic: 
-        Prefer TravelDealDate's discount → else TravelDeal's discount → else DealCategory default
+        Stored date → deal → category priority discount, see destinations.pricing.
         """
-        try:
-            if obj.original_price and obj.discounted_price:
-                original = float(str(obj.original_price).replace(",", "").replace("€", "").strip())
-                discounted = float(str(obj.discounted_price).replace(",", "").replace("€", "").strip())
-                if original > 0 and discounted < original:
-                    percent = round((original - discounted) / original * 100)
-                    return {
-                        "percent": f"{percent}%",
-                        "discounted_price": f"{discounted}€"
-                    }
-        except Exception:
-            pass
+        if obj.effective_discount_percent is None:
+            return {
+                "percent": None,
+                "discounted_price": None
+            }
         return {
-            "percent": None,
-            "discounted_price": None
+            "percent": format_percent(obj.effective_discount_percent),
+            "discounted_price": format_price(obj.effective_price)
         }
 
 
 # -------------------------
 # TravelDeal Serializer
 # -------------------------
+def local_currency_for(request):
+    """?currency=XXX, else the currency_code of the user's nationality."""
+    if request is None:
+        return None
+    currency = getattr(request, 'query_params', request.GET).get('currency')
+    if currency:
+        return currency.strip().upper()[:3]
+    nationality = getattr(request.user, 'nationality', None)
+    if not nationality:
+        return None
+    return (
+        Country.objects.filter(code__iexact=nationality, currency_code__gt='')
+        .values_list('currency_code', flat=True)
+        .first()
+    )
+
+
 class TravelDealSerializer(serializers.ModelSerializer):
     themes = JSONListField()
     country = CountrySerializer(read_only=True)
@@ -131,39 +141,56 @@ class TravelDealSerializer(serializers.ModelSerializer):
 
     average_rating = serializers.SerializerMethodField()
     effective_discount = serializers.SerializerMethodField()
+    local_price = serializers.SerializerMethodField()
     dates = TravelDealDateSerializer(many=True, read_only=True)  # Include deal dates
 
     class Meta:
         model = TravelDeal
         fields = "__all__"
+        read_only_fields = ['rating_avg', 'rating_count']
 
     def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            avg_rating = reviews.aggregate(avg=Avg('rating'))['avg']
-            return round(avg_rating, 1) if avg_rating else 0
-        return 0
+        return round(obj.rating_avg, 1) if obj.rating_avg else 0
 
     def get_effective_discount(self, obj):
         """
-        Compute the best discount (highest %) from associated TravelDealDate objects.
+        Best (highest %) effective discount among the deal's dates, stored on write.
         """
-        best_discount = None
-        for date in obj.dates.all():
-            try:
-                original = float(str(date.original_price).replace(",", "").replace("€", "").strip())
-                discounted = float(str(date.discounted_price).replace(",", "").replace("€", "").strip())
-                if original > 0 and discounted < original:
-                    percent = round((original - discounted) / original * 100)
-                    if not best_discount or percent > best_discount['percent']:
-                        best_discount = {
-                            'percent': percent,
-                            'discounted_price': f"{discounted}€"
-                        }
-            except Exception:
-                continue
+        if obj.best_discount_percent is None:
+            return {"percent": None, "discounted_price": None}
+        return {
+            'percent': percent_value(obj.best_discount_percent),
+            'discounted_price': format_price(obj.best_discounted_price)
+        }
 
-        return best_discount or {"percent": None, "discounted_price": None}
+    def get_local_price(self, obj):
+        """
+        Price (and best discounted price) converted with the local rate table
+        into ?currency= or the currency of the user's nationality.
+        """
+        currency = self.local_currency()
+        if not currency or obj.price_amount is None:
+            return None
+        matrix = get_matrix()
+        try:
+            price = matrix.convert(obj.price_amount, obj.currency, currency)
+            discounted = (
+                matrix.convert(obj.best_discounted_price, obj.currency, currency)
+                if obj.best_discounted_price is not None else None
+            )
+        except UnknownCurrency:
+            return None
+        return {
+            'currency': currency,
+            'price': str(price),
+            'discounted_price': str(discounted) if discounted is not None else None,
+        }
+
+    def local_currency(self):
+        # Resolved once per response: list children share the root's context
+        if 'local_currency' not in self.context:
+            self.context['local_currency'] = local_currency_for(self.context.get('request'))
+        return self.context['local_currency']
 
 
 # Serializer to expose included/not included JSON fields conveniently
@@ -275,6 +302,13 @@ class CountryLearnMoreTopicSerializer(serializers.ModelSerializer):
 # Detailed Country Serializer with nested relations
 # -------------------------
 class CountryDetailSerializer(serializers.ModelSerializer):
+    # Heavy sections that can be requested selectively with ?include=
+    SECTIONS = (
+        "deals", "reviews", "articles", "faqs",
+        "overview", "learn_more_topics",
+        "inspirations", "suggested_articles",
+    )
+
     video = serializers.SerializerMethodField()
     deals = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
@@ -296,6 +330,18 @@ class CountryDetailSerializer(serializers.ModelSerializer):
             "inspirations", "suggested_articles",
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sections = self.context.get('sections')
+        if sections is not None:
+            for name in self.SECTIONS:
+                if name not in sections:
+                    self.fields.pop(name)
+
+    @staticmethod
+    def _is_prefetched(obj, relation):
+        return relation in getattr(obj, '_prefetched_objects_cache', {})
+
     def get_video(self, obj):
         request = self.context.get('request')
         if obj.video and request:
@@ -303,11 +349,17 @@ class CountryDetailSerializer(serializers.ModelSerializer):
         return None
 
     def get_deals(self, obj):
-        return TravelDealSerializer(obj.deals.all(), many=True, context=self.context).data
+        deals = obj.deals.all() if self._is_prefetched(obj, 'deals') else obj.deals.for_listing()
+        return TravelDealSerializer(deals, many=True, context=self.context).data
 
     def get_reviews(self, obj):
-        deals = obj.deals.all()
-        reviews = Review.objects.filter(travel_deal__in=deals)
+        if self._is_prefetched(obj, 'deals'):
+            reviews = sorted(
+                (review for deal in obj.deals.all() for review in deal.reviews.all()),
+                key=lambda review: review.pk,
+            )
+        else:
+            reviews = Review.objects.filter(travel_deal__country=obj)
         return ReviewSerializer(reviews, many=True).data
 
     def get_articles(self, obj):
@@ -316,11 +368,14 @@ class CountryDetailSerializer(serializers.ModelSerializer):
     def get_faqs(self, obj):
         return FAQSerializer(obj.faqs.all(), many=True).data
 
+    # Inspirations and suggestions are partitioned from the single articles fetch
     def get_inspirations(self, obj):
-        return ArticleSerializer(obj.articles.filter(is_inspirational=True), many=True, context=self.context).data
+        articles = [article for article in obj.articles.all() if article.is_inspirational]
+        return ArticleSerializer(articles, many=True, context=self.context).data
 
     def get_suggested_articles(self, obj):
-        return ArticleSerializer(obj.articles.filter(is_suggested=True), many=True, context=self.context).data
+        articles = [article for article in obj.articles.all() if article.is_suggested]
+        return ArticleSerializer(articles, many=True, context=self.context).data
 
 
 # -------------------------
@@ -0,0 +1,78 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Region, Country, DealCategory, TravelDeal, TravelDealDate, Review
+)
+from . import caching, pricing, search
+
+
+# -------------------------
+# Review → TravelDeal rating aggregates
+# -------------------------
+@receiver(pre_save, sender=Review)
+def remember_previous_deal(sender, instance, **kwargs):
+    # A review moved to another deal (admin edit) has to refresh both deals.
+    if instance.pk:
+        instance._previous_travel_deal_id = (
+            Review.objects.filter(pk=instance.pk).values_list('travel_deal_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_deal_rating(sender, instance, **kwargs):
+    deal_ids = {instance.travel_deal_id, getattr(instance, '_previous_travel_deal_id', None)}
+    deal_ids.discard(None)
+    TravelDeal.objects.filter(pk__in=deal_ids).refresh_ratings()
+
+
+# -------------------------
+# Full-text search index
+# -------------------------
+@receiver(post_save, sender=TravelDeal)
+def index_deal(sender, instance, **kwargs):
+    search.index_deals([instance])
+
+
+@receiver(post_delete, sender=TravelDeal)
+def unindex_deal(sender, instance, **kwargs):
+    search.remove_deals([instance.pk])
+
+
+@receiver(post_save, sender=Country)
+def reindex_country_deals(sender, instance, created, **kwargs):
+    # Deals are indexed with their country name
+    if not created:
+        search.index_deals(instance.deals.select_related('country'))
+
+
+# -------------------------
+# Effective discount snapshots
+# -------------------------
+@receiver(post_delete, sender=TravelDealDate)
+def refresh_deal_best_discount(sender, instance, **kwargs):
+    TravelDeal.objects.filter(pk=instance.travel_deal_id).refresh_best_discount()
+
+
+@receiver(pre_delete, sender=DealCategory)
+def remember_category_deals(sender, instance, **kwargs):
+    # The deals' category is set to NULL with a bare UPDATE, no save() runs
+    instance._deal_ids = list(instance.deals.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=DealCategory)
+def reprice_category_deals(sender, instance, **kwargs):
+    pricing.refresh_deal_pricing(getattr(instance, '_deal_ids', []))
+
+
+# -------------------------
+# Cached region → countries trees
+# -------------------------
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_destination_trees(sender, **kwargs):
+    caching.bump_version()
+
@@ -1,3 +1,374 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from . import caching, search
+from .models import FAQ, Region, Country, DealCategory, Place, Review, TravelDeal, TravelDealDate, TravelImage
+from .pricing import parse_price
+from .serializers import CountryDetailSerializer
+
+
+class ParsePriceTests(SimpleTestCase):
+    def test_separators(self):
+        cases = {
+            "1,299€": Decimal("1299.00"),
+            "$ 950": Decimal("950.00"),
+            "1.299,00€": Decimal("1299.00"),
+            "1,299.50": Decimal("1299.50"),
+            "12,50 €": Decimal("12.50"),
+            "99.90": Decimal("99.90"),
+            "1.299€": Decimal("1299.00"),
+            "1 299,99 €": Decimal("1299.99"),
+            "1.234.567,8": Decimal("1234567.80"),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_price(value), expected)
+
+    def test_empty_or_invalid(self):
+        for value in (None, "", "on request", "-.-"):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_price(value))
+
+
+class EffectiveDiscountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nepal = Country.objects.create(region=Region.objects.create(name="Asia"), name="Nepal")
+
+    def setUp(self):
+        self.category = DealCategory.objects.create(name="Summer", discount_percent="20%")
+        self.deal = TravelDeal.objects.create(
+            country=self.nepal, category=self.category, title="Annapurna Circuit", days=14, price="1000€"
+        )
+
+    def add_date(self, discounted_price="1000€", original_price="1000€"):
+        return TravelDealDate.objects.create(
+            travel_deal=self.deal, start_date="2030-05-01", end_date="2030-05-14", language="English",
+            rooms="Shared", original_price=original_price, discounted_price=discounted_price,
+        )
+
+    def effective(self, date):
+        return TravelDealDate.objects.values_list("effective_discount_percent", "effective_price").get(pk=date.pk)
+
+    def best(self):
+        return TravelDeal.objects.values_list("best_discount_percent", "best_discounted_price").get(pk=self.deal.pk)
+
+    def set_deal_discount(self, percent):
+        self.deal.discount_percent = percent
+        self.deal.save()
+
+    def test_date_then_deal_then_category(self):
+        plain = self.add_date()
+        own = self.add_date(discounted_price="950€")
+        self.assertEqual(self.effective(plain), (Decimal("20"), Decimal("800.00")))
+
+        self.set_deal_discount("10%")
+        self.assertEqual(self.effective(plain), (Decimal("10"), Decimal("900.00")))
+        # A date's own reduced price wins even when it is the smaller discount
+        self.assertEqual(self.effective(own), (Decimal("5"), Decimal("950.00")))
+
+        self.set_deal_discount(None)
+        self.assertEqual(self.effective(own), (Decimal("5"), Decimal("950.00")))
+        self.assertEqual(self.effective(plain), (Decimal("20"), Decimal("800.00")))
+
+    def test_best_discount_follows_dates(self):
+        self.assertEqual(self.best(), (None, None))
+        self.add_date()
+        self.assertEqual(self.best(), (Decimal("20"), Decimal("800.00")))
+
+        sale = self.add_date(discounted_price="700€")
+        self.assertEqual(self.best(), (Decimal("30"), Decimal("700.00")))
+
+        sale.discounted_price = "1000€"
+        sale.save()
+        self.assertEqual(self.best(), (Decimal("20"), Decimal("800.00")))
+
+        sale = self.add_date(discounted_price="650€")
+        self.assertEqual(self.best(), (Decimal("35"), Decimal("650.00")))
+        sale.delete()
+        self.assertEqual(self.best(), (Decimal("20"), Decimal("800.00")))
+
+    def test_api_formats_match_the_original_ones(self):
+        self.category.delete()
+        self.add_date(discounted_price="900€")
+        self.add_date(original_price="1.299,00€", discounted_price="1.169,10€")
+        for rating in (4, 5, 5):
+            Review.objects.create(
+                travel_deal=self.deal, name="Asha", title="Great", rating=rating, content="-", travel_date="May"
+            )
+
+        data = self.client.get(reverse("travel-deal-list-all")).data["results"][0]
+        self.assertEqual(data["effective_discount"], {"percent": 10, "discounted_price": "900.0€"})
+        self.assertEqual(
+            [date["effective_discount"] for date in data["dates"]],
+            [{"percent": "10%", "discounted_price": "900.0€"}, {"percent": "10%", "discounted_price": "1169.1€"}],
+        )
+        self.assertEqual(data["average_rating"], 4.7)
+
+    def test_category_changes_cascade(self):
+        date = self.add_date()
+        self.assertEqual(self.best(), (Decimal("20"), Decimal("800.00")))
+
+        self.category.discount_percent = "10%"
+        self.category.save()
+        self.assertEqual(self.best(), (Decimal("10"), Decimal("900.00")))
+
+        self.category.delete()
+        self.assertEqual(self.best(), (None, None))
+        self.assertEqual(self.effective(date), (None, Decimal("1000.00")))
+
+
+class DealListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nepal = Country.objects.create(region=Region.objects.create(name="Asia"), name="Nepal")
+        cls.places = [Place.objects.create(name=name) for name in ("Pokhara", "Kathmandu")]
+
+    def add_deals(self, count):
+        for _ in range(count):
+            deal = TravelDeal.objects.create(
+                country=self.nepal, title=f"Trek {TravelDeal.objects.count()}", days=10, price="1000€"
+            )
+            deal.places.set(self.places)
+            TravelImage.objects.create(deal=deal, image="deals/gallery/trek.jpg")
+            for day in (1, 15):
+                TravelDealDate.objects.create(
+                    travel_deal=deal, start_date=f"2030-05-{day:02}", end_date=f"2030-05-{day + 9:02}",
+                    language="English", rooms="Shared", original_price="1000€", discounted_price="900€",
+                )
+            for rating in (4, 5):
+                Review.objects.create(
+                    travel_deal=deal, name="Asha", title="Great", rating=rating, content="-", travel_date="May"
+                )
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        client = APIClient()
+        url = reverse("travel-deal-list-all")
+        for total in (1, 3, 10):
+            self.add_deals(total - TravelDeal.objects.count())
+            # count, deals with country and region, then gallery, places and dates
+            with self.assertNumQueries(5):
+                response = client.get(url)
+            self.assertEqual(len(response.data["results"]), total)
+            self.assertEqual(len(response.data["results"][0]["dates"]), 2)
+
+
+class DealRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nepal = Country.objects.create(region=Region.objects.create(name="Asia"), name="Nepal")
+        cls.admin = get_user_model().objects.create_superuser(
+            username="admin", email="admin@example.com", password="x"
+        )
+
+    def setUp(self):
+        self.deal = TravelDeal.objects.create(country=self.nepal, title="Langtang Valley", days=8, price="700€")
+        self.client = APIClient()
+
+    def rating(self, deal=None):
+        return TravelDeal.objects.values_list("rating_avg", "rating_count").get(pk=(deal or self.deal).pk)
+
+    def review(self, rating):
+        url = reverse("review-list", args=[self.nepal.slug, self.deal.slug])
+        response = self.client.post(url, {
+            "name": "Asha", "title": "Lovely", "rating": rating, "content": "-", "travel_date": "May 2030",
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def review_url(self, pk):
+        return reverse("review-detail", args=[self.nepal.slug, self.deal.slug, pk])
+
+    def test_reviews_keep_the_aggregates_in_sync(self):
+        self.assertEqual(self.rating(), (0, 0))
+        first = self.review(5)
+        self.review(2)
+        self.assertEqual(self.rating(), (3.5, 2))
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.patch(self.review_url(first), {"rating": 3}).status_code, 200)
+        self.assertEqual(self.rating(), (2.5, 2))
+
+        self.assertEqual(self.client.delete(self.review_url(first)).status_code, 204)
+        self.assertEqual(self.rating(), (2, 1))
+
+    def test_moved_review_refreshes_both_deals(self):
+        other = TravelDeal.objects.create(country=self.nepal, title="Gokyo Lakes", days=12, price="900€")
+        review = Review.objects.get(pk=self.review(4))
+        review.travel_deal = other
+        review.save()
+        self.assertEqual(self.rating(), (0, 0))
+        self.assertEqual(self.rating(other), (4, 1))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.review(5)
+        self.review(4)
+        other = TravelDeal.objects.create(country=self.nepal, title="Gokyo Lakes", days=12, price="900€")
+        TravelDeal.objects.update(rating_avg=1, rating_count=9)
+
+        out = StringIO()
+        call_command("rebuild_deal_ratings", stdout=out)
+        self.assertIn("Rebuilt ratings for 2 travel deals.", out.getvalue())
+        self.assertEqual(self.rating(), (4.5, 2))
+        self.assertEqual(self.rating(other), (0, 0))
+
+
+class CountryDetailSectionTests(TestCase):
+    BASE_FIELDS = {
+        "id", "name", "slug", "subtitle", "section_title", "description", "image", "code", "currency_code",
+        "video", "region",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nepal = Country.objects.create(region=Region.objects.create(name="Asia"), name="Nepal")
+        deal = TravelDeal.objects.create(country=cls.nepal, title="Everest Base Camp", days=14, price="1299€")
+        Review.objects.create(travel_deal=deal, name="Asha", title="Great", rating=5, content="-", travel_date="May")
+        FAQ.objects.create(country=cls.nepal, question="Visa?", answer="On arrival")
+
+    def get(self, include=None):
+        params = {} if include is None else {"include": include}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("country-detail", args=[self.nepal.slug]), params)
+        tables = " ".join(query["sql"] for query in queries.captured_queries)
+        return response, tables
+
+    def test_only_requested_sections_are_returned(self):
+        response, _ = self.get("faqs, reviews")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), self.BASE_FIELDS | {"faqs", "reviews"})
+        self.assertEqual(response.data["reviews"][0]["title"], "Great")
+        self.assertEqual(response.data["faqs"][0]["question"], "Visa?")
+
+        response, _ = self.get("")
+        self.assertEqual(set(response.data), self.BASE_FIELDS)
+
+        response, _ = self.get()
+        self.assertEqual(set(response.data), self.BASE_FIELDS | set(CountryDetailSerializer.SECTIONS))
+
+    def test_unknown_sections_are_rejected(self):
+        response, _ = self.get("faqs,weather,deals,prices")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown sections: prices, weather.", response.data["include"])
+
+    def test_unrequested_sections_are_not_queried(self):
+        with self.assertNumQueries(2):
+            _, tables = self.get("faqs")
+        self.assertIn('"destinations_faq"', tables)
+        for table in ("destinations_traveldeal", "destinations_review", "destinations_article"):
+            self.assertNotIn(f'"{table}"', tables)
+
+        with self.assertNumQueries(1):
+            self.get("")
+
+
+class DealSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.asia = Region.objects.create(name="Asia")
+        cls.africa = Region.objects.create(name="Africa")
+        cls.nepal = Country.objects.create(region=cls.asia, name="Nepal")
+        cls.kenya = Country.objects.create(region=cls.africa, name="Kenya")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def deal(self, country, title, description=""):
+        return TravelDeal.objects.create(country=country, title=title, days=7, price="999€", description=description)
+
+    def titles(self, **params):
+        response = self.client.get(reverse("search-deals"), params)
+        self.assertEqual(response.status_code, 200)
+        return [deal["title"] for deal in response.data["results"]], response.data["count"]
+
+    def test_ranks_title_matches_first(self):
+        self.deal(self.nepal, "Village Walk", "Views of everest from the hills")
+        self.deal(self.nepal, "Everest Base Camp")
+        titles, count = self.titles(query="ever")
+        self.assertEqual(titles, ["Everest Base Camp", "Village Walk"])
+        self.assertEqual(count, 2)
+
+    def test_filters_apply_before_ranking(self):
+        # Hundreds of better matches elsewhere must not crowd out the
+        # matches inside the filtered set
+        TravelDeal.objects.bulk_create(
+            TravelDeal(country=self.nepal, title=f"Safari {i}", slug=f"safari-{i}", days=7, price="999€")
+            for i in range(520)
+        )
+        search.rebuild_index()
+        self.deal(self.kenya, "Masai Mara", "A safari in the Mara")
+        self.deal(self.kenya, "Amboseli", "Elephants on safari")
+
+        titles, count = self.titles(query="safari", region=self.africa.pk)
+        self.assertEqual(sorted(titles), ["Amboseli", "Masai Mara"])
+        self.assertEqual(count, 2)
+        # Descriptions are only searched when the headline columns cannot fill a page
+        self.assertEqual(self.titles(query="safari")[1], 520)
+
+    def test_short_terms_fall_back_to_icontains(self):
+        self.deal(self.nepal, "Route 7 Drive")
+        self.deal(self.nepal, "Kathmandu Valley")
+        titles, _ = self.titles(query="7")
+        self.assertEqual(titles, ["Route 7 Drive"])
+
+
+class TreeCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.asia = Region.objects.create(name="Asia")
+        cls.nepal = Country.objects.create(region=cls.asia, name="Nepal")
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(reverse(name), headers=headers)
+
+    def test_unchanged_tree_is_not_modified(self):
+        for name in ("destinations-api", "region-with-countries"):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 200)
+                etag = response["ETag"]
+
+                # Served from the cache: no queries at all
+                with self.assertNumQueries(0):
+                    response = self.get(name, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_writes_bump_the_version(self):
+        etag = self.get("region-with-countries")["ETag"]
+        self.nepal.name = "Nepal Himalaya"
+        self.nepal.save()
+        response = self.get("region-with-countries", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["countries"][0]["name"], "Nepal Himalaya")
+
+        etag = response["ETag"]
+        Region.objects.create(name="Africa")
+        response = self.get("region-with-countries", etag)
+        self.assertEqual((response.status_code, len(response.json())), (200, 2))
+        self.assertEqual(self.get("region-with-countries", response["ETag"]).status_code, 304)
+
+
+class TreeCacheTimeoutTests(SimpleTestCase):
+    def test_private_cache_uses_short_timeout(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertEqual(caching.tree_timeout(), caching.LOCAL_TREE_TIMEOUT)
+
+    def test_shared_cache_uses_full_timeout(self):
+        shared = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/tree-cache-test"}
+        with override_settings(CACHES={"default": shared}):
+            self.assertEqual(caching.tree_timeout(), caching.TREE_TIMEOUT)
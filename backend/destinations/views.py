@@ -1,4 +1,3 @@
-from django.db.models import Avg
 from rest_framework import generics
 from rest_framework.generics import ListAPIView
 from django.db.models import Q
@@ -6,7 +5,7 @@ from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 
 from .models import (
     Region, Country, TravelDeal, Review, Article, FAQ,
@@ -23,6 +22,9 @@ from .serializers import (
     PlaceSerializer, TravelDealIncludedSerializer
 )
 from .permissions import IsSuperUserOrReadOnly
+from .caching import cached_tree, conditional_response
+from .pricing import parse_price
+from .search import search_deals
 
 # ================================
 # Region Views
@@ -46,11 +48,35 @@ class CountryListCreateAPIView(generics.ListCreateAPIView):
     permission_classes = [IsSuperUserOrReadOnly]
 
 class CountryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Country.objects.all()
     serializer_class = CountryDetailSerializer
     permission_classes = [IsSuperUserOrReadOnly]
     lookup_field = 'slug'
 
+    def get_sections(self):
+        """
+        Sections requested with ?include=deals,faqs,... (all of them by default)
+        so the first paint only pays for what it shows.
+        """
+        include = self.request.query_params.get("include")
+        if include is None:
+            return CountryDetailSerializer.SECTIONS
+        sections = {name.strip() for name in include.split(",") if name.strip()}
+        unknown = sections - set(CountryDetailSerializer.SECTIONS)
+        if unknown:
+            raise ValidationError({
+                "include": f"Unknown sections: {', '.join(sorted(unknown))}. "
+                           f"Choose from: {', '.join(CountryDetailSerializer.SECTIONS)}."
+            })
+        return sections
+
+    def get_queryset(self):
+        return Country.objects.for_detail(self.get_sections())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sections'] = self.get_sections()
+        return context
+
 # ================================
 # Travel Deal Views
 # ================================
@@ -59,12 +85,12 @@ class TravelDealListAPIView(generics.ListAPIView):
     permission_classes = [IsSuperUserOrReadOnly]
 
     def get_queryset(self):
-        qs = TravelDeal.objects.all()
+        qs = TravelDeal.objects.for_listing()
 
         filter_type = self.request.query_params.get("filter", "").lower()
         if filter_type == "popular":
-            # annotate average rating and order descending
-            qs = qs.annotate(avg_rating=Avg("reviews__rating")).order_by("-avg_rating", "-id")
+            # stored rating columns, served by traveldeal_popular_idx
+            qs = qs.order_by("-rating_avg", "-id")
         elif filter_type == "new":
             # order by newest (assuming 'id' or created timestamp available)
             qs = qs.order_by("-id")
@@ -80,7 +106,7 @@ class TravelDealListCreateAPIView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         country_slug = self.kwargs.get('slug')
-        return TravelDeal.objects.filter(country__slug=country_slug)
+        return TravelDeal.objects.for_listing().filter(country__slug=country_slug)
 
 class TravelDealRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = TravelDealSerializer
@@ -89,7 +115,7 @@ class TravelDealRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIVi
 
     def get_queryset(self):
         country_slug = self.kwargs.get('country_slug')
-        return TravelDeal.objects.filter(country__slug=country_slug)
+        return TravelDeal.objects.for_listing().filter(country__slug=country_slug)
 
 class TravelDealIncludedRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
     serializer_class = TravelDealIncludedSerializer
@@ -215,6 +241,11 @@ class DestinationsAPIView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
+        data, etag = cached_tree("destinations", self.build_tree)
+        return conditional_response(request, data, etag)
+
+    @staticmethod
+    def build_tree():
         regions = Region.objects.prefetch_related('countries').all()
         data = {"regions": []}
         for region in regions:
@@ -223,7 +254,7 @@ class DestinationsAPIView(APIView):
                 "region_name": region.name,
                 "countries": countries
             })
-        return Response(data)
+        return data
 
 # ================================
 # Travel Type Views
@@ -376,7 +407,7 @@ class TravelDealSearchAPIView(ListAPIView):
     serializer_class = TravelDealSerializer
 
     def get_queryset(self):
-        queryset = TravelDeal.objects.all()
+        queryset = TravelDeal.objects.for_listing()
         request = self.request
 
         # Query params
@@ -391,18 +422,23 @@ class TravelDealSearchAPIView(ListAPIView):
         theme = request.query_params.getlist("theme")
         query = request.query_params.get("query")
         region = request.query_params.get("region")  # ✅ NEW
+        sort = request.query_params.get("sort")
 
         # Filter by region
         if region:
             queryset = queryset.filter(country__region__id=region)
 
-        # Filter by search query
+        # Filter by search query, ranked by the full-text index when available
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(country__name__icontains=query)
-            )
+            ranked = search_deals(queryset, query)
+            if ranked is None:
+                queryset = queryset.filter(
+                    Q(title__icontains=query) |
+                    Q(description__icontains=query) |
+                    Q(country__name__icontains=query)
+                )
+            else:
+                queryset = ranked.order_by("-search_rank", "id")
 
         # Filter by date range
         if start_date and end_date:
@@ -417,11 +453,13 @@ class TravelDealSearchAPIView(ListAPIView):
         if max_duration:
             queryset = queryset.filter(days__lte=max_duration)
 
-        # Filter by price range
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
+        # Filter by price range (numeric column, served by traveldeal_price_idx)
+        min_price = parse_price(min_price)
+        max_price = parse_price(max_price)
+        if min_price is not None:
+            queryset = queryset.filter(price_amount__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price_amount__lte=max_price)
 
         # Filter by sale
         if sale == "true":
@@ -433,6 +471,12 @@ class TravelDealSearchAPIView(ListAPIView):
         if theme:
             queryset = queryset.filter(themes__overlap=theme)
 
+        # Sort by price
+        if sort == "price_asc":
+            queryset = queryset.order_by("price_amount", "id")
+        elif sort == "price_desc":
+            queryset = queryset.order_by("-price_amount", "-id")
+
         return queryset
 
 
@@ -441,7 +485,7 @@ class GroupTourListView(generics.ListAPIView):
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        return TravelDeal.objects.filter(style__iexact="group")
+        return TravelDeal.objects.for_listing().filter(style__iexact="group")
     
     
 @api_view(['GET'])
@@ -473,6 +517,9 @@ class RegionWithCountriesView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        regions = Region.objects.prefetch_related("countries").all()
-        data = RegionSerializer(regions, many=True, context={"request": request}).data
-        return Response(data)
\ No newline at end of file
+        def build_tree():
+            regions = Region.objects.prefetch_related("countries").all()
+            return RegionSerializer(regions, many=True, context={"request": request}).data
+
+        data, etag = cached_tree("regions-with-countries", build_tree, request)
+        return conditional_response(request, data, etag)
\ No newline at end of file
@@ -1,6 +1,8 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils.timezone import localtime
+from . import inventory, invoices
 from .models import Booking, BookingLocation
 
 
@@ -148,22 +150,42 @@ class BookingAdmin(admin.ModelAdmin):
         return '-'
     canceled_at_display.short_description = 'Canceled At'
 
-    actions = ['mark_as_confirmed', 'mark_as_canceled']
+    actions = ['mark_as_confirmed', 'mark_as_canceled', 'export_invoices']
 
     def mark_as_confirmed(self, request, queryset):
-        updated = queryset.update(status='confirmed')
+        updated, sold_out = 0, []
+        for booking in queryset:
+            try:
+                with transaction.atomic():
+                    inventory.confirm_seats(booking)
+                    Booking.objects.filter(pk=booking.pk).update(status='confirmed', canceled_at=None)
+            except inventory.InsufficientCapacity:
+                sold_out.append(booking.pk)
+            else:
+                updated += 1
         self.message_user(request, f"{updated} booking(s) marked as confirmed.")
+        if sold_out:
+            self.message_user(
+                request,
+                f"Not enough seats left to confirm booking(s) {', '.join(map(str, sold_out))}.",
+                level=messages.ERROR,
+            )
     mark_as_confirmed.short_description = "Mark selected bookings as confirmed"
 
     def mark_as_canceled(self, request, queryset):
         updated = 0
         for booking in queryset:
-            if booking.can_be_canceled():
-                booking.cancel()
-                updated += 1
+            with transaction.atomic():
+                if inventory.cancel_booking(booking):
+                    updated += 1
         self.message_user(request, f"{updated} booking(s) canceled.")
     mark_as_canceled.short_description = "Cancel selected bookings"
 
+    def export_invoices(self, request, queryset):
+        bookings = queryset.select_related('travel_deal', 'date_option').order_by('id')
+        return invoices.invoice_export_response(bookings.iterator(chunk_size=500), "invoices.zip")
+    export_invoices.short_description = "Download invoices of selected bookings (ZIP)"
+
 
 @admin.register(BookingLocation)
 class BookingLocationAdmin(admin.ModelAdmin):
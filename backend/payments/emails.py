@@ -1,5 +1,5 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from utils.mail import queue_mail
 
 
 def send_booking_success_email(booking):
@@ -23,12 +23,11 @@ Golden Travel Team
 {settings.DEFAULT_FROM_EMAIL}
 """
 
-    send_mail(
+    queue_mail(
         subject,
         message,
         settings.DEFAULT_FROM_EMAIL,
         [to_email],
-        fail_silently=False,
     )
 
 
@@ -50,10 +49,9 @@ Golden Travel Team
 {settings.DEFAULT_FROM_EMAIL}
 """
 
-    send_mail(
+    queue_mail(
         subject,
         message,
         settings.DEFAULT_FROM_EMAIL,
         [to_email],
-        fail_silently=False,
     )
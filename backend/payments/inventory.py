@@ -0,0 +1,140 @@
+"""
+Seat inventory for travel deal departures.
+
+Capacity is only ever changed with a single conditional UPDATE
+(``capacity = capacity - n WHERE capacity >= n``), so concurrent checkouts
+cannot oversell a departure and no row has to be read and written back.
+Callers wrap these helpers in ``transaction.atomic`` together with the
+booking write they belong to.
+
+Pending bookings hold their seats for BOOKING_HOLD_MINUTES through a
+SeatHold row; paying turns the hold into a sale and
+release_expired_holds() gives unpaid seats back.
+
+Every path that changes a booking's seats after it was created locks the
+booking row first, then its hold, then the departure, so paying, canceling,
+editing and reaping the same booking serialize instead of deadlocking.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from destinations.models import TravelDealDate
+from .models import Booking, SeatHold
+
+
+class InsufficientCapacity(Exception):
+    pass
+
+
+def reserve_seats(date_option_id, seats):
+    """
+    Take `seats` from the departure, raising InsufficientCapacity when fewer
+    are left.
+    """
+    updated = TravelDealDate.objects.filter(
+        pk=date_option_id, capacity__gte=seats
+    ).update(capacity=F('capacity') - seats)
+    if not updated:
+        raise InsufficientCapacity(date_option_id)
+
+
+def release_seats(date_option_id, seats):
+    TravelDealDate.objects.filter(pk=date_option_id).update(capacity=F('capacity') + seats)
+
+
+def hold_seats(booking):
+    """Hold the seats already reserved for a new booking until it is paid."""
+    return SeatHold.objects.create(
+        booking=booking,
+        date_option_id=booking.date_option_id,
+        seats=booking.travellers,
+        expires_at=timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES),
+    )
+
+
+def _lock_status(booking):
+    return Booking.objects.select_for_update().filter(pk=booking.pk).values_list('status', flat=True).get()
+
+
+def move_seats(booking, date_option, travellers):
+    """Move a booking's seats to another departure and/or party size."""
+    if date_option.pk == booking.date_option_id and travellers == booking.travellers:
+        return
+    # Canceled and completed bookings no longer hold seats
+    if _lock_status(booking) in ("completed", "canceled"):
+        return
+    release_seats(booking.date_option_id, booking.travellers)
+    reserve_seats(date_option.pk, travellers)
+    SeatHold.objects.filter(booking=booking).update(date_option=date_option, seats=travellers)
+
+
+def confirm_seats(booking):
+    """
+    Turn the booking's hold into a sale; the caller then saves the booking as
+    confirmed in the same transaction. When the hold already expired and the
+    booking was canceled, its seats are taken again; this raises
+    InsufficientCapacity if the departure sold out in the meantime.
+    """
+    status = _lock_status(booking)
+    SeatHold.objects.filter(booking=booking).delete()
+    if status == "canceled":
+        reserve_seats(booking.date_option_id, booking.travellers)
+        booking.canceled_at = None
+
+
+def release_expired_holds(now=None, batch_size=500):
+    """
+    Cancel pending bookings whose hold has expired and give their seats back,
+    one UPDATE per departure. Returns the number of bookings canceled.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            # Only bookings still pending once locked lose their seats;
+            # skip_locked leaves those being paid or canceled right now
+            bookings = list(
+                Booking.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(status="pending", seat_hold__expires_at__lte=now)
+                .values_list('pk', 'date_option_id', 'travellers')[:batch_size]
+            )
+            if not bookings:
+                break
+            booking_ids = [pk for pk, _, _ in bookings]
+            Booking.objects.filter(pk__in=booking_ids).update(status="canceled", canceled_at=now)
+            SeatHold.objects.filter(booking_id__in=booking_ids).delete()
+            seats = Counter()
+            for _, date_option_id, travellers in bookings:
+                seats[date_option_id] += travellers
+            for date_option_id, count in seats.items():
+                release_seats(date_option_id, count)
+        released += len(bookings)
+
+    # Holds left behind by bookings that were confirmed or canceled some other
+    # way; their seats were already sold or given back
+    SeatHold.objects.filter(expires_at__lte=now).exclude(booking__status="pending").delete()
+    return released
+
+
+def cancel_booking(booking):
+    """
+    Cancel the booking and give its seats back. The status change is itself
+    conditional, so a booking canceled twice concurrently only releases its
+    seats once. Returns False when the booking could not be canceled.
+    """
+    canceled_at = timezone.now()
+    updated = Booking.objects.filter(pk=booking.pk).exclude(
+        status__in=["completed", "canceled"]
+    ).update(status="canceled", canceled_at=canceled_at)
+    if not updated:
+        return False
+    SeatHold.objects.filter(booking=booking).delete()
+    release_seats(booking.date_option_id, booking.travellers)
+    booking.status = "canceled"
+    booking.canceled_at = canceled_at
+    return True
@@ -0,0 +1,286 @@
+"""
+Invoice PDFs.
+
+An invoice is rendered from invoice_context(), a plain dict of the booking
+fields it shows, and stored once under MEDIA_ROOT/invoices/<booking id>/
+named after a hash of that dict. Any change to an invoice-relevant field
+yields a new name, so stale files are never served and unchanged bookings
+are never re-rendered. Rendering happens in a background thread when a
+payment is confirmed; download_invoice only renders on a cache miss.
+
+Bulk exports (stream_invoice_zip) reuse cached files and render the misses
+in a process pool, streaming the ZIP as it is built.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes so existing files are re-rendered
+LAYOUT_VERSION = 1
+INVOICE_DIR = 'invoices'
+
+
+def invoice_context(booking):
+    """Everything printed on the invoice, as plain strings."""
+    date_option = booking.date_option
+    return {
+        'layout': LAYOUT_VERSION,
+        'id': booking.id,
+        'status': booking.status,
+        'created_at': booking.created_at.strftime('%Y-%m-%d %H:%M'),
+        'payment_status': booking.payment_status,
+        'payment_method': booking.payment_method or 'N/A',
+        'transaction_id': booking.transaction_id or 'N/A',
+        'payment_date': booking.payment_date.strftime('%Y-%m-%d %H:%M') if booking.payment_date else 'N/A',
+        'payment_amount': str(booking.payment_amount or 'N/A'),
+        'full_name': booking.full_name,
+        'email': booking.email,
+        'phone': booking.phone,
+        'address_line1': booking.address_line1,
+        'address_line2': booking.address_line2 or '',
+        'town': booking.town,
+        'state': booking.state,
+        'postcode': booking.postcode,
+        'country': booking.country,
+        'travel_deal': booking.travel_deal.title if booking.travel_deal else 'N/A',
+        'start_date': date_option.start_date.strftime('%Y-%m-%d') if date_option else 'N/A',
+        'end_date': date_option.end_date.strftime('%Y-%m-%d') if date_option else 'N/A',
+        'travellers': booking.travellers,
+        'room_option': booking.room_option.capitalize() if booking.room_option else 'N/A',
+        'add_transfer': 'Yes' if booking.add_transfer else 'No',
+        'add_nights': 'Yes' if booking.add_nights else 'No',
+        'flight_help': 'Yes' if booking.flight_help else 'No',
+        'donation': 'Yes' if booking.donation else 'No',
+    }
+
+
+def fingerprint(context):
+    payload = json.dumps(context, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def render_invoice_pdf(context):
+    """Render the invoice for `context` and return the PDF bytes."""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    left_margin = 50
+    y = height - 50
+    line_height = 18
+
+    def section(title, lines):
+        nonlocal y
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(left_margin, y, title)
+        y -= line_height
+        p.setFont("Helvetica", 12)
+        for line in lines:
+            p.drawString(left_margin, y, line)
+            y -= line_height
+        y -= line_height
+
+    p.setFont("Helvetica-Bold", 20)
+    p.drawString(left_margin, y, "Booking Invoice")
+    y -= line_height * 2
+
+    section("Order Details", [
+        f"Booking ID: {context['id']}",
+        f"Status: {context['status']}",
+        f"Purchased On: {context['created_at']}",
+        f"Payment Status: {context['payment_status']}",
+        f"Payment Method: {context['payment_method']}",
+        f"Transaction ID: {context['transaction_id']}",
+        f"Payment Date: {context['payment_date']}",
+        f"Amount Paid: ${context['payment_amount']}",
+    ])
+    traveller = [
+        f"Name: {context['full_name']}",
+        f"Email: {context['email']}",
+        f"Phone: {context['phone']}",
+        f"Address Line 1: {context['address_line1']}",
+    ]
+    if context['address_line2']:
+        traveller.append(f"Address Line 2: {context['address_line2']}")
+    traveller += [
+        f"Town: {context['town']}",
+        f"State: {context['state']}",
+        f"Postcode: {context['postcode']}",
+        f"Country: {context['country']}",
+    ]
+    section("Traveller Information", traveller)
+    section("Booking Details", [
+        f"Travel Deal: {context['travel_deal']}",
+        f"Travel Dates: {context['start_date']} to {context['end_date']}",
+        f"Number of Travellers: {context['travellers']}",
+        f"Room Option: {context['room_option']}",
+        f"Add Transfer: {context['add_transfer']}",
+        f"Add Nights: {context['add_nights']}",
+        f"Flight Help: {context['flight_help']}",
+        f"Donation: {context['donation']}",
+    ])
+
+    p.setFont("Helvetica-Oblique", 10)
+    p.drawString(left_margin, y, "Thank you for booking with us! Please contact support if you have any questions.")
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+# -------------------------
+# File cache
+# -------------------------
+def invoice_path(booking_id, digest):
+    return os.path.join(settings.MEDIA_ROOT, INVOICE_DIR, str(booking_id), f'{digest}.pdf')
+
+
+def store_invoice(booking_id, digest, pdf):
+    """Write the PDF atomically and drop the booking's older invoice files."""
+    path = invoice_path(booking_id, digest)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(pdf)
+    os.replace(tmp_path, path)
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def get_invoice(booking):
+    """
+    Return (path, digest) of the booking's current invoice, rendering it now
+    if the cached file is missing or out of date.
+    """
+    context = invoice_context(booking)
+    digest = fingerprint(context)
+    path = invoice_path(booking.id, digest)
+    if not os.path.exists(path):
+        path = store_invoice(booking.id, digest, render_invoice_pdf(context))
+    return path, digest
+
+
+# -------------------------
+# Background rendering
+# -------------------------
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='invoices')
+
+
+def render_in_background(booking_id):
+    """Render the booking's invoice off the request thread once the transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_render, booking_id))
+
+
+def _render(booking_id):
+    from .models import Booking
+
+    try:
+        booking = Booking.objects.select_related('travel_deal', 'date_option').get(pk=booking_id)
+        get_invoice(booking)
+    except Booking.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Rendering the invoice of booking %s failed", booking_id)
+    finally:
+        connection.close()
+
+
+# -------------------------
+# Bulk export
+# -------------------------
+def iter_invoice_files(bookings, max_workers=None):
+    """
+    Yield (filename, pdf bytes) for each booking, in order. Cached invoices
+    are read from disk; missing ones are rendered in a process pool (and
+    cached), with at most a few per worker in flight so memory stays flat.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    window = max_workers * 4
+    pending = deque()
+    executor = None
+
+    def resolve(booking_id, digest, item):
+        if isinstance(item, str):
+            with open(item, 'rb') as f:
+                pdf = f.read()
+        else:
+            pdf = item.result()
+            store_invoice(booking_id, digest, pdf)
+        return f'invoice_{booking_id}.pdf', pdf
+
+    try:
+        for booking in bookings:
+            context = invoice_context(booking)
+            digest = fingerprint(context)
+            path = invoice_path(booking.id, digest)
+            if os.path.exists(path):
+                item = path
+            else:
+                if executor is None:
+                    # spawn: the web process runs background threads, which fork does not mix with
+                    executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+                item = executor.submit(render_invoice_pdf, context)
+            pending.append((booking.id, digest, item))
+            if len(pending) >= window:
+                yield resolve(*pending.popleft())
+        while pending:
+            yield resolve(*pending.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _ChunkBuffer:
+    """Write-only, unseekable sink: ZipFile then streams with data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_invoice_zip(bookings, max_workers=None):
+    """Generate a ZIP of the bookings' invoices chunk by chunk."""
+    buffer = _ChunkBuffer()
+    # PDFs are already compressed, so entries are stored as they are
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, pdf in iter_invoice_files(bookings, max_workers):
+            archive.writestr(filename, pdf)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def invoice_export_response(bookings, filename):
+    response = StreamingHttpResponse(stream_invoice_zip(bookings), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
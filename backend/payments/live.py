@@ -0,0 +1,89 @@
+"""
+Live booking locations.
+
+send_location and the batch endpoint publish new points on the booking's
+channel once their transaction commits; the SSE view in payments.views
+subscribes to it. The broker is pluggable through LIVE_LOCATION_BROKER: the
+default InProcessBroker only reaches watchers connected to the same server
+process, so multi-process deployments plug in a shared one (e.g. Redis
+pub/sub) implementing the same publish()/subscribe() interface.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """Messages of one channel for one watcher; get() waits for the next one."""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        # Runs on the watcher's event loop. A watcher that falls behind loses
+        # its oldest points rather than growing the queue without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        """Thread-safe; callable from sync views."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The watcher's loop is gone; its view will unsubscribe
+                pass
+
+    def subscribe(self, channel):
+        """Must be called from the watcher's event loop."""
+        subscription = Subscription(self, channel, self.maxsize)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.LIVE_LOCATION_BROKER)()
+
+
+def booking_channel(booking_id):
+    return f'booking-locations:{booking_id}'
+
+
+def publish_locations(booking_id, points):
+    """Publish serialized points to the booking's watchers after commit."""
+    if points:
+        transaction.on_commit(lambda: get_broker().publish(booking_channel(booking_id), points))
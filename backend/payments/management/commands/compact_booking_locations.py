@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments import tracking
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll GPS points older than --compact-after-days into compressed daily segments "
+        "and delete tracks older than --retention-days. Meant to run daily from a scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact-after-days', type=int, default=settings.BOOKING_LOCATION_COMPACT_AFTER_DAYS)
+        parser.add_argument('--retention-days', type=int, default=settings.BOOKING_LOCATION_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        # Whole days only, so a day is compacted once rather than piecemeal
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        raw, segments = tracking.purge_locations(today - timedelta(days=options['retention_days']))
+        self.stdout.write(f"Deleted {raw} point(s) and {segments} segment(s) past retention.")
+
+        points, bookings = tracking.compact_locations(today - timedelta(days=options['compact_after_days']))
+        self.stdout.write(self.style.SUCCESS(f"Compacted {points} point(s) from {bookings} booking(s)."))
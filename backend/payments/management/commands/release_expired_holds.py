@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel pending bookings whose seat hold has expired and return the seats "
+        "to their departures. Run it from a scheduler, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, releasing holds every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=60.0)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            released = inventory.release_expired_holds(batch_size=options['batch_size'])
+            if released or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat hold(s)."))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('destinations', '0027_traveldeal_best_discount_percent_and_more'),
+        ('payments', '0007_remove_booking_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seats', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seat_hold', to='payments.booking')),
+                ('date_option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='destinations.traveldealdate')),
+            ],
+        ),
+    ]
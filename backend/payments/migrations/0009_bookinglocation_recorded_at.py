@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:08
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_received_time(apps, schema_editor):
+    # Existing fixes were never timestamped by the client
+    BookingLocation = apps.get_model('payments', 'BookingLocation')
+    BookingLocation.objects.update(recorded_at=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_seathold'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bookinglocation',
+            options={'ordering': ['recorded_at']},
+        ),
+        migrations.AddField(
+            model_name='bookinglocation',
+            name='recorded_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_received_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bookinglocation',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='bookinglocation',
+            constraint=models.UniqueConstraint(fields=('booking', 'recorded_at'), name='bookinglocation_unique_fix'),
+        ),
+    ]
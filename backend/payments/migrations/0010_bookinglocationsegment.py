@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_bookinglocation_recorded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLocationSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['booking', 'day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookinglocation',
+            index=models.Index(fields=['recorded_at'], name='bookinglocation_recorded_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookinglocationsegment',
+            name='booking',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_segments', to='payments.booking'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinglocationsegment',
+            index=models.Index(fields=['day'], name='locationsegment_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookinglocationsegment',
+            constraint=models.UniqueConstraint(fields=('booking', 'day'), name='bookinglocationsegment_unique_day'),
+        ),
+    ]
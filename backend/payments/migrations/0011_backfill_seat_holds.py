@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def hold_pending_bookings(apps, schema_editor):
+    # Bookings made before seat holds existed already took their seats; give
+    # them a full hold from now so that unpaid ones expire like any other
+    Booking = apps.get_model('payments', 'Booking')
+    SeatHold = apps.get_model('payments', 'SeatHold')
+    expires_at = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    bookings = Booking.objects.filter(status='pending', seat_hold__isnull=True)
+    SeatHold.objects.bulk_create(
+        (
+            SeatHold(booking_id=pk, date_option_id=date_option_id, seats=travellers, expires_at=expires_at)
+            for pk, date_option_id, travellers in bookings.values_list('pk', 'date_option_id', 'travellers').iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_bookinglocationsegment'),
+    ]
+
+    operations = [
+        migrations.RunPython(hold_pending_bookings, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,21 @@
 from django.db import models
+from django.db.models import Prefetch
 from django.conf import settings
 from destinations.models import TravelDeal, TravelDealDate
 from django.utils import timezone
 
 
+class BookingQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Prefetch the nested deal with TravelDeal.objects.for_listing() so that
+        BookingSerializer does not fall into per-booking deal queries.
+        """
+        return self.select_related('date_option', 'seat_hold').prefetch_related(
+            Prefetch('travel_deal', queryset=TravelDeal.objects.for_listing())
+        )
+
+
 class Booking(models.Model):
     PAYMENT_METHODS = [
         ("stripe", "Stripe"),
@@ -66,6 +78,8 @@ class Booking(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BookingQuerySet.as_manager()
+
     def can_be_canceled(self):
         return self.status not in ["completed", "canceled"]
 
@@ -78,14 +92,63 @@ class Booking(models.Model):
     def __str__(self):
         return f"Booking by {self.user} - {self.travel_deal.title} - {self.date_option.start_date}"
 
+class SeatHold(models.Model):
+    """
+    Seats taken by a pending booking until it is paid. Expired holds are
+    released in bulk by payments.inventory.release_expired_holds().
+    """
+    booking = models.OneToOneField(Booking, related_name='seat_hold', on_delete=models.CASCADE)
+    date_option = models.ForeignKey(TravelDealDate, related_name='seat_holds', on_delete=models.CASCADE)
+    seats = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.seats} seat(s) for booking {self.booking_id} until {self.expires_at}"
+
 class BookingLocation(models.Model):
     booking = models.ForeignKey(Booking, related_name='locations', on_delete=models.CASCADE)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # When the device took the fix; `timestamp` is when the server received it
+    recorded_at = models.DateTimeField(default=timezone.now)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['timestamp']
+        ordering = ['recorded_at']
+        constraints = [
+            # Makes retried uploads idempotent
+            models.UniqueConstraint(fields=['booking', 'recorded_at'], name='bookinglocation_unique_fix'),
+        ]
+        indexes = [
+            # Compaction and retention select old points across all bookings
+            models.Index(fields=['recorded_at'], name='bookinglocation_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.booking.id} @ ({self.latitude}, {self.longitude}) at {self.timestamp}"
+
+class BookingLocationSegment(models.Model):
+    """
+    One day of a booking's track, compacted from BookingLocation rows by
+    `manage.py compact_booking_locations` (see payments.tracking for the
+    encoding).
+    """
+    booking = models.ForeignKey(Booking, related_name='location_segments', on_delete=models.CASCADE)
+    day = models.DateField()
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['booking', 'day']
+        constraints = [
+            models.UniqueConstraint(fields=['booking', 'day'], name='bookinglocationsegment_unique_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='locationsegment_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.booking_id} on {self.day} ({self.point_count} points)"
@@ -19,6 +19,9 @@ class BookingSerializer(serializers.ModelSerializer):
         source='date_option'
     )
 
+    # Payment deadline of a pending booking
+    hold_expires_at = serializers.DateTimeField(source='seat_hold.expires_at', read_only=True, allow_null=True)
+
     class Meta:
         model = Booking
         fields = [
@@ -61,6 +64,7 @@ class BookingSerializer(serializers.ModelSerializer):
 
             # Booking status and timestamps
             'status',
+            'hold_expires_at',
             'created_at',
         ]
         read_only_fields = [
@@ -78,6 +82,7 @@ class BookingSerializer(serializers.ModelSerializer):
         date_option = data.get('date_option') if 'date_option' in data else (instance.date_option if instance else None)
         travellers = data.get('travellers') if 'travellers' in data else (instance.travellers if instance else None)
 
+        # Early feedback only: seats are taken atomically by payments.inventory
         # Only validate capacity if creating or updating date_option or travellers
         if (instance is None) or ('date_option' in data) or ('travellers' in data):
             if date_option is not None and travellers is not None:
@@ -87,12 +92,21 @@ class BookingSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        # No capacity reduction here (should be done in view)
+        # No capacity reduction here (done in the view via payments.inventory)
         return super().create(validated_data)
 
 
 class BookingLocationSerializer(serializers.ModelSerializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    recorded_at = serializers.DateTimeField(required=False)
+
     class Meta:
         model = BookingLocation
-        fields = ['id', 'latitude', 'longitude', 'timestamp']
-        read_only_fields = ['id', 'timestamp']
\ No newline at end of file
+        fields = ['id', 'latitude', 'longitude', 'recorded_at', 'timestamp']
+        read_only_fields = ['id', 'timestamp']
+
+
+class BookingLocationBatchSerializer(BookingLocationSerializer):
+    # Batched points must carry the device time: it orders and deduplicates them
+    recorded_at = serializers.DateTimeField()
\ No newline at end of file
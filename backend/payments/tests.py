@@ -1,3 +1,570 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from destinations.models import Region, Country, TravelDeal, TravelDealDate
+from . import inventory, invoices, live, tracking
+from .models import Booking, BookingLocation, BookingLocationSegment, SeatHold
+from .views import stream_locations
+
+
+def create_departure(capacity, title="Inventory deal"):
+    region, _ = Region.objects.get_or_create(name="Inventory region")
+    country, _ = Country.objects.get_or_create(region=region, name="Inventory country")
+    deal = TravelDeal.objects.create(country=country, title=title, days=7, price="1000")
+    return TravelDealDate.objects.create(
+        travel_deal=deal, start_date="2030-01-01", end_date="2030-01-08", language="English",
+        rooms="Shared", original_price="1000", discounted_price="1000", capacity=capacity,
+    )
+
+
+def booking_payload(date_option, travellers):
+    return {
+        "travel_deal_id": date_option.travel_deal_id, "date_option_id": date_option.pk, "travellers": travellers,
+        "full_name": "Test Traveller", "email": "traveller@example.com", "phone": "0", "address_line1": "-",
+        "town": "-", "state": "-", "postcode": "-", "country": "-",
+    }
+
+
+def create_booking(user, travellers=1):
+    date_option = create_departure(10)
+    details = {key: value for key, value in booking_payload(date_option, travellers).items() if not key.endswith("_id")}
+    return Booking.objects.create(
+        user=user, travel_deal_id=date_option.travel_deal_id, date_option=date_option, **details
+    )
+
+
+def run_concurrently(func, items):
+    """Call func(item) for every item from its own thread, all released at once."""
+    barrier = threading.Barrier(len(items))
+
+    def worker(item):
+        try:
+            barrier.wait()
+            return func(item)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(worker, items))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    CAPACITY = 20
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("needs a file-backed test database (DATABASES['default']['TEST']['NAME'])")
+        self.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        self.date_option = create_departure(self.CAPACITY)
+
+    def seats_accounted_for(self):
+        remaining = TravelDealDate.objects.get(pk=self.date_option.pk).capacity
+        booked = sum(
+            Booking.objects.filter(date_option=self.date_option).exclude(status="canceled")
+            .values_list("travellers", flat=True)
+        )
+        return remaining, booked
+
+    def book(self, travellers):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post(
+            reverse("booking-create"), booking_payload(self.date_option, travellers), format="json"
+        ).status_code
+
+    def test_simultaneous_bookings_never_oversell(self):
+        results = run_concurrently(self.book, [2] * 16)
+
+        self.assertEqual(sorted(set(results)), [201, 400])
+        self.assertEqual(results.count(201), self.CAPACITY // 2)
+        self.assertEqual(self.seats_accounted_for(), (0, self.CAPACITY))
+
+    def test_simultaneous_cancellations_release_seats_once(self):
+        for _ in range(5):
+            self.assertEqual(self.book(2), 201)
+        bookings = list(Booking.objects.filter(date_option=self.date_option))
+
+        def cancel(booking):
+            with transaction.atomic():
+                return inventory.cancel_booking(booking)
+
+        results = run_concurrently(cancel, bookings * 2)
+
+        self.assertEqual(results.count(True), len(bookings))
+        self.assertEqual(self.seats_accounted_for(), (self.CAPACITY, 0))
+
+
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        self.date_option = create_departure(10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, travellers=2):
+        response = self.client.post(
+            reverse("booking-create"), booking_payload(self.date_option, travellers), format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        return Booking.objects.get(pk=response.data["id"])
+
+    def capacity(self):
+        return TravelDealDate.objects.get(pk=self.date_option.pk).capacity
+
+    def expire(self, booking):
+        SeatHold.objects.filter(booking=booking).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def test_booking_takes_and_holds_seats(self):
+        booking = self.book(3)
+        self.assertEqual(self.capacity(), 7)
+        self.assertEqual(booking.seat_hold.seats, 3)
+        self.assertGreater(booking.seat_hold.expires_at, timezone.now())
+
+    def test_reaper_releases_expired_pending_bookings(self):
+        expired, held = self.book(2), self.book(3)
+        self.expire(expired)
+
+        self.assertEqual(inventory.release_expired_holds(), 1)
+
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, "canceled")
+        self.assertIsNotNone(expired.canceled_at)
+        self.assertFalse(SeatHold.objects.filter(booking=expired).exists())
+        self.assertTrue(SeatHold.objects.filter(booking=held).exists())
+        self.assertEqual(self.capacity(), 7)
+
+    def test_reaper_keeps_seats_of_bookings_no_longer_pending(self):
+        confirmed, canceled = self.book(2), self.book(3)
+        with transaction.atomic():
+            inventory.cancel_booking(canceled)
+        # Holds left behind, as the old admin action used to do
+        Booking.objects.filter(pk=confirmed.pk).update(status="confirmed")
+        SeatHold.objects.create(
+            booking=canceled, date_option=self.date_option, seats=3, expires_at=timezone.now()
+        )
+        self.expire(confirmed)
+        self.expire(canceled)
+
+        self.assertEqual(inventory.release_expired_holds(), 0)
+        self.assertEqual(self.capacity(), 8)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_cancel_releases_seats_once(self):
+        booking = self.book(4)
+        with transaction.atomic():
+            self.assertTrue(inventory.cancel_booking(booking))
+        with transaction.atomic():
+            self.assertFalse(inventory.cancel_booking(Booking.objects.get(pk=booking.pk)))
+        self.assertEqual(self.capacity(), 10)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_payment_turns_hold_into_sale(self):
+        booking = self.book(2)
+        with transaction.atomic():
+            inventory.confirm_seats(booking)
+        self.assertEqual(self.capacity(), 8)
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(inventory.release_expired_holds(now=timezone.now() + timedelta(days=1)), 0)
+
+    def test_payment_after_expiry_takes_seats_again(self):
+        booking = self.book(2)
+        self.expire(booking)
+        inventory.release_expired_holds()
+        self.assertEqual(self.capacity(), 10)
+
+        with transaction.atomic():
+            inventory.confirm_seats(Booking.objects.get(pk=booking.pk))
+        self.assertEqual(self.capacity(), 8)
+
+    def test_payment_after_expiry_fails_when_sold_out(self):
+        booking = self.book(2)
+        self.expire(booking)
+        inventory.release_expired_holds()
+        self.book(10)
+
+        with self.assertRaises(inventory.InsufficientCapacity), transaction.atomic():
+            inventory.confirm_seats(Booking.objects.get(pk=booking.pk))
+        self.assertEqual(self.capacity(), 0)
+
+    def test_admin_confirm_retakes_seats_of_reaped_booking(self):
+        reaped, sold_out = self.book(2), self.book(5)
+        self.expire(reaped)
+        self.expire(sold_out)
+        inventory.release_expired_holds()
+        self.book(7)
+        admin = get_user_model().objects.create_superuser(username="admin", email="admin@example.com", password="x")
+        self.client.force_login(admin)
+
+        self.client.post(
+            reverse("admin:payments_booking_changelist"),
+            {"action": "mark_as_confirmed", "_selected_action": [reaped.pk, sold_out.pk]},
+        )
+
+        reaped.refresh_from_db()
+        sold_out.refresh_from_db()
+        self.assertEqual((reaped.status, reaped.canceled_at), ("confirmed", None))
+        self.assertEqual(sold_out.status, "canceled")
+        self.assertEqual(self.capacity(), 1)
+
+
+class LiveLocationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        self.booking = create_booking(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def point(self, minute):
+        return {"latitude": 27.7, "longitude": 85.3, "recorded_at": f"2030-01-01T10:{minute:02d}:00Z"}
+
+    def upload(self, minutes):
+        published = []
+        with mock.patch.object(live.get_broker(), "publish", lambda channel, points: published.extend(points)):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("send_location_batch", args=[self.booking.pk]),
+                    {"points": [self.point(minute) for minute in minutes]}, format="json",
+                )
+        return response, [point["recorded_at"] for point in published]
+
+    def test_batch_publishes_and_counts_only_new_points(self):
+        response, published = self.upload([1, 2, 3])
+        self.assertEqual((response.status_code, response.data["received"]), (201, 3))
+        self.assertEqual(len(published), 3)
+
+        response, published = self.upload([2, 3, 4, 4])
+        self.assertEqual(response.data, {"received": 1, "duplicates": 3})
+        self.assertEqual(published, ["2030-01-01T10:04:00Z"])
+        self.assertEqual(BookingLocation.objects.filter(booking=self.booking).count(), 4)
+
+        response, published = self.upload([1, 4])
+        self.assertEqual((response.status_code, response.data["received"], published), (200, 0, []))
+
+    async def test_stream_skips_points_already_sent(self):
+        token = str(AccessToken.for_user(self.user))
+        request = RequestFactory().get(f"/stream/?token={token}")
+        response = await stream_locations(request, self.booking.pk)
+        events = response.streaming_content
+        self.assertEqual(await anext(events), b"retry: 3000\n\n")
+
+        channel = live.booking_channel(self.booking.pk)
+        first, second, third = (dict(self.point(minute), id=minute) for minute in (1, 2, 3))
+        live.get_broker().publish(channel, [first, second])
+        # A retried upload publishes a point the watcher already has
+        live.get_broker().publish(channel, [second, third])
+
+        received = []
+        for _ in range(3):
+            event = (await anext(events)).decode()
+            received.append(json.loads(event.split("data: ", 1)[1])["id"])
+        await events.aclose()
+        self.assertEqual(received, [1, 2, 3])
+
+    async def test_stream_resumes_from_a_naive_event_id(self):
+        token = str(AccessToken.for_user(self.user))
+        request = RequestFactory().get(f"/stream/?token={token}&last_event_id=2030-01-01T10:01:00")
+        response = await stream_locations(request, self.booking.pk)
+        events = response.streaming_content
+        self.assertEqual(await anext(events), b"retry: 3000\n\n")
+
+        # Read as the current time zone (UTC), so 10:01 is skipped and 10:02 sent
+        live.get_broker().publish(
+            live.booking_channel(self.booking.pk), [dict(self.point(minute), id=minute) for minute in (1, 2)]
+        )
+        event = (await anext(events)).decode()
+        await events.aclose()
+        self.assertEqual(json.loads(event.split("data: ", 1)[1])["id"], 2)
+
+    async def test_stream_rejects_invalid_event_id(self):
+        token = str(AccessToken.for_user(self.user))
+        for value in ("yesterday", "2030-13-01T00:00:00"):
+            request = RequestFactory().get(f"/stream/?token={token}", headers={"Last-Event-ID": value})
+            response = await stream_locations(request, self.booking.pk)
+            self.assertEqual(response.status_code, 400, value)
+
+
+class LocationHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        cls.booking = create_booking(cls.user)
+        start = timezone.make_aware(timezone.datetime(2030, 1, 1, 10))
+        BookingLocation.objects.bulk_create(
+            BookingLocation(booking=cls.booking, latitude=27.7, longitude=85.3 + i / 100,
+                            recorded_at=start + timedelta(minutes=i))
+            for i in range(6)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def history(self, url=None, **params):
+        return self.client.get(url or reverse("location_history", args=[self.booking.pk]), params)
+
+    def test_plain_request_returns_the_bare_list(self):
+        response = self.history()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual([point["longitude"] for point in response.data], [85.3 + i / 100 for i in range(6)])
+
+        response = self.history(since="2030-01-01T10:04:00Z")
+        self.assertEqual(len(response.data), 2)
+
+    def test_pages_follow_the_cursor(self):
+        first = self.history(limit=4).data
+        self.assertEqual(len(first["results"]), 4)
+        second = self.history(first["next"]).data
+        self.assertEqual((len(second["results"]), second["next"]), (2, None))
+        self.assertEqual(second["results"][0]["recorded_at"], "2030-01-01T10:04:00Z")
+
+    def test_downsampled_window_reports_the_full_count(self):
+        data = self.history(max_points=2).data
+        self.assertEqual(data["count"], 6)
+        self.assertEqual([point["recorded_at"] for point in data["results"]],
+                         ["2030-01-01T10:00:00Z", "2030-01-01T10:05:00Z"])
+
+    def test_invalid_window_is_rejected(self):
+        for value in ("soon", "2030-13-01T00:00:00"):
+            self.assertEqual(self.history(since=value).status_code, 400, value)
+
+
+class TemporaryMediaMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class InvoiceCacheTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        cls.booking = create_booking(cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.booking.refresh_from_db()
+
+    def digest(self):
+        booking = Booking.objects.select_related("travel_deal", "date_option").get(pk=self.booking.pk)
+        return invoices.fingerprint(invoices.invoice_context(booking))
+
+    def download(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(reverse("download-invoice", args=[self.booking.pk]), headers=headers)
+
+    def test_fingerprint_follows_invoice_fields(self):
+        digest = self.digest()
+        self.booking.canceled_at = timezone.now()
+        self.booking.save()
+        self.assertEqual(self.digest(), digest)
+
+        for field, value in (("travellers", 2), ("full_name", "Other Traveller"), ("payment_status", "paid")):
+            setattr(self.booking, field, value)
+            self.booking.save()
+            self.assertNotEqual(self.digest(), digest, field)
+            digest = self.digest()
+
+        TravelDeal.objects.filter(pk=self.booking.travel_deal_id).update(title="Renamed deal")
+        self.assertNotEqual(self.digest(), digest)
+
+    def test_unchanged_booking_is_not_rendered_again(self):
+        with mock.patch.object(invoices, "render_invoice_pdf", wraps=invoices.render_invoice_pdf) as render:
+            first, _ = invoices.get_invoice(self.booking)
+            self.assertEqual(invoices.get_invoice(self.booking)[0], first)
+            self.assertEqual(render.call_count, 1)
+
+            self.booking.travellers = 3
+            second, _ = invoices.get_invoice(self.booking)
+            self.assertEqual(render.call_count, 2)
+        self.assertNotEqual(second, first)
+        self.assertFalse(os.path.exists(first))
+
+    def test_download_revalidates_with_etag(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        etag = response["ETag"]
+        self.assertEqual(etag, f'"{self.digest()}"')
+
+        response = self.download(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        Booking.objects.filter(pk=self.booking.pk).update(payment_status="paid")
+        response = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        b"".join(response.streaming_content)
+
+
+class InvoiceExportTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        cls.bookings = [create_booking(cls.user) for _ in range(3)]
+        paid_at = timezone.make_aware(timezone.datetime(2030, 1, 15, 12))
+        Booking.objects.filter(pk__in=[booking.pk for booking in cls.bookings]).update(
+            payment_status="paid", payment_date=paid_at
+        )
+        create_booking(cls.user)  # still pending
+        cls.staff = get_user_model().objects.create_user(
+            username="staff", email="staff@example.com", password="x", is_staff=True
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(reverse("invoice-export"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_one_invoice_per_booking(self):
+        # One cached on disk, the others rendered by the export
+        invoices.get_invoice(Booking.objects.get(pk=self.bookings[1].pk))
+
+        archive = self.export(**{"from": "2030-01-01", "to": "2030-01-31"})
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), [f"invoice_{booking.pk}.pdf" for booking in self.bookings])
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b"%PDF"), name)
+
+    def test_empty_selection_is_an_empty_archive(self):
+        archive = self.export(**{"from": "2031-01-01"})
+        self.assertEqual(archive.namelist(), [])
+
+    def test_invalid_date_is_rejected(self):
+        response = self.client.get(reverse("invoice-export"), {"to": "January"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TrackEncodingTests(SimpleTestCase):
+    START = timezone.make_aware(timezone.datetime(2030, 1, 1, 10))
+
+    def test_round_trip_at_stored_precision(self):
+        track = [
+            (self.START, 27.7172453, 85.3239605),
+            # Backwards in latitude and longitude, a microsecond step in time
+            (self.START + timedelta(seconds=90, microseconds=1), 27.7170001, 85.32),
+            (self.START + timedelta(seconds=91), -33.8688197, -151.2092955),
+            (self.START + timedelta(days=3), 0.0, 180.0),
+        ]
+        self.assertEqual(tracking.decode_track(tracking.encode_track(track)), track)
+
+        # Finer than 1e-7 degrees is rounded away
+        decoded = tracking.decode_track(tracking.encode_track([(self.START, 27.71724534, -85.32396056)]))
+        self.assertEqual(decoded, [(self.START, 27.7172453, -85.3239606)])
+
+    def test_single_point_and_empty_tracks(self):
+        point = [(self.START, 27.7172453, 85.3239605)]
+        self.assertEqual(tracking.decode_track(tracking.encode_track(point)), point)
+        self.assertEqual(tracking.decode_track(tracking.encode_track([])), [])
+
+    def test_unknown_format_is_rejected(self):
+        data = tracking.encode_track([(self.START, 1.0, 2.0)])
+        with self.assertRaises(ValueError):
+            tracking.decode_track(bytes([data[0] + 1]) + data[1:])
+
+
+class TrackCompactionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="traveller", email="traveller@example.com", password="x"
+        )
+        cls.booking = create_booking(cls.user)
+
+    def setUp(self):
+        day = timezone.make_aware(timezone.datetime(2030, 1, 1))
+        times = (
+            [day + timedelta(hours=10, minutes=i) for i in range(6)]
+            + [day + timedelta(days=1, hours=9, minutes=i) for i in range(2)]
+            + [day + timedelta(days=2, hours=8, minutes=i) for i in range(3)]
+        )
+        self.expected = [((27700 + i) / 1000, (85300 - i) / 1000, recorded_at) for i, recorded_at in enumerate(times)]
+        BookingLocation.objects.bulk_create(
+            BookingLocation(booking=self.booking, latitude=lat, longitude=lon, recorded_at=recorded_at)
+            for lat, lon, recorded_at in self.expected
+        )
+        self.moment = lambda index: self.expected[index][2]
+
+    def test_compacted_days_merge_with_raw_points(self):
+        self.assertEqual(tracking.compact_booking(self.booking.pk, before=self.moment(8)), 8)
+        self.assertEqual(
+            list(BookingLocationSegment.objects.order_by("day").values_list("day", "point_count")),
+            [(self.moment(0).date(), 6), (self.moment(6).date(), 2)],
+        )
+        self.assertEqual(self.booking.locations.count(), 3)
+
+        # A late fix for the compacted day stays raw until the next run
+        late = (27.5, 85.5, self.moment(2) + timedelta(seconds=30))
+        BookingLocation.objects.create(booking=self.booking, latitude=late[0], longitude=late[1], recorded_at=late[2])
+        self.expected.insert(3, late)
+
+        track = tracking.read_track(self.booking)
+        self.assertEqual([point[:3] for point in track], self.expected)
+        self.assertEqual([point[3] is None for point in track], [True] * 3 + [False] + [True] * 5 + [False] * 3)
+
+        tracking.compact_booking(self.booking.pk, before=self.moment(9))
+        self.assertEqual([point[:3] for point in tracking.read_track(self.booking)], self.expected)
+        self.assertEqual(BookingLocationSegment.objects.get(day=self.moment(0).date()).point_count, 7)
+
+    def test_bounds_span_segments_and_raw_points(self):
+        tracking.compact_booking(self.booking.pk, before=self.moment(7))
+        full = tracking.read_track(self.booking)
+        self.assertEqual([point[:3] for point in full], self.expected)
+
+        cases = [
+            {"since": self.moment(4)},
+            {"until": self.moment(8)},
+            {"since": self.moment(5), "until": self.moment(9)},
+            {"after": self.moment(5), "limit": 3},
+            {"after": self.moment(6), "limit": 2},
+            {"since": self.moment(2), "after": self.moment(1), "limit": 4},
+            {"since": self.moment(0), "limit": 20},
+        ]
+        for bounds in cases:
+            with self.subTest(**{key: str(value) for key, value in bounds.items()}):
+                expected = [
+                    point for point in full
+                    if ("since" not in bounds or point[2] >= bounds["since"])
+                    and ("until" not in bounds or point[2] <= bounds["until"])
+                    and ("after" not in bounds or point[2] > bounds["after"])
+                ][:bounds.get("limit")]
+                self.assertEqual(tracking.read_track(self.booking, **bounds), expected)
@@ -0,0 +1,273 @@
+"""
+Helpers for booking GPS tracks.
+
+Storage: recent fixes are BookingLocation rows; older ones are compacted
+into one BookingLocationSegment per booking and day. A segment holds the
+points as (time in microseconds, latitude and longitude in 1e-7 degrees)
+delta-encoded against the previous point, zigzag varint packed and zlib
+compressed, which takes a few bytes per point instead of a full row.
+read_track() merges both so callers never see the difference.
+
+simplify_track() reduces a track to at most `max_points` points with
+Douglas-Peucker: the segment whose farthest point deviates most from its
+chord is split first, so the points kept are the ones that matter most for
+the shape of the route. Very long tracks are first thinned in one linear
+pass that keeps, per small run of points, the one deviating most from the
+run's chord, so spikes survive while the global pass stays cheap.
+"""
+import heapq
+import math
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BookingLocation, BookingLocationSegment
+
+# Long tracks are pre-thinned to about this many points per point requested
+PRETHIN_FACTOR = 16
+
+
+def _project(points):
+    # Equirectangular projection; accurate enough to rank deviations
+    xs = [point[1] * math.cos(math.radians(point[0])) for point in points]
+    ys = [point[0] for point in points]
+    return xs, ys
+
+
+def _farthest(xs, ys, start, end):
+    """Index and squared distance of the point farthest from the start-end chord."""
+    x1, y1 = xs[start], ys[start]
+    dx, dy = xs[end] - x1, ys[end] - y1
+    length2 = dx * dx + dy * dy
+    segment = zip(xs[start + 1:end], ys[start + 1:end])
+    if length2 == 0:
+        # Closed loop: distance to the start point
+        distances = [(x - x1) ** 2 + (y - y1) ** 2 for x, y in segment]
+    else:
+        distances = [((x - x1) * dy - (y - y1) * dx) ** 2 / length2 for x, y in segment]
+    best = max(distances)
+    return start + 1 + distances.index(best), best
+
+
+def _prethin(xs, ys, runs):
+    """Indices of the first and farthest point of each of `runs` runs, plus the last point."""
+    last = len(xs) - 1
+    step = max(2, last // runs)
+    kept = []
+    for start in range(0, last, step):
+        end = min(start + step, last)
+        kept.append(start)
+        if end - start > 1:
+            kept.append(_farthest(xs, ys, start, end)[0])
+    kept.append(last)
+    return kept
+
+
+def simplify_track(points, max_points):
+    """
+    Return the subset of `points` (sequences starting with latitude,
+    longitude, in track order) that best preserves the track shape using at
+    most `max_points` points. The first and last points are always kept.
+    """
+    points = list(points)
+    if len(points) <= max_points or max_points < 2:
+        return points if max_points >= 2 else points[:max_points]
+
+    xs, ys = _project(points)
+    if len(points) > max_points * PRETHIN_FACTOR:
+        kept = _prethin(xs, ys, max_points * PRETHIN_FACTOR // 2)
+        points = [points[i] for i in kept]
+        xs = [xs[i] for i in kept]
+        ys = [ys[i] for i in kept]
+
+    keep = {0, len(points) - 1}
+    heap = []
+
+    def push(start, end):
+        if end - start > 1:
+            index, distance = _farthest(xs, ys, start, end)
+            heapq.heappush(heap, (-distance, start, end, index))
+
+    push(0, len(points) - 1)
+    while heap and len(keep) < max_points:
+        _, start, end, index = heapq.heappop(heap)
+        keep.add(index)
+        push(start, index)
+        push(index, end)
+    return [points[i] for i in sorted(keep)]
+
+
+# -------------------------
+# Segment encoding
+# -------------------------
+SEGMENT_FORMAT = 1
+COORDINATE_SCALE = 10 ** 7
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag: small negatives stay small
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_track(points):
+    """Pack (recorded_at, latitude, longitude) tuples, in time order, into bytes."""
+    out = bytearray()
+    previous = (0, 0, 0)
+    for recorded_at, lat, lon in points:
+        current = (
+            (recorded_at - EPOCH) // timedelta(microseconds=1),
+            round(lat * COORDINATE_SCALE),
+            round(lon * COORDINATE_SCALE),
+        )
+        for value, before in zip(current, previous):
+            _write_varint(out, value - before)
+        previous = current
+    return bytes([SEGMENT_FORMAT]) + zlib.compress(bytes(out), 9)
+
+
+def decode_track(data):
+    """Inverse of encode_track(): a list of (recorded_at, latitude, longitude)."""
+    data = bytes(data)
+    if data[0] != SEGMENT_FORMAT:
+        raise ValueError(f"Unknown location segment format {data[0]}")
+    raw = zlib.decompress(data[1:])
+    values = []
+    value = shift = 0
+    for byte in raw:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+
+    points = []
+    micros = lat = lon = 0
+    for i in range(0, len(values), 3):
+        micros += values[i]
+        lat += values[i + 1]
+        lon += values[i + 2]
+        points.append((EPOCH + timedelta(microseconds=micros), lat / COORDINATE_SCALE, lon / COORDINATE_SCALE))
+    return points
+
+
+# -------------------------
+# Reading
+# -------------------------
+# Shape of the tuples returned by read_track(); compacted points have no
+# row id or receive time.
+POINT_FIELDS = ('latitude', 'longitude', 'recorded_at', 'id', 'timestamp')
+
+
+def read_track(booking, since=None, until=None, after=None, limit=None):
+    """
+    Points of the booking's track in time order, from compacted segments and
+    raw rows alike: recorded_at >= since, <= until and > after (a cursor).
+    """
+    raw = booking.locations.order_by('recorded_at')
+    segments = booking.location_segments.order_by('day')
+    lower = max((bound for bound in (since, after) if bound is not None), default=None)
+    if lower is not None:
+        raw = raw.filter(recorded_at__gte=lower)
+        segments = segments.filter(end_at__gte=lower)
+    if after is not None:
+        raw = raw.filter(recorded_at__gt=after)
+    if until is not None:
+        raw = raw.filter(recorded_at__lte=until)
+        segments = segments.filter(start_at__lte=until)
+
+    raw = raw.values_list(*POINT_FIELDS)
+    if limit is not None:
+        raw = raw[:limit]
+
+    merged = {}
+    for segment in segments.iterator():
+        for recorded_at, lat, lon in decode_track(segment.data):
+            if ((since is None or recorded_at >= since) and (after is None or recorded_at > after)
+                    and (until is None or recorded_at <= until)):
+                merged[recorded_at] = (lat, lon, recorded_at, None, None)
+        # Segments are whole, ordered days: later ones cannot fill this page
+        if limit is not None and len(merged) >= limit:
+            break
+    for point in raw:
+        merged[point[2]] = point
+
+    track = [merged[recorded_at] for recorded_at in sorted(merged)]
+    return track[:limit] if limit is not None else track
+
+
+# -------------------------
+# Compaction and retention
+# -------------------------
+def _segment_values(track):
+    return {
+        'start_at': track[0][0],
+        'end_at': track[-1][0],
+        'point_count': len(track),
+        'data': encode_track(track),
+    }
+
+
+def compact_booking(booking_id, before):
+    """Roll the booking's raw points recorded before `before` into daily segments."""
+    with transaction.atomic():
+        rows = list(
+            BookingLocation.objects.filter(booking_id=booking_id, recorded_at__lt=before)
+            .values_list('id', 'recorded_at', 'latitude', 'longitude')
+        )
+        if not rows:
+            return 0
+        days = defaultdict(dict)
+        for _, recorded_at, lat, lon in rows:
+            days[timezone.localtime(recorded_at).date()][recorded_at] = (lat, lon)
+
+        existing = {
+            segment.day: segment
+            for segment in BookingLocationSegment.objects.filter(booking_id=booking_id, day__in=list(days))
+        }
+        created, updated = [], []
+        for day, points in days.items():
+            segment = existing.get(day)
+            if segment is not None:
+                # Late points for an already compacted day: merge, raw rows win
+                merged = {recorded_at: (lat, lon) for recorded_at, lat, lon in decode_track(segment.data)}
+                merged.update(points)
+                points = merged
+            track = [(recorded_at, *points[recorded_at]) for recorded_at in sorted(points)]
+            if segment is None:
+                created.append(BookingLocationSegment(booking_id=booking_id, day=day, **_segment_values(track)))
+            else:
+                for field, value in _segment_values(track).items():
+                    setattr(segment, field, value)
+                updated.append(segment)
+        BookingLocationSegment.objects.bulk_create(created)
+        BookingLocationSegment.objects.bulk_update(updated, ['start_at', 'end_at', 'point_count', 'data'])
+
+        ids = [row[0] for row in rows]
+        for i in range(0, len(ids), 500):
+            BookingLocation.objects.filter(pk__in=ids[i:i + 500]).delete()
+    return len(rows)
+
+
+def compact_locations(before):
+    """Compact every booking's points older than `before`. Returns (points, bookings)."""
+    booking_ids = list(
+        BookingLocation.objects.filter(recorded_at__lt=before)
+        .order_by().values_list('booking_id', flat=True).distinct()
+    )
+    points = sum(compact_booking(booking_id, before) for booking_id in booking_ids)
+    return points, len(booking_ids)
+
+
+def purge_locations(before):
+    """Delete raw points and segments older than `before` (retention)."""
+    raw, _ = BookingLocation.objects.filter(recorded_at__lt=before).delete()
+    segments, _ = BookingLocationSegment.objects.filter(end_at__lt=before).delete()
+    return raw, segments
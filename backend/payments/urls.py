@@ -8,10 +8,13 @@ from .views import (
     CreatePaymentIntentView,
     VerifyPayPalPaymentView,
     download_invoice,
+    InvoiceExportAPIView,
     cancel_booking,
     UserRemindersAPIView,
     send_location,
+    send_location_batch,
     get_location_history,
+    stream_locations,
 )
 
 urlpatterns = [
@@ -19,6 +22,7 @@ urlpatterns = [
     path("bookings/create/", BookingCreateAPIView.as_view(), name="booking-create"),
     path("bookings/<int:pk>/", BookingRetrieveAPIView.as_view(), name="booking-detail"),
     path('bookings/<int:id>/download-invoice/', download_invoice, name='download-invoice'),
+    path('invoices/export/', InvoiceExportAPIView.as_view(), name='invoice-export'),
     path("bookings/<int:booking_id>/cancel/", cancel_booking, name="cancel-booking"),
     path("bookings/<int:pk>/update/", BookingUpdateAPIView.as_view(), name="booking-update"),
     path("bookings/<int:pk>/update-payment/", BookingPaymentUpdateAPIView.as_view(), name="booking-payment-update"),
@@ -26,5 +30,7 @@ urlpatterns = [
     path("paypal/verify/", VerifyPayPalPaymentView.as_view(), name="verify-paypal"),
     path('reminders/', UserRemindersAPIView.as_view(), name='user-reminders'),
     path('bookings/<int:pk>/send-location/', send_location, name='send_location'),
+    path('bookings/<int:pk>/send-locations/', send_location_batch, name='send_location_batch'),
     path('bookings/<int:pk>/location-history/', get_location_history, name='location_history'),
+    path('bookings/<int:pk>/location-stream/', stream_locations, name='location_stream'),
 ]
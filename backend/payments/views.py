@@ -1,19 +1,28 @@
+import asyncio
+import json
 import stripe
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import status, permissions, generics
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from datetime import date
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse, Http404
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from destinations.models import TravelDealDate
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags, urlsafe_base64_decode, urlsafe_base64_encode
+from . import inventory, invoices, live, tracking
+from .tracking import simplify_track
 from .models import Booking, BookingLocation
-from .serializers import BookingSerializer, BookingLocationSerializer
+from .serializers import BookingSerializer, BookingLocationSerializer, BookingLocationBatchSerializer
 from .emails import send_booking_success_email, send_booking_cancellation_email
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -27,7 +36,7 @@ class BookingListAPIView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).order_by('-created_at')
+        return Booking.objects.for_listing().filter(user=self.request.user).order_by('-created_at')
 
 
 class BookingCreateAPIView(generics.CreateAPIView):
@@ -42,24 +51,18 @@ class BookingCreateAPIView(generics.CreateAPIView):
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
 
-        # Check capacity before saving booking
-        date_option = data.get('date_option_id')
-        travellers = int(data.get('travellers', 1))
+        date_option = serializer.validated_data['date_option']
+        travellers = serializer.validated_data.get('travellers', 1)
 
+        # Seats and booking are committed together or not at all
         try:
-            travel_date = TravelDealDate.objects.get(id=date_option)
-        except TravelDealDate.DoesNotExist:
-            return Response({"error": "Invalid date option."}, status=status.HTTP_400_BAD_REQUEST)
-
-        if travel_date.capacity < travellers:
+            with transaction.atomic():
+                inventory.reserve_seats(date_option.pk, travellers)
+                booking = serializer.save()
+                inventory.hold_seats(booking)
+        except inventory.InsufficientCapacity:
             return Response({"error": "Not enough slots available for this date."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Reduce capacity safely
-        travel_date.capacity -= travellers
-        travel_date.save()
-
-        booking = serializer.save()
-
         return Response(self.get_serializer(booking).data, status=status.HTTP_201_CREATED)
 
 
@@ -68,7 +71,7 @@ class BookingRetrieveAPIView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.for_listing().filter(user=self.request.user)
 
 
 class BookingUpdateAPIView(generics.UpdateAPIView):
@@ -83,7 +86,16 @@ class BookingUpdateAPIView(generics.UpdateAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+
+        date_option = serializer.validated_data.get('date_option', instance.date_option)
+        travellers = serializer.validated_data.get('travellers', instance.travellers)
+
+        try:
+            with transaction.atomic():
+                inventory.move_seats(instance, date_option, travellers)
+                self.perform_update(serializer)
+        except inventory.InsufficientCapacity:
+            return Response({"error": "Not enough slots available for this date."}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.data)
 
 
@@ -104,7 +116,18 @@ class BookingPaymentUpdateAPIView(generics.UpdateAPIView):
         booking.payment_amount = data.get("payment_amount", booking.payment_amount)
         booking.transaction_id = data.get("transaction_id", booking.transaction_id)
         booking.status = "confirmed"
-        booking.save()
+
+        # Keep the held seats, or take them again if the hold already expired
+        try:
+            with transaction.atomic():
+                inventory.confirm_seats(booking)
+                booking.save()
+                invoices.render_in_background(booking.pk)
+        except inventory.InsufficientCapacity:
+            return Response(
+                {"error": "The seat hold expired and this date is now fully booked."},
+                status=status.HTTP_409_CONFLICT,
+            )
 
         # ✅ Send confirmation email
         send_booking_success_email(booking)
@@ -188,103 +211,47 @@ def download_invoice(request, id):
     except Booking.DoesNotExist:
         raise Http404("Booking not found")
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{id}.pdf"'
-
-    p = canvas.Canvas(response, pagesize=letter)
-    width, height = letter
-
-    left_margin = 50
-    y = height - 50
-    line_height = 18
-
-    p.setFont("Helvetica-Bold", 20)
-    p.drawString(left_margin, y, "Booking Invoice")
-    y -= line_height * 2
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(left_margin, y, "Order Details")
-    y -= line_height
-
-    p.setFont("Helvetica", 12)
-    p.drawString(left_margin, y, f"Booking ID: {booking.id}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Status: {booking.status}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Purchased On: {booking.created_at.strftime('%Y-%m-%d %H:%M')}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Payment Status: {booking.payment_status}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Payment Method: {booking.payment_method or 'N/A'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Transaction ID: {booking.transaction_id or 'N/A'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Payment Date: {booking.payment_date.strftime('%Y-%m-%d %H:%M') if booking.payment_date else 'N/A'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Amount Paid: ${booking.payment_amount or 'N/A'}")
-    y -= line_height * 2
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(left_margin, y, "Traveller Information")
-    y -= line_height
-
-    p.setFont("Helvetica", 12)
-    p.drawString(left_margin, y, f"Name: {booking.full_name}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Email: {booking.email}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Phone: {booking.phone}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Address Line 1: {booking.address_line1}")
-    y -= line_height
-    if booking.address_line2:
-        p.drawString(left_margin, y, f"Address Line 2: {booking.address_line2}")
-        y -= line_height
-    p.drawString(left_margin, y, f"Town: {booking.town}")
-    y -= line_height
-    p.drawString(left_margin, y, f"State: {booking.state}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Postcode: {booking.postcode}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Country: {booking.country}")
-    y -= line_height * 2
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(left_margin, y, "Booking Details")
-    y -= line_height
-
-    p.setFont("Helvetica", 12)
-    p.drawString(left_margin, y, f"Travel Deal: {booking.travel_deal.title if booking.travel_deal else 'N/A'}")
-    y -= line_height
-    if booking.date_option:
-        start_date = booking.date_option.start_date.strftime('%Y-%m-%d')
-        end_date = booking.date_option.end_date.strftime('%Y-%m-%d')
+    # Served from the rendered-once file cache; the ETag is the content hash
+    path, digest = invoices.get_invoice(booking)
+    etag = f'"{digest}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
     else:
-        start_date = "N/A"
-        end_date = "N/A"
-    p.drawString(left_margin, y, f"Travel Dates: {start_date} to {end_date}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Number of Travellers: {booking.travellers}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Room Option: {booking.room_option.capitalize() if booking.room_option else 'N/A'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Add Transfer: {'Yes' if booking.add_transfer else 'No'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Add Nights: {'Yes' if booking.add_nights else 'No'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Flight Help: {'Yes' if booking.flight_help else 'No'}")
-    y -= line_height
-    p.drawString(left_margin, y, f"Donation: {'Yes' if booking.donation else 'No'}")
-    y -= line_height * 2
-
-    p.setFont("Helvetica-Oblique", 10)
-    p.drawString(left_margin, y, "Thank you for booking with us! Please contact support if you have any questions.")
-    p.showPage()
-    p.save()
-
+        response = FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=f"invoice_{id}.pdf", content_type='application/pdf'
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
 
+class InvoiceExportAPIView(APIView):
+    """
+    Staff export of invoices as a streamed ZIP, e.g. for month-end:
+    ?from=2025-07-01&to=2025-07-31 filters on the payment date (inclusive)
+    and ?payment_status= defaults to "paid".
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        bookings = Booking.objects.select_related('travel_deal', 'date_option').filter(
+            payment_status=request.query_params.get('payment_status', 'paid')
+        )
+        for param, lookup in (('from', 'payment_date__date__gte'), ('to', 'payment_date__date__lte')):
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            day = parse_date(value)
+            if day is None:
+                return Response({"error": f"'{param}' must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+            bookings = bookings.filter(**{lookup: day})
+
+        filename = "invoices_{}_{}.zip".format(
+            request.query_params.get('from', 'start'), request.query_params.get('to', timezone.localdate())
+        )
+        return invoices.invoice_export_response(bookings.order_by('id').iterator(chunk_size=500), filename)
+
+
 # --------------------------
 # Cancel Booking View
 # --------------------------
@@ -294,21 +261,20 @@ def download_invoice(request, id):
 def cancel_booking(request, booking_id):
     try:
         booking = Booking.objects.get(id=booking_id, user=request.user)
-        if booking.can_be_canceled():
-            # Free up the date slot
-            booking.date_option.capacity += booking.travellers
-            booking.date_option.save()
+    except Booking.DoesNotExist:
+        return Response({"error": "Booking not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            booking.cancel()
+    # Free up the date slot in the same transaction as the status change
+    with transaction.atomic():
+        canceled = inventory.cancel_booking(booking)
 
-            # ✅ Send cancellation email with manual refund info
-            send_booking_cancellation_email(booking)
+    if not canceled:
+        return Response({"error": "Booking cannot be canceled."}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({"message": "Booking canceled successfully."}, status=status.HTTP_200_OK)
-        else:
-            return Response({"error": "Booking cannot be canceled."}, status=status.HTTP_400_BAD_REQUEST)
-    except ObjectDoesNotExist:
-        return Response({"error": "Booking not found."}, status=status.HTTP_404_NOT_FOUND)
+    # ✅ Send cancellation email with manual refund info
+    send_booking_cancellation_email(booking)
+
+    return Response({"message": "Booking canceled successfully."}, status=status.HTTP_200_OK)
 
 
 # --------------------------
@@ -319,7 +285,7 @@ class UserRemindersAPIView(APIView):
 
     def get(self, request):
         today = date.today()
-        upcoming_bookings = Booking.objects.filter(
+        upcoming_bookings = Booking.objects.for_listing().filter(
             user=request.user,
             date_option__start_date__gte=today,
             status__in=['confirmed', 'pending']
@@ -343,18 +309,263 @@ def send_location(request, pk):
     if lat is None or lon is None:
         return Response({"detail": "Latitude and longitude required."}, status=status.HTTP_400_BAD_REQUEST)
 
-    location = BookingLocation.objects.create(booking=booking, latitude=lat, longitude=lon)
+    serializer = BookingLocationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    # A retried fix (same device time) returns the stored point
+    location, created = BookingLocation.objects.get_or_create(
+        booking=booking,
+        recorded_at=data.get('recorded_at') or timezone.now(),
+        defaults={'latitude': data['latitude'], 'longitude': data['longitude']},
+    )
     serializer = BookingLocationSerializer(location)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    if created:
+        live.publish_locations(booking.pk, [serializer.data])
+    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+MAX_LOCATION_BATCH = 1000
+MAX_HISTORY_POINTS = 5000
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def send_location_batch(request, pk):
+    """
+    Store many fixes in one request: {"points": [{"latitude", "longitude",
+    "recorded_at"}, ...]}. Points already stored for the same recorded_at
+    are skipped, so uploads can be retried safely; only new points are
+    counted as received and published to watchers.
+    """
+    try:
+        booking = Booking.objects.get(pk=pk, user=request.user)
+    except Booking.DoesNotExist:
+        return Response({"detail": "Booking not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    points = request.data.get('points') if isinstance(request.data, dict) else request.data
+    if not isinstance(points, list) or not points:
+        return Response({"detail": "A non-empty list of points is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(points) > MAX_LOCATION_BATCH:
+        return Response(
+            {"detail": f"At most {MAX_LOCATION_BATCH} points per request."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    serializer = BookingLocationBatchSerializer(data=points, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    # Last one wins for duplicates inside the batch
+    unique = {point['recorded_at']: point for point in serializer.validated_data}
+    with transaction.atomic():
+        # Points of a retried upload are already stored; the range is served
+        # by the (booking, recorded_at) unique index
+        known = set(
+            BookingLocation.objects.filter(booking=booking, recorded_at__range=(min(unique), max(unique)))
+            .values_list('recorded_at', flat=True)
+        )
+        locations = [
+            BookingLocation(booking=booking, latitude=point['latitude'], longitude=point['longitude'], recorded_at=recorded_at)
+            for recorded_at, point in sorted(unique.items())
+            if recorded_at not in known
+        ]
+        # ignore_conflicts still covers an identical upload racing this one
+        BookingLocation.objects.bulk_create(locations, ignore_conflicts=True)
+        live.publish_locations(booking.pk, BookingLocationSerializer(locations, many=True).data)
+    return Response(
+        {"received": len(locations), "duplicates": len(points) - len(locations)},
+        status=status.HTTP_201_CREATED if locations else status.HTTP_200_OK,
+    )
+
+
+LOCATION_PAGE_SIZE = 500
+MAX_LOCATION_PAGE_SIZE = 2000
+
+
+def _parse_moment(value):
+    """An aware datetime from an ISO 8601 string, or None if it is not one."""
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        # Well formed but out of range, e.g. month 13
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_location_history(request, pk):
+    """
+    Track of a booking, optionally limited to ?since= / ?until= (ISO 8601).
+    With ?limit= or ?cursor= it returns pages of points ({"next", "results"},
+    follow "next"), and with ?max_points=N the whole window downsampled to at
+    most N points for map rendering ({"count", "results"}). Without any of
+    them the response is the bare list of points it has always been.
+    Compacted days and recent raw points are merged by tracking.read_track().
+    """
     try:
         booking = Booking.objects.get(pk=pk, user=request.user)
     except Booking.DoesNotExist:
         return Response({"detail": "Booking not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    locations = booking.locations.all()  # related_name='locations'
-    serializer = BookingLocationSerializer(locations, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    bounds = {}
+    for param in ('since', 'until'):
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        bounds[param] = _parse_moment(value)
+        if bounds[param] is None:
+            return Response({"detail": f"'{param}' must be an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_points = request.query_params.get('max_points')
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            max_points = 0
+        if not 2 <= max_points <= MAX_HISTORY_POINTS:
+            return Response(
+                {"detail": f"'max_points' must be between 2 and {MAX_HISTORY_POINTS}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        track = tracking.read_track(booking, **bounds)
+        points = [dict(zip(tracking.POINT_FIELDS, point)) for point in simplify_track(track, max_points)]
+        return Response({
+            "count": len(track),
+            "results": BookingLocationSerializer(points, many=True).data,
+        })
+
+    if 'limit' not in request.query_params and 'cursor' not in request.query_params:
+        points = [dict(zip(tracking.POINT_FIELDS, point)) for point in tracking.read_track(booking, **bounds)]
+        return Response(BookingLocationSerializer(points, many=True).data)
+
+    try:
+        limit = min(int(request.query_params.get('limit', LOCATION_PAGE_SIZE)), MAX_LOCATION_PAGE_SIZE)
+    except ValueError:
+        limit = LOCATION_PAGE_SIZE
+    limit = max(limit, 1)
+
+    # The cursor is the recorded_at of the last point on the previous page
+    after = None
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        try:
+            after = parse_datetime(urlsafe_base64_decode(cursor).decode())
+        except (ValueError, UnicodeDecodeError):
+            after = None
+        if after is None:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+    track = tracking.read_track(booking, after=after, limit=limit + 1, **bounds)
+    next_url = None
+    if len(track) > limit:
+        track = track[:limit]
+        position = urlsafe_base64_encode(track[-1][2].isoformat().encode())
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', position)
+    points = [dict(zip(tracking.POINT_FIELDS, point)) for point in track]
+    return Response({
+        "next": next_url,
+        "results": BookingLocationSerializer(points, many=True).data,
+    })
+
+
+# --------------------------
+# Live Location Stream (SSE)
+# --------------------------
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_MAX_STREAM_SECONDS = 60 * 60
+LIVE_REPLAY_LIMIT = 500
+
+
+@sync_to_async
+def _stream_user(request):
+    # EventSource cannot send headers, so the access token may come as ?token=
+    header = request.headers.get('Authorization', '')
+    raw_token = header[7:] if header.startswith('Bearer ') else request.GET.get('token')
+    if not raw_token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+@sync_to_async
+def _watchable_booking(user, pk):
+    """The booking if `user` is its traveller, staff, or the traveller's emergency contact."""
+    try:
+        booking = Booking.objects.select_related('user__emergencycontact').get(pk=pk)
+    except Booking.DoesNotExist:
+        return None
+    if booking.user_id == user.pk or user.is_staff:
+        return booking
+    contact = getattr(booking.user, 'emergencycontact', None)
+    if contact is not None and contact.email.lower() == user.email.lower():
+        return booking
+    return None
+
+
+def _sse(point):
+    return f"id: {point['recorded_at']}\nevent: location\ndata: {json.dumps(point)}\n\n"
+
+
+async def stream_locations(request, pk):
+    """
+    Server-Sent Events stream of a booking's new locations (requires ASGI).
+    Each event carries one point with its recorded_at as id, so a reconnecting
+    EventSource (Last-Event-ID) gets the points it missed replayed first.
+    Idle connections get a heartbeat comment, and streams end after an hour
+    so that expired tokens are re-checked on reconnect.
+    """
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    booking = await _watchable_booking(user, pk)
+    if booking is None:
+        return JsonResponse({"detail": "Booking not found."}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    since = None
+    if last_event_id:
+        since = _parse_moment(last_event_id)
+        if since is None:
+            return JsonResponse({"detail": "Last-Event-ID must be an ISO 8601 datetime."}, status=400)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LIVE_MAX_STREAM_SECONDS
+        # Subscribe before replaying so nothing falls in between
+        subscription = live.get_broker().subscribe(live.booking_channel(booking.pk))
+        try:
+            yield "retry: 3000\n\n"
+            last_sent = since
+            if since is not None:
+                missed = await sync_to_async(tracking.read_track)(booking, after=since, limit=LIVE_REPLAY_LIMIT)
+                points = [dict(zip(tracking.POINT_FIELDS, point)) for point in missed]
+                for point in BookingLocationSerializer(points, many=True).data:
+                    yield _sse(point)
+                if missed:
+                    last_sent = missed[-1][2]
+
+            while loop.time() < deadline:
+                try:
+                    points = await asyncio.wait_for(subscription.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                for point in points:
+                    recorded_at = parse_datetime(point['recorded_at'])
+                    if last_sent is not None and recorded_at <= last_sent:
+                        continue
+                    yield _sse(point)
+                    last_sent = recorded_at
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
\ No newline at end of file
@@ -1,3 +1,37 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from . import geocoding
+from .models import GeocodedPlace, OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('subject', 'body', 'from_email', 'to', 'attempts', 'claimed_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['requeue']
+
+    def recipients(self, obj):
+        return ', '.join(obj.to)
+
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(
+            status='queued', attempts=0, next_attempt_at=timezone.now(), claim_token=None
+        )
+        self.message_user(request, f"{updated} email(s) queued for sending.")
+    requeue.short_description = "Queue selected emails again"
+
+
+@admin.register(GeocodedPlace)
+class GeocodedPlaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'query', 'country_code', 'latitude', 'longitude', 'source', 'created_at')
+    list_filter = ('source', 'country_code')
+    search_fields = ('name', 'query')
+
+    def save_model(self, request, obj, form, change):
+        # Mark hand-entered or corrected coordinates
+        obj.query = geocoding.normalize(obj.query)
+        obj.source = 'manual'
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,264 @@
+"""
+Ollama client for the travel chatbot.
+
+Generations are slow (often tens of seconds) and each one holds a worker, so
+they run in a fixed number of slots (settings.CHATBOT_MAX_CONCURRENT). When
+every slot is taken, a request is turned away at once with Busy instead of
+queueing behind them. Streamed generations relay Ollama's NDJSON token stream
+as it arrives. Every generation logs its timings on the utils.chatbot logger.
+
+Prompts are grounded with snippets from utils.knowledge. Answers are cached by
+normalized question (and knowledge version) for settings.CHATBOT_CACHE_TTL, so
+repeated questions skip the model and never take a slot.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from . import http, knowledge
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "You are a helpful travel assistant for a travel website. "
+    "Answer traveler questions about visa, weather, destinations, tours, "
+    "and travel tips clearly and politely."
+)
+MODEL = "gpt-oss:120b-cloud"
+CONNECT_TIMEOUT = 3.05
+# Read timeouts: a blocking call waits for the whole answer, a stream only
+# for the next token
+BLOCKING_TIMEOUT = 300
+STREAM_IDLE_TIMEOUT = 120
+# Suggested wait for a client turned away with 429
+RETRY_AFTER = 5
+
+
+class Busy(Exception):
+    pass
+
+
+class ChatbotError(Exception):
+    pass
+
+
+# -------------------------
+# Concurrency limit
+# -------------------------
+class Slot:
+    def __init__(self, semaphore):
+        self._semaphore = semaphore
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if not self._released:
+                self._released = True
+                self._semaphore.release()
+
+
+_semaphore = None
+_semaphore_lock = threading.Lock()
+
+
+def acquire_slot():
+    """Take a generation slot without waiting; raises Busy when none is free."""
+    global _semaphore
+    if _semaphore is None:
+        with _semaphore_lock:
+            if _semaphore is None:
+                _semaphore = threading.BoundedSemaphore(settings.CHATBOT_MAX_CONCURRENT)
+    if not _semaphore.acquire(blocking=False):
+        logger.warning("chatbot rejected: all %s generation slots busy", settings.CHATBOT_MAX_CONCURRENT)
+        raise Busy()
+    return Slot(_semaphore)
+
+
+# -------------------------
+# Timing
+# -------------------------
+class Timing:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.chunks = 0
+        self.upstream = {}
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+
+    def as_dict(self):
+        metrics = {
+            "total_ms": round((time.perf_counter() - self.started) * 1000),
+            "time_to_first_token_ms": (
+                round((self.first_token - self.started) * 1000) if self.first_token is not None else None
+            ),
+            "chunks": self.chunks,
+        }
+        # Ollama reports its own counters (durations in ns) on the final chunk
+        eval_count = self.upstream.get("eval_count")
+        eval_duration = self.upstream.get("eval_duration")
+        if eval_count is not None:
+            metrics["tokens"] = eval_count
+        if eval_count and eval_duration:
+            metrics["tokens_per_second"] = round(eval_count / (eval_duration / 1e9), 1)
+        return metrics
+
+    def log(self, outcome, streamed):
+        metrics = self.as_dict()
+        logger.info(
+            "chatbot %s stream=%s total=%sms ttft=%sms chunks=%s tokens=%s",
+            outcome, streamed, metrics["total_ms"], metrics["time_to_first_token_ms"],
+            metrics["chunks"], metrics.get("tokens"),
+        )
+        return metrics
+
+
+# -------------------------
+# Answer cache
+# -------------------------
+def _cache_key(message):
+    question = knowledge.normalize_question(message)
+    if not question:
+        return None
+    digest = hashlib.sha256(question.encode()).hexdigest()[:32]
+    # The version of the index actually used, so an answer is never filed
+    # under content it was not grounded in
+    return f"utils:chatbot:{knowledge.get_index().version}:{digest}"
+
+
+def cached_answer(message):
+    key = _cache_key(message)
+    return cache.get(key) if key else None
+
+
+def store_answer(message, answer):
+    key = _cache_key(message)
+    if key and answer:
+        cache.set(key, answer, timeout=settings.CHATBOT_CACHE_TTL)
+
+
+def cached_stream(answer):
+    """The NDJSON a streamed generation would have produced, from the cache."""
+    yield GenerationStream._line({"response": answer})
+    yield GenerationStream._line({"done": True, "metrics": {"cached": True}})
+
+
+# -------------------------
+# Ollama
+# -------------------------
+def build_prompt(message):
+    snippets = knowledge.search(message)
+    context = ""
+    if snippets:
+        facts = "\n".join(f"- [{title}] {snippet}" for title, snippet in snippets)
+        context = f"\nUse these facts from our site when they are relevant:\n{facts}"
+    return f"System: {SYSTEM_PROMPT}{context}\nUser: {message}\nAssistant:"
+
+
+def _payload(message, stream):
+    return {
+        "model": MODEL,
+        "prompt": build_prompt(message),
+        "stream": stream,
+        # Sampling parameters only take effect under "options"
+        "options": {"temperature": 0.7, "num_predict": 500},
+    }
+
+
+def _post(message, stream, read_timeout):
+    return http.get_session().post(
+        f"{settings.OLLAMA_HOST}/api/generate",
+        json=_payload(message, stream),
+        stream=stream,
+        timeout=(CONNECT_TIMEOUT, read_timeout),
+    )
+
+
+def generate(message):
+    """
+    Blocking generation; returns (answer, metrics). Raises ChatbotError or
+    requests exceptions.
+    """
+    timing = Timing()
+    outcome = "error"
+    try:
+        response = _post(message, stream=False, read_timeout=BLOCKING_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        timing.token()
+        timing.upstream = data
+        answer = data.get("response", "").strip()
+        if not answer:
+            raise ChatbotError("Empty response from Ollama API")
+        store_answer(message, answer)
+        outcome = "ok"
+        return answer, timing.as_dict()
+    finally:
+        timing.log(outcome, streamed=False)
+
+
+class GenerationStream:
+    """
+    NDJSON relay of one streamed generation: {"response": "..."} per chunk,
+    then {"done": true, "metrics": {...}}, or {"error": "..."} if the
+    generation fails part way. Holds `slot` until the stream is exhausted or
+    closed, including when the client disconnects before the first chunk.
+    """
+
+    def __init__(self, message, slot):
+        self.message = message
+        self.slot = slot
+        self.upstream = None
+
+    def __iter__(self):
+        timing = Timing()
+        outcome = "error"
+        parts = []
+        try:
+            self.upstream = _post(self.message, stream=True, read_timeout=STREAM_IDLE_TIMEOUT)
+            self.upstream.raise_for_status()
+            for line in self.upstream.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise ChatbotError(chunk["error"])
+                if chunk.get("response"):
+                    timing.token()
+                    parts.append(chunk["response"])
+                    yield self._line({"response": chunk["response"]})
+                if chunk.get("done"):
+                    timing.upstream = chunk
+                    break
+            outcome = "ok"
+            store_answer(self.message, "".join(parts).strip())
+            yield self._line({"done": True, "metrics": timing.as_dict()})
+        except requests.exceptions.Timeout:
+            yield self._line({"error": "Request to Ollama API timed out."})
+        except (requests.exceptions.RequestException, ValueError, ChatbotError) as e:
+            yield self._line({"error": str(e) or "Chatbot error"})
+        except GeneratorExit:
+            outcome = "disconnected"
+            raise
+        finally:
+            timing.log(outcome, streamed=True)
+            self.close()
+
+    def close(self):
+        if self.upstream is not None:
+            self.upstream.close()
+        self.slot.release()
+
+    @staticmethod
+    def _line(data):
+        return (json.dumps(data) + "\n").encode()
@@ -1,49 +1,57 @@
 import requests
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from django.conf import settings
+
+from . import chatbot
+
 
 class TravelChatbotAPIView(APIView):
+    """
+    Ask the travel assistant. With "stream": true the answer is relayed as
+    NDJSON while it is generated (see chatbot.GenerationStream); otherwise it
+    is returned in one piece. Cached answers are returned without a
+    generation; otherwise a request that finds every generation slot busy
+    gets a 429 with Retry-After straight away.
+    """
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        user_message = request.data.get("message", "").strip()
+        user_message = str(request.data.get("message", "")).strip()
         if not user_message:
             return Response({"error": "Message is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            system_prompt = (
-                "You are a helpful travel assistant for a travel website. "
-                "Answer traveler questions about visa, weather, destinations, tours, "
-                "and travel tips clearly and politely."
-            )
-
-            prompt = f"System: {system_prompt}\nUser: {user_message}\nAssistant:"
-
-            payload = {
-                "model": "gpt-oss:120b-cloud",
-                "prompt": prompt,
-                "temperature": 0.7,
-                "max_tokens": 500,
-                "stream": False,
-            }
+        stream = request.data.get("stream") in (True, "true", "1", 1) or request.query_params.get("stream") == "1"
 
-            ollama_host = getattr(settings, "OLLAMA_HOST", "http://127.0.0.1:11435")
-            url = f"{ollama_host}/api/generate"
-            headers = {"Content-Type": "application/json"}
+        answer = chatbot.cached_answer(user_message)
+        if answer is not None:
+            if stream:
+                return StreamingHttpResponse(chatbot.cached_stream(answer), content_type="application/x-ndjson")
+            return Response({"response": answer, "metrics": {"cached": True}})
 
-            # Increased timeout from 30 to 120 seconds
-            response = requests.post(url, json=payload, headers=headers, timeout=300)
-            response.raise_for_status()
-            data = response.json()
-
-            answer = data.get("response", "").strip()
+        try:
+            slot = chatbot.acquire_slot()
+        except chatbot.Busy:
+            return Response(
+                {"error": "The assistant is busy, please try again shortly."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(chatbot.RETRY_AFTER)},
+            )
 
-            if not answer:
-                return Response({"error": "Empty response from Ollama API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if stream:
+            response = StreamingHttpResponse(
+                chatbot.GenerationStream(user_message, slot), content_type="application/x-ndjson"
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"  # nginx: do not buffer the stream
+            return response
 
-            return Response({"response": answer})
+        try:
+            answer, metrics = chatbot.generate(user_message)
+            response = Response({"response": answer, "metrics": metrics})
+            response["Server-Timing"] = f"ollama;dur={metrics['total_ms']}"
+            return response
 
         except requests.exceptions.Timeout:
             return Response({"error": "Request to Ollama API timed out."}, status=status.HTTP_504_GATEWAY_TIMEOUT)
@@ -51,3 +59,5 @@ class TravelChatbotAPIView(APIView):
             return Response({"error": f"Request error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            slot.release()
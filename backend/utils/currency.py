@@ -0,0 +1,149 @@
+"""
+Local exchange-rate table.
+
+The whole conversion_rates table is fetched once by the refresh_exchange_rates
+command and snapshotted into CurrencyRate. Each process holds it in memory as a
+RateMatrix, so conversions never touch the network or the database. A refresh
+bumps a version key in the default cache; processes compare it at most every
+VERSION_CHECK_INTERVAL seconds and reload the table when it changed.
+
+The matrix is loaded on the first conversion, not in UtilsConfig.ready():
+ready() also runs for migrate and other management commands, before the
+CurrencyRate table may exist, and the first load is a single small query.
+"""
+import threading
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import status
+
+from . import http
+from .http import UpstreamError
+from .models import CurrencyRate
+
+VERSION_KEY = 'utils:currency-rates-version'
+VERSION_CHECK_INTERVAL = 60
+# How long a version derived from the database is trusted when nothing has
+# published one, e.g. a refresh ran in another process with a locmem cache
+DERIVED_VERSION_TIMEOUT = 5 * 60
+CENT = Decimal('0.01')
+
+
+class UnknownCurrency(KeyError):
+    pass
+
+
+def fetch_exchange_rates(base_currency):
+    url = f'{settings.EXCHANGE_RATE_API_URL}/v6/{settings.EXCHANGE_RATE_API_KEY}/latest/{base_currency}'
+    response = http.get(url)
+    data = response.json()
+    if response.status_code != 200 or data.get('result') != 'success':
+        raise UpstreamError(status.HTTP_400_BAD_REQUEST, data.get('error-type', 'API request failed'))
+    return data.get('conversion_rates', {})
+
+
+class RateMatrix:
+    """Rates of every known currency against one common base."""
+
+    def __init__(self, rates, version=None):
+        self.rates = rates
+        self.version = version
+
+    def __contains__(self, currency):
+        return currency in self.rates
+
+    def __bool__(self):
+        return bool(self.rates)
+
+    def rate(self, from_currency, to_currency):
+        if from_currency == to_currency:
+            return Decimal(1)
+        try:
+            return self.rates[to_currency] / self.rates[from_currency]
+        except KeyError as e:
+            raise UnknownCurrency(e.args[0]) from None
+
+    def convert(self, amount, from_currency, to_currency):
+        """Convert `amount` and round to cents."""
+        amount = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+        return (amount * self.rate(from_currency, to_currency)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# -------------------------
+# Per-process matrix
+# -------------------------
+_matrix = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        fetched_at = CurrencyRate.objects.aggregate(latest=Max('fetched_at'))['latest']
+        version = int(fetched_at.timestamp() * 1000) if fetched_at else 0
+        cache.add(VERSION_KEY, version, timeout=DERIVED_VERSION_TIMEOUT)
+    return version
+
+
+def load_matrix(version=None):
+    rows = CurrencyRate.objects.values_list('currency', 'rate')
+    return RateMatrix({currency: rate for currency, rate in rows if rate}, version)
+
+
+def get_matrix():
+    """The current RateMatrix; empty until the first refresh."""
+    global _matrix, _checked_at
+    if _matrix is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _matrix
+    with _lock:
+        if _matrix is None or time.monotonic() - _checked_at >= VERSION_CHECK_INTERVAL:
+            version = get_version()
+            if _matrix is None or _matrix.version != version:
+                _matrix = load_matrix(version)
+            _checked_at = time.monotonic()
+        return _matrix
+
+
+def convert(amount, from_currency, to_currency):
+    return get_matrix().convert(amount, from_currency, to_currency)
+
+
+# -------------------------
+# Refresh
+# -------------------------
+def refresh_rates(base_currency=None):
+    """
+    Replace the snapshot with the latest upstream table and publish the new
+    version. Returns the number of currencies stored.
+    """
+    base_currency = (base_currency or settings.EXCHANGE_RATE_BASE_CURRENCY).upper()
+    rates = fetch_exchange_rates(base_currency)
+
+    now = timezone.now()
+    rows = []
+    for currency, rate in rates.items():
+        try:
+            rate = Decimal(str(rate))
+        except InvalidOperation:
+            continue
+        if rate > 0:
+            rows.append(CurrencyRate(currency=currency.upper(), rate=rate, fetched_at=now))
+    if not any(row.currency == base_currency for row in rows):
+        rows.append(CurrencyRate(currency=base_currency, rate=Decimal(1), fetched_at=now))
+
+    with transaction.atomic():
+        CurrencyRate.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['currency'], update_fields=['rate', 'fetched_at']
+        )
+        # Currencies the upstream no longer lists
+        CurrencyRate.objects.filter(fetched_at__lt=now).delete()
+
+    cache.set(VERSION_KEY, int(now.timestamp() * 1000), timeout=None)
+    return len(rows)
+
@@ -0,0 +1,92 @@
+"""
+Persistent place name → coordinates table in front of the OpenWeather
+geocoding API.
+
+Coordinates never change, so every successful lookup is stored in
+GeocodedPlace and the API is only asked about names it has never seen. The
+table can be filled ahead of time with the seed_geocoded_places command.
+resolve() answers many names at once: one query for the stored ones, and
+concurrent API calls for the rest.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from cachetools import TTLCache
+from django.conf import settings
+from rest_framework import status
+
+from . import http
+from .http import UpstreamError
+from .models import GeocodedPlace
+
+MAX_WORKERS = 8
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='geocode')
+# Saves the table lookup for hot names; rows are never updated by the API
+_memo = TTLCache(maxsize=4096, ttl=60 * 60)
+_memo_lock = threading.Lock()
+
+
+def normalize(name):
+    return ' '.join((name or '').split()).lower()
+
+
+def geocode(name, country_code=None):
+    """Ask the API for `name`; returns (lat, lon, country_code)."""
+    query = f"{name},{country_code}" if country_code else name
+    geo_url = f"{settings.OPENWEATHER_API_URL}/geo/1.0/direct"
+    geo_res = http.get(geo_url, params={"q": query, "limit": 1, "appid": settings.OPENWEATHER_API_KEY})
+    geo_data_list = geo_res.json()
+    if geo_res.status_code != 200 or not geo_data_list:
+        raise UpstreamError(status.HTTP_400_BAD_REQUEST, "Could not get coordinates for the city.")
+    place = geo_data_list[0]
+    return place['lat'], place['lon'], place.get('country') or ''
+
+
+def geocode_many(places):
+    """
+    Geocode [(name, country_code)] concurrently and store the results.
+    Returns {normalized name: (lat, lon) or the exception raised}.
+    """
+    futures = {normalize(name): (name, _pool.submit(geocode, name, country_code)) for name, country_code in places}
+    results = {}
+    rows = []
+    for query, (name, future) in futures.items():
+        try:
+            lat, lon, country_code = future.result()
+        except (UpstreamError, requests.RequestException) as e:
+            results[query] = e
+            continue
+        results[query] = (lat, lon)
+        rows.append(GeocodedPlace(query=query, name=name, country_code=country_code, latitude=lat, longitude=lon))
+    # A concurrent request may have stored the same name first
+    GeocodedPlace.objects.bulk_create(rows, ignore_conflicts=True)
+    return results
+
+
+def resolve(names):
+    """
+    Return {name: (lat, lon)} for every name, or the UpstreamError /
+    RequestException that prevented it from being resolved.
+    """
+    queries = {name: normalize(name) for name in names}
+    found = {}
+    with _memo_lock:
+        for query in set(queries.values()):
+            if query in _memo:
+                found[query] = _memo[query]
+
+    missing = set(queries.values()) - found.keys()
+    if missing:
+        stored = GeocodedPlace.objects.filter(query__in=missing).values_list('query', 'latitude', 'longitude')
+        found.update((query, (lat, lon)) for query, lat, lon in stored)
+        unknown = [name for name, query in queries.items() if query in missing and query not in found]
+        if unknown:
+            found.update(geocode_many((name, None) for name in unknown))
+
+    with _memo_lock:
+        for query, coordinates in found.items():
+            if isinstance(coordinates, tuple):
+                _memo[query] = coordinates
+    return {name: found[query] for name, query in queries.items()}
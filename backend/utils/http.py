@@ -0,0 +1,106 @@
+"""
+Shared outbound HTTP client for third-party APIs.
+
+get() goes through one pooled requests.Session with a default timeout and
+retries on gateway errors. CachedEndpoint wraps an upstream lookup with a
+per-process TTL cache (cachetools) that keeps serving a stale value while it
+is refreshed in the background, and coalesces concurrent misses for the same
+key into a single upstream call.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=16,
+                    pool_maxsize=32,
+                    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=['GET']),
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+class UpstreamError(Exception):
+    """An upstream answer that must not be cached; views turn it into an error response."""
+
+    def __init__(self, status_code, payload):
+        super().__init__(status_code, payload)
+        self.status_code = status_code
+        self.payload = payload
+
+
+class CachedEndpoint:
+    """
+    Cache of fetch(*key) results. A value is fresh for `ttl` seconds and then
+    served stale for up to `stale_ttl` more while one background refresh runs.
+    Exceptions raised by fetch are never cached.
+    """
+    _refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='http-refresh')
+
+    def __init__(self, fetch, ttl, stale_ttl=0, maxsize=1024):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, *key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                value, fresh_until = entry
+                if fresh_until <= time.monotonic() and key not in self._inflight:
+                    self._inflight[key] = Future()
+                    self._refresher.submit(self._load, key)
+                return value
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if leader:
+            self._load(key)
+        # Followers wait for the leader's upstream call instead of making their own
+        return future.result()
+
+    def _load(self, key):
+        future = self._inflight[key]
+        try:
+            value = self.fetch(*key)
+        except Exception as exc:
+            future.set_exception(exc)
+        else:
+            with self._lock:
+                self._cache[key] = (value, time.monotonic() + self.ttl)
+            future.set_result(value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,197 @@
+"""
+Retrieval stage for the travel chatbot.
+
+Our own FAQ, CountryOverview and TravelDeal content is kept in a per-process
+BM25 index, and the few best matching snippets for a question are put into
+the prompt. The answer is then grounded in what we actually sell, and the
+prompt stays short. Changing any of the INDEXED_FIELDS of that content bumps
+a version key in the default cache (see utils.signals); processes compare it
+at most every VERSION_CHECK_INTERVAL seconds and, when it changed, rebuild the
+index in a background thread while the previous one keeps serving.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import connection
+
+from destinations.models import FAQ, Country, CountryOverview, TravelDeal
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'utils:chatbot-knowledge-version'
+VERSION_CHECK_INTERVAL = 60
+TOP_K = 4
+MAX_SNIPPET_CHARS = 400
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+# Negations are kept, they change the meaning of a question
+STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from have how i in is it me my of on or "
+    "please should so that the there this to was we what when where which will with would you your".split()
+)
+
+
+def terms(text):
+    return [term for term in _TERM.findall((text or '').lower()) if term not in STOPWORDS]
+
+
+def normalize_question(text):
+    """
+    Lower-cased words in order, so questions that differ only in case,
+    spacing or punctuation compare equal. Stopwords are kept: "visa for
+    india" and "visa from india" are different questions.
+    """
+    return ' '.join(_TERM.findall((text or '').lower()))
+
+
+def _truncate(text, limit=MAX_SNIPPET_CHARS):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= limit else text[:limit].rsplit(' ', 1)[0] + '…'
+
+
+# Fields documents() reads; saving a row without changing any of them leaves
+# the index (and every cached answer) alone
+INDEXED_FIELDS = {
+    FAQ: ('country_id', 'question', 'answer'),
+    CountryOverview: (
+        'country_id', 'capital', 'population', 'currency', 'language', 'timezone', 'calling_code', 'electricity',
+    ),
+    TravelDeal: ('country_id', 'title', 'subtitle', 'city', 'days', 'price', 'description'),
+    Country: ('name',),
+}
+
+
+def documents():
+    """Yield (title, snippet, indexed text) for everything the chatbot may cite."""
+    for country, question, answer in FAQ.objects.values_list('country__name', 'question', 'answer').iterator():
+        snippet = f"Q: {question} A: {answer}"
+        yield f"FAQ, {country}", _truncate(snippet), f"{country} {question} {answer}"
+
+    overviews = CountryOverview.objects.values_list(
+        'country__name', 'capital', 'population', 'currency', 'language', 'timezone', 'calling_code', 'electricity'
+    )
+    for country, capital, population, currency, language, tz, calling_code, electricity in overviews.iterator():
+        snippet = (
+            f"Capital: {capital}. Population: {population}. Currency: {currency}. Language: {language}. "
+            f"Time zone: {tz}. Calling code: {calling_code}. Electricity: {electricity}"
+        )
+        yield f"Country overview, {country}", _truncate(snippet), f"{country} {snippet}"
+
+    deals = TravelDeal.objects.values_list('title', 'subtitle', 'country__name', 'city', 'days', 'price', 'description')
+    for title, subtitle, country, city, days, price, description in deals.iterator():
+        place = ', '.join(part for part in (city, country) if part)
+        snippet = f"{title} ({place}): {days} days from {price}. {subtitle or ''} {description or ''}"
+        yield f"Tour, {title}", _truncate(snippet), f"{title} {subtitle or ''} {place} {description or ''}"
+
+
+class Index:
+    def __init__(self, docs, version=None):
+        self.version = version
+        self.snippets = []
+        self.postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        lengths = []
+        for title, snippet, text in docs:
+            doc_terms = terms(text)
+            for term, freq in Counter(doc_terms).items():
+                self.postings[term].append((len(self.snippets), freq))
+            self.snippets.append((title, snippet))
+            lengths.append(len(doc_terms))
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0
+        n = len(lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, limit=TOP_K):
+        """Return up to `limit` (title, snippet) pairs, best match first."""
+        scores = defaultdict(float)
+        for term in set(terms(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, freq in self.postings[term]:
+                norm = K1 * (1 - B + B * self.lengths[doc] / self.avg_length)
+                scores[doc] += idf * freq * (K1 + 1) / (freq + norm)
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [self.snippets[doc] for doc, _ in best]
+
+
+# -------------------------
+# Per-process index
+# -------------------------
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chatbot-knowledge')
+_rebuilding = threading.Event()
+
+
+def _fresh_version():
+    return int(time.time() * 1000)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _fresh_version(), timeout=None)
+
+
+def get_index():
+    global _index, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _index
+    with _lock:
+        if _index is None:
+            # Nothing to serve yet: the first build happens in the request
+            _index = Index(documents(), get_version())
+            _checked_at = time.monotonic()
+        elif time.monotonic() - _checked_at >= VERSION_CHECK_INTERVAL:
+            _checked_at = time.monotonic()
+            version = get_version()
+            if _index.version != version:
+                _schedule_rebuild(version)
+        return _index
+
+
+def _schedule_rebuild(version):
+    if not _rebuilding.is_set():
+        _rebuilding.set()
+        _executor.submit(_rebuild, version)
+
+
+def _rebuild(version):
+    global _index
+    try:
+        index = Index(documents(), version)
+        with _lock:
+            _index = index
+    except Exception:
+        logger.exception("Rebuilding the chatbot knowledge index failed")
+    finally:
+        _rebuilding.clear()
+        connection.close()
+
+
+def search(query, limit=TOP_K):
+    return get_index().search(query, limit)
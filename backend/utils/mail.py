@@ -0,0 +1,189 @@
+"""
+Outbound email queue.
+
+queue_mail() stores the message in the OutboundEmail outbox and returns
+immediately. Messages are delivered in batches over a single backend
+connection, either by the `send_queued_mail` management command or, when
+EMAIL_OUTBOX_AUTOFLUSH is on, by a background thread started once the
+queuing transaction commits. Batches are claimed with a token, so any number
+of workers can run side by side; failed messages are retried with
+exponential backoff until MAX_ATTEMPTS.
+
+With autoflush, each background flush arms a timer for the next message
+still waiting (a retry after a failure, or mail queued by another process),
+so retries do not depend on new mail being queued. The timer lives in the
+process: mail left when every web process has exited waits for the next
+queue_mail() or `send_queued_mail` run, so production should also run
+`send_queued_mail` from a scheduler (or `--loop`).
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 6 * 60 * 60
+# A batch still "sending" after this long belongs to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """Drop-in replacement for send_mail() that queues the message instead."""
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+    if getattr(settings, 'EMAIL_OUTBOX_AUTOFLUSH', False):
+        transaction.on_commit(_schedule_flush)
+    return email
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """Claim up to `batch_size` due messages for this worker and return them."""
+    now = timezone.now()
+    due = Q(status="queued", next_attempt_at__lte=now) | Q(status="sending", claimed_at__lt=now - CLAIM_TIMEOUT)
+    ids = list(OutboundEmail.objects.filter(due).order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    # The filter is repeated so a message claimed concurrently is skipped
+    OutboundEmail.objects.filter(due, pk__in=ids).update(status="sending", claim_token=token, claimed_at=now)
+    return list(OutboundEmail.objects.filter(claim_token=token, status="sending").order_by('id'))
+
+
+def send_batch(emails):
+    """Send claimed messages over one connection. Returns (sent, failed)."""
+    sent = failed = 0
+    backend = get_connection(fail_silently=False)
+    try:
+        for email in emails:
+            try:
+                backend.open()
+                EmailMessage(email.subject, email.body, email.from_email, email.to, connection=backend).send()
+            except Exception as exc:
+                # Drop the connection so the next message starts on a fresh one
+                backend.close()
+                _mark_failed(email, exc)
+                failed += 1
+            else:
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status="sent", sent_at=timezone.now(), attempts=email.attempts + 1,
+                    claim_token=None, last_error="",
+                )
+                sent += 1
+    finally:
+        backend.close()
+    return sent, failed
+
+
+def _mark_failed(email, exc):
+    attempts = email.attempts + 1
+    gave_up = attempts >= MAX_ATTEMPTS
+    logger.warning("Sending email %s failed (attempt %s): %s", email.pk, attempts, exc)
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status="failed" if gave_up else "queued",
+        attempts=attempts,
+        next_attempt_at=timezone.now() + retry_delay(attempts),
+        claim_token=None,
+        last_error=str(exc),
+    )
+
+
+def next_due_in():
+    """Seconds until the next waiting message is due (0 if overdue), or None."""
+    now = timezone.now()
+    next_attempt = (
+        OutboundEmail.objects.filter(status="queued").order_by('next_attempt_at')
+        .values_list('next_attempt_at', flat=True).first()
+    )
+    # A claim older than CLAIM_TIMEOUT is picked up again
+    oldest_claim = (
+        OutboundEmail.objects.filter(status="sending").order_by('claimed_at')
+        .values_list('claimed_at', flat=True).first()
+    )
+    due = [at for at in (next_attempt, oldest_claim and oldest_claim + CLAIM_TIMEOUT) if at is not None]
+    if not due:
+        return None
+    return max((min(due) - now).total_seconds(), 0)
+
+
+def flush(batch_size=BATCH_SIZE):
+    """Send everything that is due. Returns (sent, failed)."""
+    sent = failed = 0
+    while True:
+        emails = claim_batch(batch_size)
+        if not emails:
+            return sent, failed
+        batch_sent, batch_failed = send_batch(emails)
+        sent += batch_sent
+        failed += batch_failed
+
+
+# -------------------------
+# In-process worker
+# -------------------------
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox')
+_pending = threading.Event()
+_timer = None
+_timer_due = None
+_timer_lock = threading.Lock()
+# Lower bound for a re-armed flush, so a message that keeps failing at once
+# cannot make the worker spin
+MIN_RETRY_SECONDS = 5
+
+
+def _schedule_flush():
+    # Coalesce bursts: one flush picks up everything queued before it starts
+    if not _pending.is_set():
+        _pending.set()
+        _executor.submit(_background_flush)
+
+
+def _background_flush():
+    _pending.clear()
+    try:
+        flush()
+        delay = next_due_in()
+        if delay is not None:
+            _arm_timer(delay)
+    except Exception:
+        logger.exception("Flushing the email outbox failed")
+        _arm_timer(RETRY_BASE_SECONDS)
+    finally:
+        connection.close()
+
+
+def _arm_timer(delay):
+    """Flush again in `delay` seconds, unless a flush is already due sooner."""
+    global _timer, _timer_due
+    delay = max(delay, MIN_RETRY_SECONDS)
+    due = time.monotonic() + delay
+    with _timer_lock:
+        if _timer is not None and _timer.is_alive():
+            if _timer_due <= due:
+                return
+            _timer.cancel()
+        _timer = threading.Timer(delay, _schedule_flush)
+        _timer.daemon = True
+        _timer_due = due
+        _timer.start()
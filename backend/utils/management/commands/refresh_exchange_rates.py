@@ -0,0 +1,21 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import currency
+from utils.http import UpstreamError
+
+
+class Command(BaseCommand):
+    help = "Snapshot the latest exchange rates into CurrencyRate. Run it from a scheduler, e.g. every few hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', help="Currency to fetch the table in (default: EXCHANGE_RATE_BASE_CURRENCY).")
+
+    def handle(self, *args, **options):
+        try:
+            count = currency.refresh_rates(options['base'])
+        except UpstreamError as e:
+            raise CommandError(f"Exchange rate API error: {e.payload}")
+        except requests.RequestException as e:
+            raise CommandError(f"Failed to connect to exchange rate service: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} exchange rate(s)."))
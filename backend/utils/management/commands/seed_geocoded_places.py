@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from destinations.models import CountryOverview, ItineraryDay, TravelDeal
+from utils import geocoding
+from utils.models import GeocodedPlace
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode every deal city, itinerary location and capital that is not in the "
+        "GeocodedPlace table yet, so weather lookups never wait on the geocoding API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=geocoding.MAX_WORKERS * 4)
+
+    def handle(self, *args, **options):
+        sources = [
+            TravelDeal.objects.exclude(city__isnull=True).values_list('city', 'country__code'),
+            ItineraryDay.objects.values_list('location', 'travel_deal__country__code'),
+            CountryOverview.objects.values_list('capital', 'country__code'),
+        ]
+        known = set(GeocodedPlace.objects.values_list('query', flat=True))
+        places = {}
+        for source in sources:
+            for name, country_code in source.distinct():
+                query = geocoding.normalize(name)
+                if query and query not in known and query not in places:
+                    places[query] = (name.strip(), (country_code or '').upper() or None)
+
+        places = list(places.values())
+        stored = failed = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(places), batch_size):
+            results = geocoding.geocode_many(places[start:start + batch_size])
+            for query, result in results.items():
+                if isinstance(result, tuple):
+                    stored += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"Could not geocode {query!r}: {getattr(result, 'payload', result)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} place(s), {failed} could not be geocoded."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils import mail
+
+
+class Command(BaseCommand):
+    help = "Send queued outbound email in batches. Run it from a scheduler, or keep it running with --loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=5.0)
+        parser.add_argument('--batch-size', type=int, default=mail.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = mail.flush(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed."))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, unique=True)),
+                ('rate', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['currency'],
+            },
+        ),
+    ]
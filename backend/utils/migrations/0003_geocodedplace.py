@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0002_currencyrate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedPlace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=200, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('country_code', models.CharField(blank=True, max_length=2)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('source', models.CharField(choices=[('api', 'Geocoding API'), ('manual', 'Manual')], default='api', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['query'],
+            },
+        ),
+    ]
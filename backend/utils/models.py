@@ -1,3 +1,83 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboundEmail(models.Model):
+    """
+    Persistent outbox: views queue mail here (see utils.mail.queue_mail) and a
+    worker sends it, so SMTP latency and outages never reach the request.
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class CurrencyRate(models.Model):
+    """
+    Snapshot of one exchange rate against the base currency it was fetched in
+    (which is itself stored with rate 1), refreshed by the
+    refresh_exchange_rates command. See utils.currency.
+    """
+    currency = models.CharField(max_length=3, unique=True)  # ISO code, e.g. "NPR"
+    rate = models.DecimalField(max_digits=24, decimal_places=12)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['currency']
+
+    def __str__(self):
+        return f"{self.currency} {self.rate}"
+
+
+class GeocodedPlace(models.Model):
+    """
+    Coordinates of a place name, looked up once from the geocoding API (or
+    entered by hand) and reused forever. See utils.geocoding.
+    """
+    SOURCE_CHOICES = [
+        ("api", "Geocoding API"),
+        ("manual", "Manual"),
+    ]
+
+    query = models.CharField(max_length=200, unique=True)  # normalized name, see geocoding.normalize
+    name = models.CharField(max_length=200)
+    country_code = models.CharField(max_length=2, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default="api")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['query']
+
+    def __str__(self):
+        return f"{self.name} ({self.latitude}, {self.longitude})"
@@ -0,0 +1,46 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from destinations.models import FAQ, Country, CountryOverview, TravelDeal
+
+from . import knowledge
+
+
+# -------------------------
+# Chatbot knowledge index
+# -------------------------
+@receiver(pre_save, sender=FAQ)
+@receiver(pre_save, sender=CountryOverview)
+@receiver(pre_save, sender=TravelDeal)
+@receiver(pre_save, sender=Country)
+def remember_indexed_values(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        return
+    fields = knowledge.INDEXED_FIELDS[sender]
+    if update_fields is not None and not set(fields) & {sender._meta.get_field(f).attname for f in update_fields}:
+        # e.g. save(update_fields=['rating_avg', ...])
+        instance._knowledge_changed = False
+        return
+    stored = sender._default_manager.filter(pk=instance.pk).values(*fields).first()
+    instance._knowledge_changed = stored is None or any(
+        stored[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=FAQ)
+@receiver(post_save, sender=CountryOverview)
+@receiver(post_save, sender=TravelDeal)
+@receiver(post_save, sender=Country)
+def invalidate_chatbot_knowledge(sender, instance, created, **kwargs):
+    # Saves that leave every indexed field as it was (pricing, ratings,
+    # images) keep the index and the cached answers
+    if created or getattr(instance, '_knowledge_changed', True):
+        knowledge.bump_version()
+
+
+@receiver(post_delete, sender=FAQ)
+@receiver(post_delete, sender=CountryOverview)
+@receiver(post_delete, sender=TravelDeal)
+@receiver(post_delete, sender=Country)
+def invalidate_chatbot_knowledge_on_delete(sender, **kwargs):
+    knowledge.bump_version()
@@ -0,0 +1,65 @@
+"""
+Unique slugs for models with a `slug` field.
+
+unique_slug() reads every existing slug that starts with the base slug in one
+query and picks the next free `-N` suffix in memory, so allocating a slug
+costs one query however many similar titles exist. Two concurrent saves can
+still pick the same slug; save_with_unique_slug() then retries the insert
+with a fresh suffix.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+MAX_ATTEMPTS = 5
+
+
+def unique_slug(model, value, field='slug', exclude_pk=None):
+    """A slug for `value` not yet used in `model.<field>`."""
+    max_length = model._meta.get_field(field).max_length
+    base = slugify(value)[:max_length].strip('-') or model._meta.model_name
+
+    existing = model._default_manager.filter(**{f'{field}__startswith': base})
+    if exclude_pk is not None:
+        existing = existing.exclude(pk=exclude_pk)
+    taken = set(existing.values_list(field, flat=True))
+    if base not in taken:
+        return base
+
+    suffix = re.compile(rf'^{re.escape(base)}-(\d+)$')
+    used = [int(match.group(1)) for match in map(suffix.match, taken) if match]
+    n = max(used, default=0) + 1
+    slug = f"{base}-{n}"
+    if len(slug) > max_length:
+        # Make room for the suffix and start over from the shorter base
+        return unique_slug(model, base[:max_length - len(str(n)) - 1], field, exclude_pk)
+    return slug
+
+
+def save_with_unique_slug(instance, value, save, *args, field='slug', **kwargs):
+    """
+    Call `save(*args, **kwargs)` (the model's own super().save), first
+    allocating a slug from `value` if the instance has none (and adding it
+    to `update_fields` when those are given). A slug taken by a concurrent
+    save is replaced and the save retried.
+    """
+    if getattr(instance, field):
+        return save(*args, **kwargs)
+
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and field not in update_fields:
+        kwargs['update_fields'] = [*update_fields, field]
+
+    model = type(instance)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        slug = unique_slug(model, value, field, exclude_pk=instance.pk)
+        setattr(instance, field, slug)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            setattr(instance, field, '')
+            collided = model._default_manager.filter(**{field: slug}).exclude(pk=instance.pk).exists()
+            if not collided or attempt == MAX_ATTEMPTS:
+                raise
@@ -1,3 +1,426 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blogs.models import Category
+from destinations.models import FAQ, Country, Region, TravelDeal
+from destinations.serializers import TravelDealSerializer
+
+from . import chatbot, currency, geocoding, http, knowledge, mail
+from .slugs import unique_slug
+from .models import CurrencyRate, GeocodedPlace, OutboundEmail
+
+
+class OutboxRetryTests(TestCase):
+    def tearDown(self):
+        if mail._timer is not None:
+            mail._timer.cancel()
+
+    def test_failed_message_is_due_after_backoff(self):
+        mail.queue_mail("Hi", "Body", "from@example.com", ["to@example.com"])
+        with mock.patch.object(mail.EmailMessage, "send", side_effect=OSError("SMTP down")):
+            self.assertEqual(mail.flush(), (0, 1))
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ("queued", 1))
+        self.assertAlmostEqual(mail.next_due_in(), mail.RETRY_BASE_SECONDS, delta=5)
+
+    def test_nothing_waiting(self):
+        OutboundEmail.objects.create(subject="Hi", body="", from_email="a@example.com", to=[], status="sent")
+        self.assertIsNone(mail.next_due_in())
+
+    def test_timer_keeps_the_earliest_flush(self):
+        mail._arm_timer(600)
+        first = mail._timer
+        mail._arm_timer(3600)
+        self.assertIs(mail._timer, first)
+        mail._arm_timer(60)
+        self.assertIsNot(mail._timer, first)
+        self.assertTrue(first.finished.is_set())
+
+
+class QuestionCacheKeyTests(SimpleTestCase):
+    def test_different_questions_stay_apart(self):
+        questions = ["When to visit Nepal?", "Where to visit Nepal", "How to visit Nepal", "visa for india",
+                     "visa from india"]
+        self.assertEqual(len({knowledge.normalize_question(q) for q in questions}), len(questions))
+
+    def test_case_spacing_and_punctuation_are_ignored(self):
+        self.assertEqual(
+            knowledge.normalize_question("  When to visit   NEPAL?! "),
+            knowledge.normalize_question("when to visit nepal"),
+        )
+
+
+class KnowledgeVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name="Asia")
+        cls.country = Country.objects.create(region=region, name="Nepal")
+        cls.deal = TravelDeal.objects.create(country=cls.country, title="Everest Base Camp", days=14, price="1299€")
+
+    def assertBumps(self, bumped, change):
+        before = knowledge.get_version()
+        change()
+        self.assertEqual(knowledge.get_version() != before, bumped)
+
+    def test_indexed_changes_bump_the_version(self):
+        def retitle():
+            self.deal.title = "Everest Base Camp Trek"
+            self.deal.save()
+
+        self.assertBumps(True, retitle)
+        self.assertBumps(True, lambda: FAQ.objects.create(country=self.country, question="Visa?", answer="On arrival"))
+        self.assertBumps(True, lambda: TravelDeal.objects.get(pk=self.deal.pk).delete())
+
+    def test_other_changes_keep_the_version(self):
+        def rate():
+            self.deal.rating_avg = 4.5
+            self.deal.save()
+
+        self.assertBumps(False, rate)
+        self.assertBumps(False, lambda: self.deal.save(update_fields=["rating_count"]))
+        self.assertBumps(False, lambda: Country.objects.get(pk=self.country.pk).save())
+
+    def test_stale_index_is_rebuilt_off_the_request_path(self):
+        old = knowledge.get_index()
+        knowledge.bump_version()
+        knowledge._checked_at = 0.0
+        with mock.patch.object(knowledge, "_schedule_rebuild") as schedule:
+            self.assertIs(knowledge.get_index(), old)
+        schedule.assert_called_once_with(knowledge.get_version())
+
+
+class UniqueSlugTests(TestCase):
+    def test_collisions_get_the_next_free_suffix(self):
+        slugs = [Category.objects.create(name=name).slug for name in ("Food & Drink", "Food drink", "Food, drink!")]
+        self.assertEqual(slugs, ["food-drink", "food-drink-1", "food-drink-2"])
+
+        Category.objects.filter(slug="food-drink-1").delete()
+        Category.objects.create(name="food-drink-7")
+        self.assertEqual(Category.objects.create(name="Food drink").slug, "food-drink-8")
+
+    def test_long_values_are_truncated_to_fit_the_suffix(self):
+        max_length = Category._meta.get_field("slug").max_length
+        name = "a" * 80
+        slugs = [Category.objects.create(name=name + "!" * i).slug for i in range(3)]
+        # No room for "-1" after the full-length slug: the base is shortened
+        self.assertEqual(slugs, ["a" * max_length, "a" * (max_length - 2), "a" * (max_length - 2) + "-1"])
+        self.assertEqual(unique_slug(Category, name, exclude_pk=Category.objects.get(slug=slugs[0]).pk), slugs[0])
+
+    def test_slug_allocated_on_update_is_saved(self):
+        category = Category.objects.create(name="Hiking")
+        Category.objects.filter(pk=category.pk).update(slug="")
+        category.slug = ""
+        category.name = "Trekking"
+        category.save(update_fields=["name"])
+        self.assertEqual(Category.objects.values_list("slug", flat=True).get(pk=category.pk), "trekking")
+
+
+class StubResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"response": "".join(chunk.get("response", "") for chunk in self.chunks), "eval_count": 2}
+
+    def iter_lines(self):
+        for chunk in self.chunks:
+            yield json.dumps(chunk).encode()
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession:
+    """Stands in for Ollama: each post() returns (or raises) the next outcome."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@override_settings(CHATBOT_MAX_CONCURRENT=1)
+class ChatbotViewTests(TestCase):
+    CHUNKS = [{"response": "Go in "}, {"response": "October."}, {"done": True, "eval_count": 2}]
+
+    def setUp(self):
+        cache.clear()
+        # A fresh semaphore sized from the overridden setting
+        patcher = mock.patch.object(chatbot, "_semaphore", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stub(self, *outcomes):
+        session = StubSession(*outcomes)
+        patcher = mock.patch.object(chatbot.http, "get_session", return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return session
+
+    def ask(self, message="When should I visit Nepal?", stream=False):
+        return self.client.post(reverse("travel-chatbot"), {"message": message, "stream": stream},
+                                content_type="application/json")
+
+    def lines(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def disconnect(self, response):
+        # What the WSGI server does when the client goes away; like the test
+        # client, keep the test's database connection open meanwhile
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+    def assertSlotFree(self):
+        chatbot.acquire_slot().release()
+
+    def test_busy_when_every_slot_is_taken(self):
+        session = self.stub(StubResponse(self.CHUNKS))
+        slot = chatbot.acquire_slot()
+        with self.assertLogs("utils.chatbot", "WARNING"):
+            response = self.ask()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(chatbot.RETRY_AFTER))
+        self.assertEqual(session.calls, 0)
+
+        slot.release()
+        self.assertEqual(self.ask().data["response"], "Go in October.")
+        self.assertSlotFree()
+
+    def test_stream_relays_chunks_in_order(self):
+        upstream = StubResponse(self.CHUNKS)
+        self.stub(upstream)
+        response = self.ask(stream=True)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = self.lines(response)
+        self.assertEqual(lines[:2], [{"response": "Go in "}, {"response": "October."}])
+        self.assertTrue(lines[2]["done"])
+        self.assertEqual(lines[2]["metrics"]["tokens"], 2)
+        self.assertTrue(upstream.closed)
+        self.assertSlotFree()
+
+    def test_client_disconnect_releases_the_slot(self):
+        upstream = StubResponse(self.CHUNKS)
+        self.stub(upstream)
+        response = self.ask(stream=True)
+        self.assertEqual(json.loads(next(iter(response.streaming_content))), {"response": "Go in "})
+        self.disconnect(response)
+        self.assertTrue(upstream.closed)
+        self.assertSlotFree()
+
+        # Gone before the first chunk was requested
+        self.stub(StubResponse(self.CHUNKS))
+        self.disconnect(self.ask("Visa for Nepal?", stream=True))
+        self.assertSlotFree()
+
+    def test_upstream_failure_releases_the_slot(self):
+        self.stub(requests.ConnectionError("refused"), StubResponse([{"response": "Go"}, {"error": "model unloaded"}]))
+        self.assertEqual(self.lines(self.ask(stream=True)), [{"error": "refused"}])
+        self.assertSlotFree()
+
+        self.assertEqual(self.lines(self.ask(stream=True)), [{"response": "Go"}, {"error": "model unloaded"}])
+        self.assertSlotFree()
+
+        self.stub(requests.ConnectionError("refused"))
+        self.assertEqual(self.ask().status_code, 500)
+        self.assertSlotFree()
+
+    def test_repeated_question_is_answered_from_the_cache(self):
+        session = self.stub(StubResponse(self.CHUNKS))
+        self.assertEqual(self.lines(self.ask(stream=True))[-1]["done"], True)
+
+        response = self.ask("  when should I visit NEPAL ")
+        self.assertEqual(response.data, {"response": "Go in October.", "metrics": {"cached": True}})
+        self.assertEqual(self.lines(self.ask(stream=True)),
+                         [{"response": "Go in October."}, {"done": True, "metrics": {"cached": True}}])
+        self.assertEqual(session.calls, 1)
+
+        # Answered from the cache even with every slot taken
+        slot = chatbot.acquire_slot()
+        self.assertEqual(self.ask().status_code, 200)
+        slot.release()
+
+
+class CachedEndpointTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.error = None
+
+    def fetch(self, name):
+        self.calls += 1
+        self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return f"{name} v{self.calls}"
+
+    def test_concurrent_misses_share_one_upstream_call(self):
+        endpoint = http.CachedEndpoint(self.fetch, ttl=60)
+        self.gate.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(endpoint.get("nepal"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.gate.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ["nepal v1"] * 8)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        endpoint = http.CachedEndpoint(self.fetch, ttl=0.05, stale_ttl=60)
+        self.assertEqual(endpoint.get("nepal"), "nepal v1")
+        time.sleep(0.1)
+
+        self.gate.clear()
+        self.assertEqual(endpoint.get("nepal"), "nepal v1")
+        refresh = endpoint._inflight[("nepal",)]
+        self.assertEqual(endpoint.get("nepal"), "nepal v1")
+        self.gate.set()
+        refresh.result(5)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(endpoint.get("nepal"), "nepal v2")
+
+    def test_upstream_errors_are_not_cached(self):
+        endpoint = http.CachedEndpoint(self.fetch, ttl=60)
+        self.error = http.UpstreamError(503, {"error": "down"})
+        with self.assertRaises(http.UpstreamError):
+            endpoint.get("nepal")
+
+        self.error = None
+        self.assertEqual(endpoint.get("nepal"), "nepal v2")
+        self.assertEqual(endpoint.get("nepal"), "nepal v2")
+        self.assertEqual(self.calls, 2)
+
+
+class CurrencyTests(TestCase):
+    RATES = {"EUR": "1", "USD": "1.1", "GBP": "0.85"}
+
+    @classmethod
+    def setUpTestData(cls):
+        fetched_at = timezone.now()
+        CurrencyRate.objects.bulk_create(
+            CurrencyRate(currency=code, rate=Decimal(rate), fetched_at=fetched_at) for code, rate in cls.RATES.items()
+        )
+        country = Country.objects.create(region=Region.objects.create(name="Asia"), name="Nepal")
+        cls.deal = TravelDeal.objects.create(country=country, title="Everest Base Camp", days=14, price="1000€")
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.multiple(currency, _matrix=None, _checked_at=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_conversion_and_cross_rates(self):
+        self.assertEqual(currency.convert(100, "EUR", "USD"), Decimal("110.00"))
+        self.assertEqual(currency.convert(Decimal("110"), "USD", "EUR"), Decimal("100.00"))
+        # Neither side is the base: 100 * 0.85 / 1.1 = 77.2727...
+        self.assertEqual(currency.convert(100, "USD", "GBP"), Decimal("77.27"))
+        # Half a cent rounds up: 0.15 * 1.1 = 0.165
+        self.assertEqual(currency.convert("0.15", "EUR", "USD"), Decimal("0.17"))
+        self.assertEqual(currency.convert(12.5, "NPR", "NPR"), Decimal("12.50"))
+        with self.assertRaises(currency.UnknownCurrency):
+            currency.convert(100, "EUR", "NPR")
+
+    def local_price(self, code):
+        request = RequestFactory().get("/", {"currency": code})
+        return TravelDealSerializer(self.deal, context={"request": request}).data["local_price"]
+
+    def test_local_price(self):
+        self.assertEqual(self.local_price("usd"), {"currency": "USD", "price": "1100.00", "discounted_price": None})
+        self.assertIsNone(self.local_price("NPR"))
+
+    def test_new_version_reloads_the_matrix(self):
+        self.assertEqual(currency.convert(100, "EUR", "USD"), Decimal("110.00"))
+        with mock.patch.object(currency, "fetch_exchange_rates", return_value={"EUR": 1, "USD": 1.2, "NPR": 150}):
+            self.assertEqual(currency.refresh_rates("EUR"), 3)
+
+        # Still within the check interval: the loaded table is kept
+        self.assertEqual(currency.convert(100, "EUR", "USD"), Decimal("110.00"))
+        currency._checked_at -= currency.VERSION_CHECK_INTERVAL
+        self.assertEqual(currency.convert(100, "EUR", "USD"), Decimal("120.00"))
+        self.assertEqual(currency.convert(1, "EUR", "NPR"), Decimal("150.00"))
+        with self.assertRaises(currency.UnknownCurrency):
+            currency.convert(1, "EUR", "GBP")
+
+
+class StubGeoResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class GeocodingCacheTests(TestCase):
+    PLACES = {
+        "kathmandu": [{"lat": 27.7172, "lon": 85.324, "country": "NP"}],
+        "pokhara": [{"lat": 28.2096, "lon": 83.9856, "country": "NP"}],
+    }
+
+    def setUp(self):
+        geocoding._memo.clear()
+        self.addCleanup(geocoding._memo.clear)
+        self.down = set()
+        patcher = mock.patch.object(geocoding.http, "get", side_effect=self.api)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def api(self, url, params):
+        query = params["q"].lower()
+        if query in self.down:
+            raise requests.ConnectionError("unreachable")
+        if query in self.PLACES:
+            return StubGeoResponse(200, self.PLACES[query])
+        return StubGeoResponse(200, [])
+
+    def test_repeat_lookups_skip_the_api(self):
+        self.assertEqual(geocoding.resolve(["Kathmandu"]), {"Kathmandu": (27.7172, 85.324)})
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual(GeocodedPlace.objects.get().country_code, "NP")
+
+        self.assertEqual(geocoding.resolve([" kathmandu "]), {" kathmandu ": (27.7172, 85.324)})
+        # A process that has not seen it yet reads the stored row
+        geocoding._memo.clear()
+        self.assertEqual(geocoding.resolve(["KATHMANDU", "Pokhara"])["KATHMANDU"], (27.7172, 85.324))
+        self.assertEqual([call.kwargs["params"]["q"] for call in self.get.call_args_list], ["Kathmandu", "Pokhara"])
+
+    def test_failed_lookups_are_not_cached(self):
+        self.down.add("pokhara")
+        results = geocoding.resolve(["Atlantis", "Pokhara"])
+        self.assertIsInstance(results["Atlantis"], http.UpstreamError)
+        self.assertIsInstance(results["Pokhara"], requests.ConnectionError)
+        self.assertFalse(GeocodedPlace.objects.exists())
+
+        self.down.clear()
+        self.assertEqual(geocoding.resolve(["Pokhara"]), {"Pokhara": (28.2096, 83.9856)})
+        self.assertIsInstance(geocoding.resolve(["Atlantis"])["Atlantis"], http.UpstreamError)
+        self.assertEqual(self.get.call_count, 4)
@@ -1,4 +1,7 @@
+import logging
+
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from rest_framework.views import APIView
@@ -6,10 +9,35 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.conf import settings
 
+from destinations.models import ItineraryDay, TravelDeal
+
+from . import geocoding, http
+from .currency import UnknownCurrency, fetch_exchange_rates, get_matrix
+from .http import CachedEndpoint, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
 
 # ----------------------------------------
 # Visa Checker API
 # ----------------------------------------
+def fetch_visa_requirements(nationality, destination):
+    api_url = f"{settings.VISA_API_URL}/visa/{nationality}/{destination}"
+    external_response = http.get(api_url)
+    logger.debug("Visa API %s returned %s", api_url, external_response.status_code)
+
+    if external_response.status_code == 200:
+        return external_response.json()
+    raise UpstreamError(external_response.status_code, external_response.text)
+
+
+# Visa rules change rarely
+visa_requirements = CachedEndpoint(fetch_visa_requirements, ttl=DAY, stale_ttl=7 * DAY)
+
+
 class VisaCheckerAPI(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -27,30 +55,21 @@ class VisaCheckerAPI(APIView):
         nationality = nationality.upper()
         destination = destination.upper()
 
-        api_url = f"https://rough-sun-2523.fly.dev/visa/{nationality}/{destination}"
-
         try:
-            external_response = requests.get(api_url, timeout=10)
-
-            # Log for debugging
-            print(f"[VisaChecker] URL: {api_url}")
-            print(f"[VisaChecker] Status: {external_response.status_code}")
-            print(f"[VisaChecker] Response: {external_response.text}")
-
-            if external_response.status_code == 200:
-                return Response(external_response.json())
+            return Response(visa_requirements.get(nationality, destination))
 
+        except UpstreamError as e:
             return Response(
                 {
                     "error": "Could not fetch visa info from external API.",
-                    "status_code": external_response.status_code,
-                    "message": external_response.text,
+                    "status_code": e.status_code,
+                    "message": e.payload,
                 },
-                status=external_response.status_code
+                status=e.status_code
             )
 
         except requests.RequestException as e:
-            print(f"[VisaChecker] Exception: {str(e)}")
+            logger.warning("Visa API request for %s -> %s failed: %s", nationality, destination, e)
             return Response(
                 {"error": "Failed to connect to Visa API."},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
@@ -60,60 +79,120 @@ class VisaCheckerAPI(APIView):
 # ----------------------------------------
 # Weather Forecast API
 # ----------------------------------------
+def fetch_forecast(lat, lon):
+    forecast_url = f"{settings.OPENWEATHER_API_URL}/data/2.5/forecast"
+    forecast_res = http.get(forecast_url, params={"lat": lat, "lon": lon, "appid": settings.OPENWEATHER_API_KEY})
+    if forecast_res.status_code != 200:
+        raise UpstreamError(forecast_res.status_code, "Could not fetch forecast data.")
+
+    forecast_data = forecast_res.json()
+    forecasts = []
+    for item in forecast_data.get('list', []):
+        forecasts.append({
+            "datetime": datetime.utcfromtimestamp(item['dt']).strftime('%Y-%m-%d %H:%M:%S'),
+            "temp": item['main']['temp'],
+            "temp_min": item['main']['temp_min'],
+            "temp_max": item['main']['temp_max'],
+            "description": item['weather'][0]['description'],
+            "humidity": item['main']['humidity'],
+            "wind_speed": item['wind']['speed'],
+            "clouds": item['clouds']['all']
+        })
+
+    return {
+        "city": forecast_data['city']['name'],
+        "country": forecast_data['city']['country'],
+        "forecasts": forecasts
+    }
+
+
+# Forecasts are refreshed upstream every few hours
+forecasts = CachedEndpoint(fetch_forecast, ttl=3 * HOUR, stale_ttl=3 * HOUR)
+MAX_FORECAST_CITIES = 20
+_forecast_pool = ThreadPoolExecutor(max_workers=geocoding.MAX_WORKERS, thread_name_prefix='forecast')
+
+
+def forecast_for(coordinates):
+    lat, lon = coordinates
+    # ~1 km grid, so nearby cities share entries
+    return forecasts.get(round(lat, 2), round(lon, 2))
+
+
 class WeatherForecastAPI(APIView):
+    """
+    Forecast for one `city`, or for several at once given a list of `cities`
+    or a `deal_slug` (every itinerary location of that deal). Cities are
+    geocoded and forecast concurrently.
+    """
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
         city = request.data.get('city')
-        if not city:
+        cities = request.data.get('cities')
+        deal_slug = request.data.get('deal_slug')
+
+        if deal_slug:
+            if not TravelDeal.objects.filter(slug=deal_slug).exists():
+                return Response({"error": "Deal not found."}, status=status.HTTP_404_NOT_FOUND)
+            locations = ItineraryDay.objects.filter(travel_deal__slug=deal_slug).values_list('location', flat=True)
+            cities = list(locations.order_by('day_number'))
+        elif cities is not None:
+            if not isinstance(cities, list) or not all(isinstance(name, str) for name in cities):
+                return Response({"error": "cities must be a list of names."}, status=status.HTTP_400_BAD_REQUEST)
+        elif not city:
             return Response({"error": "City is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         api_key = settings.OPENWEATHER_API_KEY
         if not api_key:
             return Response({"error": "API key not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Get city coordinates
-        geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&appid={api_key}"
+        if cities is None:
+            return self.single(city)
+
+        # One entry per distinct place, in itinerary order
+        names = []
+        seen = set()
+        for name in cities:
+            query = geocoding.normalize(name)
+            if query and query not in seen:
+                seen.add(query)
+                names.append(name.strip())
+        if len(names) > MAX_FORECAST_CITIES:
+            return Response(
+                {"error": f"At most {MAX_FORECAST_CITIES} cities per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        try:
-            geo_res = requests.get(geo_url, timeout=5)
-            geo_data_list = geo_res.json()
-            if geo_res.status_code != 200 or not geo_data_list:
-                return Response({"error": "Could not get coordinates for the city."}, status=status.HTTP_400_BAD_REQUEST)
-
-            geo_data = geo_data_list[0]
-            lat = geo_data['lat']
-            lon = geo_data['lon']
-        except requests.RequestException:
+        coordinates = geocoding.resolve(names)
+        futures = {
+            name: _forecast_pool.submit(forecast_for, coordinates[name])
+            for name in names if isinstance(coordinates[name], tuple)
+        }
+        results = []
+        for name in names:
+            try:
+                if name not in futures:
+                    raise coordinates[name]
+                results.append({"location": name, **futures[name].result()})
+            except UpstreamError as e:
+                results.append({"location": name, "error": e.payload})
+            except requests.RequestException:
+                results.append({"location": name, "error": "Failed to connect to weather service."})
+        return Response({"results": results})
+
+    def single(self, city):
+        # Get city coordinates
+        coordinates = geocoding.resolve([city])[city]
+        if isinstance(coordinates, UpstreamError):
+            return Response({"error": coordinates.payload}, status=coordinates.status_code)
+        if isinstance(coordinates, requests.RequestException):
             return Response({"error": "Failed to connect to geocoding service."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         # Get weather forecast using coordinates
-        forecast_url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}"
-
         try:
-            forecast_res = requests.get(forecast_url, timeout=5)
-            if forecast_res.status_code == 200:
-                forecast_data = forecast_res.json()
-                forecasts = []
-                for item in forecast_data.get('list', []):
-                    forecasts.append({
-                        "datetime": datetime.utcfromtimestamp(item['dt']).strftime('%Y-%m-%d %H:%M:%S'),
-                        "temp": item['main']['temp'],
-                        "temp_min": item['main']['temp_min'],
-                        "temp_max": item['main']['temp_max'],
-                        "description": item['weather'][0]['description'],
-                        "humidity": item['main']['humidity'],
-                        "wind_speed": item['wind']['speed'],
-                        "clouds": item['clouds']['all']
-                    })
-
-                return Response({
-                    "city": forecast_data['city']['name'],
-                    "country": forecast_data['city']['country'],
-                    "forecasts": forecasts
-                })
-
-            return Response({"error": "Could not fetch forecast data."}, status=forecast_res.status_code)
+            return Response(forecast_for(coordinates))
+        except UpstreamError as e:
+            return Response({"error": e.payload}, status=e.status_code)
         except requests.RequestException:
             return Response({"error": "Failed to connect to forecast service."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
@@ -121,6 +200,12 @@ class WeatherForecastAPI(APIView):
 # ----------------------------------------
 # Currency Exchange Rate API
 # ----------------------------------------
+# Rates are published daily. Only used for currencies missing from the local
+# table (see utils.currency and the refresh_exchange_rates command).
+exchange_rates = CachedEndpoint(fetch_exchange_rates, ttl=6 * HOUR, stale_ttl=DAY)
+MAX_BULK_CONVERSIONS = 500
+
+
 class ExchangeRateAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -137,16 +222,17 @@ class ExchangeRateAPIView(APIView):
         except (ValueError, TypeError):
             return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            url = f'https://v6.exchangerate-api.com/v6/{settings.EXCHANGE_RATE_API_KEY}/latest/{from_currency.upper()}'
-            response = requests.get(url)
-            data = response.json()
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
 
-            if response.status_code != 200 or data.get('result') != 'success':
-                return Response({'error': data.get('error-type', 'API request failed')}, status=status.HTTP_400_BAD_REQUEST)
+        matrix = get_matrix()
+        if from_currency in matrix and to_currency in matrix:
+            rate = float(matrix.rate(from_currency, to_currency))
+            return Response({'result': round(amount * rate, 4), 'rate': rate})
 
-            rates = data.get('conversion_rates', {})
-            rate = rates.get(to_currency.upper())
+        try:
+            rates = exchange_rates.get(from_currency)
+            rate = rates.get(to_currency)
 
             if rate is None:
                 return Response({'error': f'Currency {to_currency} not supported'}, status=status.HTTP_400_BAD_REQUEST)
@@ -154,8 +240,61 @@ class ExchangeRateAPIView(APIView):
             result = round(amount * rate, 4)
             return Response({'result': result, 'rate': rate})
 
+        except UpstreamError as e:
+            return Response({'error': e.payload}, status=e.status_code)
+
         except requests.RequestException:
             return Response({'error': 'Failed to connect to exchange rate service.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BulkExchangeRateAPIView(APIView):
+    """
+    Convert many amounts in one call, from the local rate table only.
+    Items take the same fields as ExchangeRateAPIView; top-level
+    from_currency/to_currency apply to items that leave them out.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        conversions = request.data.get('conversions')
+        if not isinstance(conversions, list) or not conversions:
+            return Response({'error': 'conversions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(conversions) > MAX_BULK_CONVERSIONS:
+            return Response(
+                {'error': f'At most {MAX_BULK_CONVERSIONS} conversions per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        matrix = get_matrix()
+        if not matrix:
+            return Response({'error': 'Exchange rates are not available yet.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        default_from = request.data.get('from_currency')
+        default_to = request.data.get('to_currency')
+        results = []
+        for item in conversions:
+            if not isinstance(item, dict):
+                item = {'amount': item}
+            amount = item.get('amount')
+            from_currency = item.get('from_currency') or default_from
+            to_currency = item.get('to_currency') or default_to
+
+            if amount is None or not from_currency or not to_currency:
+                results.append({'error': 'Missing required fields'})
+                continue
+            try:
+                amount = float(amount)
+            except (ValueError, TypeError):
+                results.append({'error': 'Invalid amount'})
+                continue
+            try:
+                rate = float(matrix.rate(str(from_currency).upper(), str(to_currency).upper()))
+            except UnknownCurrency as e:
+                results.append({'error': f'Currency {e.args[0]} not supported'})
+                continue
+            results.append({'result': round(amount * rate, 4), 'rate': rate})
+
+        return Response({'results': results})